@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+anti_join.py — anti-/semi-join engine for exclusion scenarios (FAERS + JADER)
+
+Drops (anti) or keeps (semi) the rows of a table whose case ID is in a key set:
+  - KeySet: exclusion keys normalized once per distinct value (optional NFKC + strip, as JADER
+    識別番号 needs); integer keys are held as a sorted int64 array, or as a packed bitmap when
+    their range is dense; non-integer keys fall back to a hashed pd.Index
+  - membership is one vectorized test per chunk (bitmap lookup / searchsorted / get_indexer)
+  - chunked inputs (MSIP tables, CSV readers) are filtered chunk by chunk; survivors are
+    collected and concatenated once at the end (no repeated rbind)
+The key list is any ID table: AF in INDICATION (Scenario 3), history-based exclusions, etc.
+
+Usage (CLI):
+  python raw_code/analysis/anti_join.py --in F_PLID.csv --exclude F_AF_INDI.csv --out F_PLID_EXCL.csv
+  python raw_code/analysis/anti_join.py --in J_PLID.csv --exclude J_AF_INDI.csv --key 識別番号 --nfkc \
+    [--mode semi] [--chunksize 1000000] --out J_PLID_EXCL.csv
+"""
+import argparse
+import unicodedata
+
+import numpy as np
+import pandas as pd
+
+from counts2x2 import ID_CANDIDATES, resolve_col, unique_int
+
+# bitmap when the key range is at most this many bits per key (and <= MAX_BITMAP_BITS overall)
+BITMAP_DENSITY = 64
+MAX_BITMAP_BITS = 1 << 31
+
+
+def _normalize_unique(uniques, nfkc):
+    """Distinct key values -> object Series; NFKC + strip (empty -> None) when nfkc."""
+    u = pd.Series(np.asarray(uniques, dtype=object), dtype=object)
+    if nfkc:
+        u = u.map(lambda x: unicodedata.normalize("NFKC", str(x).strip()))
+        u = u.where(u != "", None)
+    return u
+
+
+def _as_int(u: pd.Series):
+    """Distinct keys -> int64 array and a mask of integer keys (text must round-trip: "007" is not 7)."""
+    num = pd.to_numeric(u, errors="coerce")
+    ok = num.notna().to_numpy() & (num.fillna(0) % 1 == 0).to_numpy()
+    ints = num.where(ok, 0).to_numpy(dtype=np.int64)
+    is_text = u.map(lambda x: isinstance(x, str)).to_numpy(dtype=bool)
+    if is_text.any():
+        ok[is_text] &= pd.Series(ints[is_text]).astype(str).to_numpy() == u[is_text].str.strip().to_numpy()
+    return ints, ok
+
+
+class KeySet:
+    """Exclusion keys with a vectorized membership test (sorted int64 / packed bitmap / hashed index)."""
+
+    def __init__(self, values, nfkc=False):
+        self.nfkc = nfkc
+        u = _normalize_unique(pd.unique(pd.Series(values).dropna()), nfkc).dropna()
+        ints, ok = _as_int(u)
+        self.kind = "int" if ok.all() else "hash"
+        self.bitmap = None
+        if self.kind == "hash":
+            self.index = pd.Index(pd.unique(u.astype(str)))
+            return
+        self.keys = unique_int(ints)
+        self.lo = int(self.keys[0]) if len(self.keys) else 0
+        self.span = int(self.keys[-1]) - self.lo + 1 if len(self.keys) else 0
+        if 0 < self.span <= min(BITMAP_DENSITY * len(self.keys), MAX_BITMAP_BITS):
+            bits = np.zeros(self.span, dtype=bool)
+            bits[self.keys - self.lo] = True
+            self.bitmap = np.packbits(bits, bitorder="little")
+
+    @classmethod
+    def from_chunks(cls, chunks, key_col=None, nfkc=False):
+        """Key set from an iterable of DataFrames (key column resolved per ID_CANDIDATES if not given)."""
+        parts = [df[key_col or resolve_col(df, *ID_CANDIDATES)].dropna().drop_duplicates() for df in chunks]
+        return cls(pd.concat(parts, ignore_index=True) if parts else pd.Series([], dtype=object), nfkc)
+
+    def __len__(self):
+        return len(self.index) if self.kind == "hash" else len(self.keys)
+
+    def _contains_int(self, ints):
+        if len(self.keys) == 0:
+            return np.zeros(len(ints), dtype=bool)
+        if self.bitmap is not None:
+            off = ints - self.lo
+            ok = (off >= 0) & (off < self.span)
+            off = np.where(ok, off, 0)
+            return ok & ((self.bitmap[off >> 3] >> (off & 7).astype(np.uint8)) & 1).astype(bool)
+        pos = np.minimum(np.searchsorted(self.keys, ints), len(self.keys) - 1)
+        return self.keys[pos] == ints
+
+    def contains(self, values) -> np.ndarray:
+        """Boolean mask: value (normalized like the keys) is in the set; missing values -> False."""
+        values = pd.Series(values)
+        if self.kind == "int" and pd.api.types.is_integer_dtype(values.dtype) and values.dtype != object \
+                and (isinstance(values.dtype, np.dtype) or not values.hasnans):
+            # numpy ints (or nullable Int64 without NA); masked ids with NA take the factorize path
+            return self._contains_int(values.to_numpy(dtype=np.int64))
+        codes, uniques = pd.factorize(values, use_na_sentinel=True)
+        u = _normalize_unique(uniques, self.nfkc)
+        present = u.notna().to_numpy()
+        if self.kind == "hash":
+            hit = (self.index.get_indexer(u.astype(str)) >= 0) & present
+        else:
+            ints, ok = _as_int(u)
+            hit = ok & present & self._contains_int(ints)
+        return np.append(hit, False)[np.where(codes < 0, len(uniques), codes)]
+
+
+def filter_frames(frames, keyset: KeySet, key_col=None, mode="anti", columns=None, log=None):
+    """
+    Filter DataFrame chunks against keyset (anti: drop members, semi: keep members).
+    Survivors are concatenated once; returns (DataFrame, {"rows", "kept", "removed"}).
+    columns: header of the empty result when there are no chunks.
+    """
+    if mode not in ("anti", "semi"):
+        raise ValueError(f"mode must be 'anti' or 'semi', got {mode!r}")
+    kept = []
+    stats = {"rows": 0, "kept": 0, "removed": 0}
+    for df in frames:
+        hit = keyset.contains(df[key_col or resolve_col(df, *ID_CANDIDATES)])
+        keep = ~hit if mode == "anti" else hit
+        kept.append(df.loc[keep])
+        stats["rows"] += len(df)
+        stats["kept"] += int(keep.sum())
+        if log:
+            log(f"rows {stats['rows'] - len(df):,}:{stats['rows']:,} -> kept={int(keep.sum()):,}, "
+                f"removed={len(df) - int(keep.sum()):,}")
+    stats["removed"] = stats["rows"] - stats["kept"]
+    if not kept:
+        return pd.DataFrame(columns=columns), stats
+    return pd.concat(kept, ignore_index=True), stats
+
+
+def msip_nrows(table) -> int:
+    for attr in ("nrow", "nrows"):
+        if hasattr(table, attr):
+            n = getattr(table, attr)
+            return n() if callable(n) else int(n)
+    return len(table.to_pandas())
+
+
+def iter_msip(table, columns=None, chunksize=1_000_000):
+    """MSIP DataFrame -> pandas chunks (row slices; whole table when slicing is unsupported)."""
+    if not hasattr(table, "__getitem__"):
+        df = table.to_pandas()
+        yield df if columns is None else df[list(columns)]
+        return
+    cols = list(columns) if columns is not None else list(table.colnames)
+    n = msip_nrows(table)
+    for start in range(0, n, chunksize):
+        yield table[start:min(start + chunksize, n), cols].to_pandas()
+
+
+def exclude_msip(table, table1, key_col=None, nfkc=False, mode="anti", chunksize=1_000_000, tag="AF-EXCL"):
+    """MSIP node body: rows of `table` whose key is (not) in `table1` -> pandas DataFrame."""
+    keyset = KeySet.from_chunks(iter_msip(table1, [key_col] if key_col else None, chunksize), key_col, nfkc)
+    print(f"[{tag}] unique ref IDs: {len(keyset):,} ({keyset.kind}{', bitmap' if keyset.bitmap is not None else ''})")
+    cols = list(table.colnames) if hasattr(table, "colnames") else None
+    out, stats = filter_frames(iter_msip(table, cols, chunksize), keyset, key_col, mode, columns=cols,
+                               log=lambda m: print(f"[{tag}] {m}"))
+    print(f"[{tag}] total: {stats['rows']:,} -> kept={stats['kept']:,} (removed={stats['removed']:,})")
+    return out
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--in", dest="inp", required=True, help="Table CSV to filter (PLID)")
+    ap.add_argument("--exclude", required=True, nargs="+", help="Key list CSV(s) (e.g. AF-in-INDICATION ids)")
+    ap.add_argument("--key", default=None, help="Key column (default: primaryid / 識別番号 / j_id ...)")
+    ap.add_argument("--nfkc", action="store_true", help="NFKC + strip keys (JADER 識別番号)")
+    ap.add_argument("--mode", choices=["anti", "semi"], default="anti")
+    ap.add_argument("--chunksize", type=int, default=1_000_000)
+    ap.add_argument("--out", required=True)
+    args = ap.parse_args()
+
+    keyset = KeySet.from_chunks((pd.read_csv(p, dtype=str) for p in args.exclude), args.key, args.nfkc)
+    reader = pd.read_csv(args.inp, chunksize=args.chunksize, dtype={args.key: str} if args.key else None)
+    out, stats = filter_frames(reader, keyset, args.key, args.mode)
+    out.to_csv(args.out, index=False)
+    print(f"[WRITE] {args.out} ({stats['rows']:,} -> {stats['kept']:,} rows, {len(keyset):,} keys)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,352 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+case_table.py — compact integer-coded case table (canonical intermediate for FAERS + JADER)
+
+One row per case, all columns fixed-width integers:
+  case_key        int32  surrogate key = row position (source id, as str, in ids.npy)
+  db              int8   code into dictionaries["db"]        (FAERS, JADER, ...)
+  sex, ageband    int8   codes into the strata_cube levels + "NA"
+  age             int16  years (-1 = missing)
+  number_of_drug  int16  (-1 = missing)
+  flags           uint32 bitmask: FLAG_EVENT (AF) | exposure bit of drug k (1 << (k + 1), k < 31)
+plus the exposure pairs (case_key int32, drug int16, role uint8) for any number of drugs.
+The role is a bitmask over the drug roles reported for that case x drug (FAERS role_cod
+PS/SS/C/I; JADER 医薬品の関与 / 被疑薬等区分: 被疑薬 -> PS, 併用薬 -> C, 相互作用 -> I; 0 = not
+given), so "PS only", "PS+SS" or "any role" exposure is a bitwise filter over the same pairs
+(counts_by_role gives the 2x2 counts of every role definition from one pass).
+
+Dictionaries (db, drug, sex, ageband) are append-only and persisted once in dictionaries.json,
+so codes stay stable when a DB is added or rebuilt; every later join/group-by is on ints.
+
+Store layout (<dir>/): cases.npz, ids.npy, dictionaries.json
+
+Usage (CLI):
+  python raw_code/analysis/case_table.py build --store data/case_table --db FAERS \
+    --plid F_PLID.csv --oab F_OAB_STD.csv --af F_AF.csv
+  python raw_code/analysis/case_table.py counts --store data/case_table --db FAERS --out counts2x2.csv
+  python raw_code/analysis/case_table.py counts --store data/case_table --db FAERS --by-role --out counts_by_role.csv
+"""
+import argparse
+import json
+import os
+import unicodedata
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from counts2x2 import ID_CANDIDATES, resolve_col, index_ids
+from strata_cube import DEFAULT_DIMENSIONS, NA_LEVEL, encode_dimension
+
+CASES_FILE = "cases.npz"
+IDS_FILE = "ids.npy"
+DICT_FILE = "dictionaries.json"
+
+FLAG_EVENT = np.uint32(1)
+MAX_FLAG_DRUGS = 31
+
+ROLE_BITS = {"PS": 1, "SS": 2, "C": 4, "I": 8}
+ROLE_ALIASES = {"被疑薬": "PS", "併用薬": "C", "相互作用": "I"}
+ROLE_CANDIDATES = ("role_cod", "role_code", "drug_role", "医薬品の関与", "被疑薬等区分")
+# role definitions: None = any role (including pairs without role information)
+ROLE_DEFINITIONS = {"any": None, "ps": ("PS",), "ps_ss": ("PS", "SS")}
+
+CASE_COLUMNS = {
+    "db": np.int8, "sex": np.int8, "ageband": np.int8,
+    "age": np.int16, "number_of_drug": np.int16, "flags": np.uint32,
+}
+
+_DIMS = {d["name"]: d for d in DEFAULT_DIMENSIONS}
+_AGE_CANDIDATES = _DIMS["ageband"]["column"]
+_NDRUG_CANDIDATES = _DIMS["poly5"]["column"]
+
+
+def drug_flag(code):
+    """Exposure bit of drug code k (0 when k is past the bitmask width; use the pair arrays)."""
+    code = np.asarray(code, dtype=np.int64)
+    return np.where(code < MAX_FLAG_DRUGS, np.left_shift(1, np.minimum(code, MAX_FLAG_DRUGS - 1) + 1), 0) \
+        .astype(np.uint32)
+
+
+def role_mask(values):
+    """Role labels (PS/SS/C/I, JADER 被疑薬/併用薬/相互作用) -> uint8 bits; evaluated on distinct values."""
+    codes, uniques = pd.factorize(pd.Series(values), use_na_sentinel=True)
+    labels = pd.Series(uniques, dtype=object).map(
+        lambda v: unicodedata.normalize("NFKC", str(v)).strip().upper())
+    bits = labels.map(lambda v: ROLE_BITS.get(ROLE_ALIASES.get(v, v), 0)).to_numpy(dtype=np.uint8)
+    return np.append(bits, np.uint8(0))[np.where(codes < 0, len(uniques), codes)]
+
+
+def role_filter(definition):
+    """ROLE_DEFINITIONS name or iterable of role labels -> uint8 mask (None = no filter)."""
+    roles = ROLE_DEFINITIONS[definition] if isinstance(definition, str) else definition
+    if roles is None:
+        return None
+    return np.uint8(np.bitwise_or.reduce([ROLE_BITS[ROLE_ALIASES.get(r, r)] for r in roles]))
+
+
+def oab_roles(oab: pd.DataFrame):
+    """Role bits per OAB_STD row (0 when the table has no role column)."""
+    role_col = next((c for c in ROLE_CANDIDATES if c in oab.columns), None)
+    return role_mask(oab[role_col]) if role_col else np.zeros(len(oab), dtype=np.uint8)
+
+
+def exposure_pairs(case_code, drug_code, roles, n_drugs):
+    """Rows (case, drug, role bits; -1 = unmapped) -> distinct (exp_case, exp_drug, exp_role ORed per pair)."""
+    ok = (case_code >= 0) & (drug_code >= 0)
+    stride = max(n_drugs, 1)
+    pair = case_code[ok] * stride + drug_code[ok]
+    order = np.argsort(pair, kind="stable")
+    pair, roles = pair[order], roles[ok][order]
+    if len(pair) == 0:
+        return pair, pair, np.zeros(0, dtype=np.uint8)
+    starts = np.flatnonzero(np.r_[True, pair[1:] != pair[:-1]])
+    return pair[starts] // stride, pair[starts] % stride, np.bitwise_or.reduceat(roles, starts)
+
+
+def empty_dictionaries():
+    return {
+        "db": [], "drug": [],
+        "sex": _DIMS["sex"]["levels"] + [NA_LEVEL],
+        "ageband": _DIMS["ageband"]["levels"] + [NA_LEVEL],
+    }
+
+
+def extend_dictionary(levels, values):
+    """Codes of values against an append-only level list; unseen values are appended (list updated)."""
+    idx = pd.Index(levels, dtype=object)
+    vals = pd.Series(values)
+    new = pd.unique(vals[(idx.get_indexer(vals) < 0) & vals.notna().to_numpy()])
+    levels.extend(new.tolist())
+    return pd.Index(levels, dtype=object).get_indexer(vals).astype(np.int64)
+
+
+def _small_int(values, dtype):
+    num = pd.to_numeric(pd.Series(values), errors="coerce")
+    hi = np.iinfo(dtype).max
+    return num.where((num >= 0) & (num <= hi)).round().fillna(-1).to_numpy().astype(dtype)
+
+
+def encode_cases(plid: pd.DataFrame, oab: pd.DataFrame, af: pd.DataFrame, db: str, dicts):
+    """
+    PLID / OAB_STD / AF of one DB -> (case arrays, exposure arrays, source ids); dicts extended
+    in place. Cases are the distinct PLID ids (first row wins). When OAB_STD carries a role
+    column (ROLE_CANDIDATES) the roles of all rows of a case x drug are ORed into exp_role.
+    """
+    id_col = resolve_col(plid, *ID_CANDIDATES)
+    cases = plid.dropna(subset=[id_col]).drop_duplicates(subset=[id_col])
+    ids = cases[id_col].to_numpy()
+    n = len(ids)
+
+    arrays = {"db": np.full(n, extend_dictionary(dicts["db"], [db])[0], dtype=np.int8)}
+    for name in ("sex", "ageband"):
+        spec = _DIMS[name]
+        arrays[name] = encode_dimension(cases[resolve_col(cases, *spec["column"])].to_numpy(), spec)
+    age_col = next((c for c in _AGE_CANDIDATES if c in cases.columns), None)
+    arrays["age"] = _small_int(cases[age_col], np.int16) if age_col else np.full(n, -1, np.int16)
+    nd_col = next((c for c in _NDRUG_CANDIDATES if c in cases.columns), None)
+    arrays["number_of_drug"] = _small_int(cases[nd_col], np.int16) if nd_col else np.full(n, -1, np.int16)
+
+    case_code = index_ids(ids, oab[resolve_col(oab, *ID_CANDIDATES)])
+    drug_code = extend_dictionary(dicts["drug"], oab[resolve_col(oab, "drug_of_interest")])
+    exp_case, exp_drug, exp_role = exposure_pairs(case_code, drug_code, oab_roles(oab), len(dicts["drug"]))
+
+    flags = np.zeros(n, dtype=np.uint32)
+    ev = index_ids(ids, af[resolve_col(af, *ID_CANDIDATES)].dropna())
+    flags[ev[ev >= 0]] |= FLAG_EVENT
+    np.bitwise_or.at(flags, exp_case, drug_flag(exp_drug))
+    arrays["flags"] = flags
+    return arrays, {"exp_case": exp_case, "exp_drug": exp_drug, "exp_role": exp_role}, ids
+
+
+def empty_store():
+    return {
+        "cases": {k: np.zeros(0, dtype=t) for k, t in CASE_COLUMNS.items()},
+        "exposure": {"exp_case": np.zeros(0, dtype=np.int32), "exp_drug": np.zeros(0, dtype=np.int16),
+                     "exp_role": np.zeros(0, dtype=np.uint8)},
+        "ids": np.zeros(0, dtype=str),
+        "dicts": empty_dictionaries(),
+    }
+
+
+def load_store(store_dir):
+    store_dir = Path(store_dir)
+    if not (store_dir / CASES_FILE).exists():
+        return empty_store()
+    with np.load(store_dir / CASES_FILE) as z:
+        cases = {k: z[k] for k in CASE_COLUMNS}
+        exposure = {k: z[k] for k in ("exp_case", "exp_drug")}
+        # stores written before roles were tracked: no role information
+        exposure["exp_role"] = z["exp_role"] if "exp_role" in z.files else \
+            np.zeros(len(exposure["exp_case"]), dtype=np.uint8)
+    return {
+        "cases": cases, "exposure": exposure,
+        "ids": source_ids(np.load(store_dir / IDS_FILE, allow_pickle=False)),
+        "dicts": json.loads((store_dir / DICT_FILE).read_text(encoding="utf-8")),
+    }
+
+
+def save_store(store, store_dir):
+    """Arrays -> cases.npz / ids.npy, dictionaries -> dictionaries.json (temp file + replace)."""
+    store_dir = Path(store_dir)
+    store_dir.mkdir(parents=True, exist_ok=True)
+    tmp = store_dir / (CASES_FILE + ".tmp.npz")
+    np.savez(tmp, **store["cases"], **store["exposure"])
+    os.replace(tmp, store_dir / CASES_FILE)
+    tmp_ids = store_dir / (IDS_FILE + ".tmp.npy")
+    np.save(tmp_ids, store["ids"])
+    os.replace(tmp_ids, store_dir / IDS_FILE)
+    tmp_meta = store_dir / (DICT_FILE + ".tmp")
+    tmp_meta.write_text(json.dumps(store["dicts"], ensure_ascii=False, indent=1), encoding="utf-8")
+    os.replace(tmp_meta, store_dir / DICT_FILE)
+
+
+def put_db(store, plid, oab, af, db):
+    """Replace (or add) one DB's cases in the store; other DBs keep their keys' relative order."""
+    dicts = store["dicts"]
+    arrays, exposure, ids = encode_cases(plid, oab, af, db, dicts)
+    code = dicts["db"].index(db)
+
+    keep = store["cases"]["db"] != code
+    remap = np.cumsum(keep) - 1
+    old_pairs = keep[store["exposure"]["exp_case"]]
+    offset = int(keep.sum())
+    if offset + len(ids) > np.iinfo(np.int32).max:
+        raise OverflowError("case_key exceeds int32")
+
+    store["cases"] = {k: np.concatenate([store["cases"][k][keep], arrays[k].astype(t)])
+                      for k, t in CASE_COLUMNS.items()}
+    store["exposure"] = {
+        "exp_case": np.concatenate([remap[store["exposure"]["exp_case"][old_pairs]],
+                                    exposure["exp_case"] + offset]).astype(np.int32),
+        "exp_drug": np.concatenate([store["exposure"]["exp_drug"][old_pairs],
+                                    exposure["exp_drug"]]).astype(np.int16),
+        "exp_role": np.concatenate([store["exposure"]["exp_role"][old_pairs],
+                                    exposure["exp_role"]]).astype(np.uint8),
+    }
+    store["ids"] = np.concatenate([store["ids"][keep].astype(str), source_ids(ids)])
+    return store
+
+
+def source_ids(values):
+    """Source ids (any dtype) -> str array; integral numbers become integer strings (123.0 -> "123")."""
+    txt = pd.Series(values).astype("string").str.strip()
+    return txt.str.replace(r"^(-?\d+)\.0+$", r"\1", regex=True).fillna("").to_numpy(dtype=str)
+
+
+def case_keys(store, ids, db=None):
+    """
+    Source ids (primaryid / j_id, any dtype) -> int32 case_key (-1 if absent).
+    db: look the ids up within that DB only (FAERS and JADER ids may coincide); without db the
+    stored ids must be unique across DBs.
+    """
+    keys = source_ids(ids)
+    if db is None:
+        if not pd.Index(store["ids"]).is_unique:
+            raise ValueError("Source ids repeat across DBs; pass db= to case_keys")
+        return index_ids(store["ids"], keys).astype(np.int32)
+    in_db = np.flatnonzero(store["cases"]["db"] == store["dicts"]["db"].index(db))
+    pos = index_ids(store["ids"][in_db], keys)
+    return np.where(pos >= 0, in_db[np.maximum(pos, 0)], -1).astype(np.int32)
+
+
+def case_frame(store, decode=False) -> pd.DataFrame:
+    """Case table as a DataFrame of int columns (decode=True: categorical labels instead of codes)."""
+    cases = store["cases"]
+    df = pd.DataFrame({"case_key": np.arange(len(cases["db"]), dtype=np.int32), **cases})
+    if decode:
+        dicts = store["dicts"]
+        for name in ("db", "sex", "ageband"):
+            df[name] = pd.Categorical.from_codes(df[name].astype(np.int64), categories=dicts[name])
+        df.insert(1, "source_id", store["ids"])
+    return df
+
+
+def _selection(store, db):
+    cases = store["cases"]
+    in_db = np.ones(len(cases["db"]), dtype=bool) if db is None else \
+        cases["db"] == store["dicts"]["db"].index(db)
+    return in_db, (cases["flags"] & FLAG_EVENT).astype(bool) & in_db
+
+
+def counts_by_role(store, definitions=ROLE_DEFINITIONS, db=None) -> pd.DataFrame:
+    """
+    Per-drug 2x2 counts for every role definition in one pass over the exposure pairs
+    (long table: role + the counts2x2.build_counts2x2 columns). N and n+1 are the DB's cases.
+    """
+    exp = store["exposure"]
+    labels = np.asarray(store["dicts"]["drug"], dtype=object)
+    in_db, is_event = _selection(store, db)
+    sel = in_db[exp["exp_case"]]
+    drug = exp["exp_drug"][sel].astype(np.int64)
+    role = exp["exp_role"][sel]
+    event = is_event[exp["exp_case"][sel]]
+
+    names = list(definitions)
+    masks = [role_filter(definitions[n]) for n in names]
+    hits = np.stack([np.ones(len(drug), dtype=bool) if m is None else (role & m) != 0 for m in masks]) \
+        if names else np.zeros((0, len(drug)), dtype=bool)
+    k, pos = np.nonzero(hits)
+    cell = k * len(labels) + drug[pos]
+    size = len(names) * len(labels)
+    n1plus = np.bincount(cell, minlength=size)
+    n11 = np.bincount(cell, weights=event[pos], minlength=size).astype(np.int64)
+    n_cases, nplus1 = int(in_db.sum()), int(is_event.sum())
+    return pd.DataFrame({
+        "role": np.repeat(names, len(labels)),
+        "drug_of_interest": np.tile(labels, len(names)),
+        "n11": n11, "n12": n1plus - n11, "n21": nplus1 - n11, "n22": n_cases - n1plus - nplus1 + n11,
+        "N": n_cases, "n1plus": n1plus, "nplus1": nplus1,
+    })
+
+
+def counts2x2(store, db=None, roles="any") -> pd.DataFrame:
+    """Per-drug 2x2 counts straight from the coded store (same columns as counts2x2.build_counts2x2)."""
+    return counts_by_role(store, {"_": roles}, db=db).drop(columns="role")
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    b = sub.add_parser("build", help="Encode one DB's PLID/OAB_STD/AF into the store (replaces that DB)")
+    b.add_argument("--store", required=True)
+    b.add_argument("--db", required=True)
+    b.add_argument("--plid", required=True)
+    b.add_argument("--oab", required=True)
+    b.add_argument("--af", required=True)
+    c = sub.add_parser("counts", help="2x2 counts from the store")
+    c.add_argument("--store", required=True)
+    c.add_argument("--db", default=None)
+    c.add_argument("--roles", default="any",
+                   help="Role definition (any, ps, ps_ss) or comma-separated roles (e.g. PS,SS)")
+    c.add_argument("--by-role", action="store_true", help="Long table over all ROLE_DEFINITIONS")
+    c.add_argument("--out", required=True)
+    e = sub.add_parser("export", help="Decoded case table CSV")
+    e.add_argument("--store", required=True)
+    e.add_argument("--out", required=True)
+    args = ap.parse_args()
+
+    if args.cmd == "build":
+        store = put_db(load_store(args.store), pd.read_csv(args.plid), pd.read_csv(args.oab),
+                       pd.read_csv(args.af), args.db)
+        save_store(store, args.store)
+        n = len(store["ids"])
+        mb = sum(a.nbytes for a in store["cases"].values()) / 1e6
+        print(f"[WRITE] {args.store} ({n:,} cases, {len(store['dicts']['drug'])} drugs, {mb:.1f} MB case columns)")
+    elif args.cmd == "counts":
+        store = load_store(args.store)
+        if args.by_role:
+            out = counts_by_role(store, db=args.db)
+        else:
+            roles = args.roles if args.roles in ROLE_DEFINITIONS else args.roles.split(",")
+            out = counts2x2(store, db=args.db, roles=roles)
+        out.to_csv(args.out, index=False)
+        print(f"[WRITE] {args.out}")
+    else:
+        case_frame(load_store(args.store), decode=True).to_csv(args.out, index=False)
+        print(f"[WRITE] {args.out}")
+
+
+if __name__ == "__main__":
+    main()
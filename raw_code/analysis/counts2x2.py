@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+counts2x2.py — per-drug 2x2 counts from PLID / OAB_STD / AF in one vectorized pass
+(Python counterpart of msip/faers/f20_counts2x2.md and msip/jader/j20_counts2x2.md)
+
+Definitions (case level; each case counted once per drug):
+  N      = distinct cases in PLID
+  nplus1 = PLID cases with the event (AF)
+  n1plus = PLID cases exposed to the drug
+  n11 = exposed & AF, n12 = exposed & no AF, n21 = AF & not exposed, n22 = N - n11 - n12 - n21
+
+Case IDs are integer-coded once against the PLID universe; counts are bincounts
+over the coded (case, drug) pairs, so no per-drug joins or group-bys are needed.
+
+Dual interface:
+  (A) MSIP node: globals table (PLID), table1 (OAB_STD: id, drug_of_interest), table2 (AF: id)
+      -> result = counts DataFrame
+  (B) CLI:
+      python raw_code/analysis/counts2x2.py --plid PLID.csv --oab OAB_STD.csv --af AF.csv \
+        --out data/derived/counts2x2.csv [--metrics-out data/derived/metrics.csv]
+"""
+import argparse
+import numpy as np
+import pandas as pd
+
+try:
+    from msi.common.dataframe import pandas_to_dataframe as to_msi_df
+except Exception:
+    to_msi_df = None
+
+ID_CANDIDATES = ("primaryid", "j_id", "識別番号")
+
+
+def resolve_col(df, *names):
+    for n in names:
+        if n in df.columns:
+            return n
+    raise KeyError(f"None of the columns {names} exist. Available: {list(df.columns)}")
+
+
+def index_ids(universe, values):
+    """
+    Integer-code `values` against `universe` (unique keys) -> int64 codes, -1 if absent.
+    Hash-based (pd.Index.get_indexer), so it works for int and string IDs alike.
+    """
+    return pd.Index(universe).get_indexer(pd.Index(values)).astype(np.int64)
+
+
+def unique_int(a):
+    """Sorted distinct values of an int array (sort + diff; cheaper than np.unique on large inputs)."""
+    a = np.sort(np.asarray(a, dtype=np.int64), kind="stable")
+    if len(a) == 0:
+        return a
+    return a[np.concatenate(([True], a[1:] != a[:-1]))]
+
+
+def build_counts2x2(case_ids, drug_case_ids, drug_tokens, event_case_ids, drugs=None):
+    """
+    Per-drug 2x2 counts.
+
+    case_ids       : PLID case IDs (duplicates allowed; defines N)
+    drug_case_ids  : case ID per exposure row (aligned with drug_tokens)
+    drug_tokens    : standardized drug token per exposure row
+    event_case_ids : case IDs with the event (AF)
+    drugs          : optional fixed drug order (drugs with no exposure get zero rows)
+
+    Exposure/event rows whose case is not in the PLID are ignored.
+    Returns DataFrame [drug_of_interest, n11, n12, n21, n22, N, n1plus, nplus1].
+    """
+    universe = pd.unique(pd.Series(case_ids).dropna())
+    n_cases = len(universe)
+
+    is_event = np.zeros(n_cases, dtype=bool)
+    ev = index_ids(universe, pd.Series(event_case_ids).dropna())
+    is_event[ev[ev >= 0]] = True
+    nplus1 = int(is_event.sum())
+
+    case_code = index_ids(universe, drug_case_ids)
+    tok = pd.Series(drug_tokens)
+    if drugs is None:
+        drug_code, labels = pd.factorize(tok)
+    else:
+        labels = pd.Index(drugs)
+        drug_code = labels.get_indexer(tok)
+    n_drugs = len(labels)
+
+    ok = (case_code >= 0) & (drug_code >= 0)
+    # distinct (case, drug) pairs -> each case counted once per drug
+    pair = unique_int(case_code[ok] * n_drugs + drug_code[ok])
+    pair_case = pair // n_drugs
+    pair_drug = pair % n_drugs
+
+    n1plus = np.bincount(pair_drug, minlength=n_drugs).astype(np.int64)
+    n11 = np.bincount(pair_drug, weights=is_event[pair_case], minlength=n_drugs).astype(np.int64)
+    n12 = n1plus - n11
+    n21 = nplus1 - n11
+    n22 = n_cases - n11 - n12 - n21
+
+    return pd.DataFrame({
+        "drug_of_interest": np.asarray(labels),
+        "n11": n11, "n12": n12, "n21": n21, "n22": n22,
+        "N": n_cases, "n1plus": n1plus, "nplus1": nplus1,
+    })
+
+
+def counts_from_frames(plid: pd.DataFrame, oab: pd.DataFrame, af: pd.DataFrame, drugs=None) -> pd.DataFrame:
+    """DataFrame front-end: resolves the ID column (primaryid / j_id / 識別番号) per table."""
+    return build_counts2x2(
+        plid[resolve_col(plid, *ID_CANDIDATES)],
+        oab[resolve_col(oab, *ID_CANDIDATES)],
+        oab[resolve_col(oab, "drug_of_interest")],
+        af[resolve_col(af, *ID_CANDIDATES)],
+        drugs=drugs,
+    )
+
+
+def to_msip_inputs(counts: pd.DataFrame):
+    """Counts -> (table, table1) pandas frames in the layout 01_disproportionality expects."""
+    table = counts[["N", "nplus1"]].iloc[:1].reset_index(drop=True)
+    table1 = counts[["drug_of_interest", "n1plus", "n11"]].reset_index(drop=True)
+    return table, table1
+
+
+def main():
+    g = globals()
+    if "table" in g and "table1" in g and "table2" in g:
+        out_df = counts_from_frames(g["table"].to_pandas(), g["table1"].to_pandas(), g["table2"].to_pandas())
+        g["result"] = to_msi_df(out_df) if to_msi_df else out_df
+        return
+
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--plid", required=True, help="PLID CSV (primaryid / j_id / 識別番号)")
+    ap.add_argument("--oab",  required=True, help="OAB_STD CSV [id, drug_of_interest]")
+    ap.add_argument("--af",   required=True, help="AF case list CSV [id]")
+    ap.add_argument("--out",  required=True, help="Counts CSV")
+    ap.add_argument("--metrics-out", default=None, help="Optional metrics CSV (disproportionality.py)")
+    args = ap.parse_args()
+
+    plid = pd.read_csv(args.plid)
+    oab = pd.read_csv(args.oab)
+    af = pd.read_csv(args.af)
+    counts = counts_from_frames(plid, oab, af)
+    counts.to_csv(args.out, index=False)
+    print(f"[WRITE] {args.out} ({len(counts):,} drugs, N={int(counts['N'].iat[0]) if len(counts) else 0:,})")
+
+    if args.metrics_out:
+        from disproportionality import compute_metrics
+        table, table1 = to_msip_inputs(counts)
+        compute_metrics(table, table1).to_csv(args.metrics_out, index=False)
+        print(f"[WRITE] {args.metrics_out}")
+
+
+if __name__ == "__main__":
+    main()
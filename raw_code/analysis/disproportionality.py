@@ -0,0 +1,217 @@
+# -*- coding: utf-8 -*-
+"""
+disproportionality.py — shared ROR/PRR/chi2/IC engine + declarative signal criteria
+
+The metric columns are computed once per count table (compute_metric_arrays) and
+any number of signal definitions are then evaluated against those cached arrays
+(evaluate_criteria / evaluate_scenarios). 01_disproportionality.py (main analysis)
+and 04a_conventional_prr_filter.py (Scenario 1) are thin MSIP nodes over this module.
+
+Criteria format (list of dicts, evaluated in order):
+  {"name": "met_PRR", "min_n11": 3, "rules": [("chi2", ">", 4), ("PRR025", ">", 2)]}
+- rules are ANDed; each rule is (metric column, operator, threshold) or a callable
+  taking the metrics dict and returning a boolean mask (custom criteria).
+- operators: ">", ">=", "<", "<=", "==", "!=".
+
+Usage:
+  from disproportionality import compute_metrics, CONVENTIONAL_PRR_CRITERIA
+  out = compute_metrics(table, table1, criteria=CONVENTIONAL_PRR_CRITERIA)
+"""
+import operator
+
+import numpy as np
+import pandas as pd
+from signal_stats import fisher_exact_batch, bcpnn_ic
+
+# ---- Signal definitions ----
+MAIN_CRITERIA = [
+    {"name": "met_ROR", "min_n11": 3, "rules": [("p", "<", 0.05), ("ROR025", ">", 1)]},
+    {"name": "met_PRR", "min_n11": 3, "rules": [("chi2", ">", 4), ("PRR025", ">", 2)]},
+    {"name": "met_IC",  "min_n11": 3, "rules": [("IC025", ">", 0)]},
+]
+
+# Scenario 1 (conventional PRR): PRR025 > 1 instead of > 2
+CONVENTIONAL_PRR_CRITERIA = [
+    MAIN_CRITERIA[0],
+    {"name": "met_PRR", "min_n11": 3, "rules": [("chi2", ">", 4), ("PRR025", ">", 1)]},
+    MAIN_CRITERIA[2],
+]
+
+METRIC_COLUMNS = [
+    "n11", "n12", "n21", "n22",
+    "ROR", "ROR025", "ROR975",
+    "p", "log10_p", "p_value",
+    "PRR", "PRR025", "PRR975",
+    "chi2",
+    "IC", "IC025", "IC975",
+]
+
+_OPS = {
+    ">": operator.gt, ">=": operator.ge,
+    "<": operator.lt, "<=": operator.le,
+    "==": operator.eq, "!=": operator.ne,
+}
+
+
+def format_p(p):
+    """Display p-values as in the manuscript tables ("<0.001", "<0.05", "0.123")."""
+    p = np.asarray(p, dtype=float)
+    return np.where(p < 0.001, "<0.001",
+                    np.where(p < 0.05, "<0.05", np.char.mod("%.3f", p)))
+
+
+def compute_metric_arrays(n11, n1plus, nplus1, N, ic_decimals=3, sanitize_ror=True):
+    """
+    All disproportionality metrics for one count table, as a dict of numpy arrays.
+
+    n11/n1plus are per-row; nplus1 and N may be scalars (single event, as in the MSIP
+    `table` row) or per-row arrays (e.g. a drug x event screen).
+    PRR NaN/-inf -> 0 always; ROR likewise unless sanitize_ror=False (04a keeps NaN ROR).
+    """
+    n11 = np.asarray(n11)
+    n1plus = np.asarray(n1plus)
+    nplus1 = np.broadcast_to(np.asarray(nplus1), n11.shape)
+    N = np.broadcast_to(np.asarray(N), n11.shape)
+
+    n2plus = N - n1plus          # n2+
+    nplus2 = N - nplus1          # n+2
+    n12 = n1plus - n11
+    n21 = nplus1 - n11
+    n22 = nplus2 - n12
+
+    # Fisher's exact (two-sided), batched
+    p, log10_p = fisher_exact_batch(n11, n12, n21, n22)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        # ROR (odds ratio) with 95% CI (Woolf)
+        ROR = (n11 * n22) / (n12 * n21)
+        se_logROR = np.sqrt(1/n11 + 1/n12 + 1/n21 + 1/n22)
+        logROR = np.log(ROR)
+        ROR025 = np.exp(logROR - 1.96 * se_logROR)
+        ROR975 = np.exp(logROR + 1.96 * se_logROR)
+
+        # PRR with 95% CI
+        PRR = (n11 * n2plus) / (n1plus * n21)
+        logPRR = np.log(PRR)
+        se_logPRR = np.sqrt((1/n11) - (1/n1plus) + (1/n21) - (1/n2plus))
+        PRR025 = np.exp(logPRR - 1.96 * se_logPRR)
+        PRR975 = np.exp(logPRR + 1.96 * se_logPRR)
+
+        # Chi-square (expected counts)
+        n11EXP = (n1plus * nplus1) / N
+        n12EXP = (n1plus * nplus2) / N
+        n21EXP = (n2plus * nplus1) / N
+        n22EXP = (n2plus * nplus2) / N
+        chi2 = ((n11 - n11EXP)**2 / n11EXP) + ((n12 - n12EXP)**2 / n12EXP) \
+             + ((n21 - n21EXP)**2 / n21EXP) + ((n22 - n22EXP)**2 / n22EXP)
+
+    # NaN/Inf handling (same policy as the original nodes)
+    PRR, PRR025, PRR975 = _sanitize(PRR), _sanitize(PRR025), _sanitize(PRR975)
+
+    # BCPNN IC with 95% CI
+    IC, IC025, IC975 = bcpnn_ic(n11, n1plus, nplus1, N, decimals=ic_decimals)
+
+    metrics = {
+        "n11": n11, "n12": n12, "n21": n21, "n22": n22,
+        "ROR": ROR, "ROR025": ROR025, "ROR975": ROR975,
+        "p": p, "log10_p": log10_p, "p_value": format_p(p),
+        "PRR": PRR, "PRR025": PRR025, "PRR975": PRR975,
+        "chi2": chi2,
+        "IC": IC, "IC025": IC025, "IC975": IC975,
+    }
+    return sanitize_ror_metrics(metrics) if sanitize_ror else metrics
+
+
+def _sanitize(v):
+    return np.nan_to_num(v, nan=0, posinf=np.inf, neginf=0)
+
+
+def sanitize_ror_metrics(metrics):
+    """Copy of a metrics dict with ROR NaN/-inf -> 0 (the PRR policy); for arrays computed with sanitize_ror=False."""
+    return {**metrics, **{c: _sanitize(metrics[c]) for c in ("ROR", "ROR025", "ROR975")}}
+
+
+def ic_strength(IC025):
+    IC025 = np.asarray(IC025, dtype=float)
+    return np.select(
+        [IC025 <= 0, (IC025 > 0) & (IC025 < 1.5), (IC025 >= 1.5) & (IC025 < 3), IC025 >= 3],
+        ["none", "weak", "medium", "strong"],
+        default="none",
+    )
+
+
+def _criteria_masks(metrics, criteria, cache):
+    """Boolean mask per criterion; identical rules are evaluated once via `cache`."""
+    n11 = np.asarray(metrics["n11"])
+    masks = {}
+    for crit in criteria:
+        key = ("n11", ">=", crit.get("min_n11", 0))
+        if key not in cache:
+            cache[key] = n11 >= key[2]
+        mask = cache[key].copy()
+        for rule in crit["rules"]:
+            if callable(rule):
+                mask &= np.asarray(rule(metrics), dtype=bool)
+                continue
+            col, op, thr = rule
+            if (col, op, thr) not in cache:
+                vals = np.asarray(metrics[col], dtype=float)
+                with np.errstate(invalid="ignore"):
+                    cache[(col, op, thr)] = _OPS[op](vals, thr)
+            mask &= cache[(col, op, thr)]
+        masks[crit["name"]] = mask
+    return masks
+
+
+def evaluate_criteria(metrics, criteria=MAIN_CRITERIA):
+    """{criterion name: "Yes"/"No" array} for one list of criteria."""
+    masks = _criteria_masks(metrics, criteria, cache={})
+    return {name: np.where(m, "Yes", "No") for name, m in masks.items()}
+
+
+def evaluate_scenarios(metrics, scenarios, labels=None):
+    """
+    Evaluate several criteria lists against the same cached metrics in one pass.
+
+    scenarios: {scenario name: criteria list}
+    Returns a long DataFrame [drug_of_interest, scenario, <criterion>...].
+    """
+    n = len(np.asarray(metrics["n11"]))
+    labels = np.arange(n) if labels is None else np.asarray(labels)
+    cache = {}
+    frames = []
+    for scen, criteria in scenarios.items():
+        masks = _criteria_masks(metrics, criteria, cache)
+        part = pd.DataFrame({"drug_of_interest": labels, "scenario": scen})
+        for name, m in masks.items():
+            part[name] = np.where(m, "Yes", "No")
+        frames.append(part)
+    return pd.concat(frames, ignore_index=True)
+
+
+def metrics_frame(metrics, criteria=MAIN_CRITERIA, labels=None):
+    """Metrics dict -> DataFrame in the public column order (+ IC_strength and met_* flags)."""
+    out = pd.DataFrame({c: metrics[c] for c in METRIC_COLUMNS})
+    out["IC_strength"] = ic_strength(metrics["IC025"])
+    for name, flags in evaluate_criteria(metrics, criteria).items():
+        out[name] = flags
+    if labels is not None:
+        out.insert(0, "drug_of_interest", np.asarray(labels))
+    return out
+
+
+def compute_metrics(table, table1, criteria=MAIN_CRITERIA, sanitize_ror=True):
+    """
+    MSIP inputs -> metrics DataFrame.
+    - table  : one-row totals [N (n++), nplus1 (n+1)]
+    - table1 : per-DOI [label, n1plus, n11]
+    - sanitize_ror: see compute_metric_arrays
+    """
+    totals = table.to_pandas() if hasattr(table, "to_pandas") else table
+    detail = table1.to_pandas() if hasattr(table1, "to_pandas") else table1
+
+    N = totals.iat[0, 0]         # n++
+    nplus1 = totals.iat[0, 1]    # n+1
+    metrics = compute_metric_arrays(detail.iloc[:, 2].to_numpy(), detail.iloc[:, 1].to_numpy(),
+                                    nplus1, N, sanitize_ror=sanitize_ror)
+    return metrics_frame(metrics, criteria, labels=detail.iloc[:, 0])
@@ -0,0 +1,316 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+drug_standardizer.py — drug-name -> token standardization on distinct strings only
+
+- factorizes the input column, matches each distinct string once and broadcasts the token
+  codes back (DRUG has tens of millions of rows but few distinct prod_ai / 一般名 strings)
+- matching: NFKC + strip + lower, then substring search of all dictionary patterns at once
+  with one compiled automaton (pyahocorasick when installed, else a trie-shaped regex as a
+  prefilter plus a dict-trie walk on the strings it hits);
+  when several patterns occur in a string, the first one in dictionary order wins
+  (same rule as the former per-row loops over GENERIC_TOKENS / yure_dict)
+- dictionary: the built-in OAB entries (English generics + katakana) or an external
+  CSV/TSV [pattern, token] / JSON {pattern: token} of any size
+- raw -> token map persisted between runs (JSON, keyed by a dictionary fingerprint), so a
+  rerun only matches strings it has not seen before
+- optional fuzzy fallback (fuzzy=True) for strings with no substring hit, e.g. misspellings
+  ("mirabegon"): words and word pairs of all unmatched strings are deduplicated, shortlisted
+  against the dictionary through a character-trigram inverted index (one sparse product,
+  top-k by Dice), and only the shortlist is scored by edit distance (vectorized DP over all
+  candidate pairs at once); accepted when distance <= max(1, max_ratio * len(pattern))
+
+Usage:
+  from drug_standardizer import DrugStandardizer, load_dictionary
+  std = DrugStandardizer(load_dictionary("drug_dict.csv"), map_path="data/cache/drug_map.json", fuzzy=True)
+  drug["drug_of_interest"] = std.standardize(drug["prod_ai"])
+  std.save()
+"""
+import hashlib
+import json
+import os
+import re
+import unicodedata
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+try:
+    import ahocorasick
+except Exception:
+    ahocorasick = None
+
+OAB_GENERICS = [
+    "oxybutynin", "propiverine", "solifenacin", "imidafenacin",
+    "tolterodine", "fesoterodine", "mirabegron", "vibegron",
+]
+OAB_JP = {
+    "オキシブチニン": "oxybutynin",
+    "プロピベリン": "propiverine",
+    "ソリフェナシン": "solifenacin",
+    "イミダフェナシン": "imidafenacin",
+    "トルテロジン": "tolterodine",
+    "フェソテロジン": "fesoterodine",
+    "ミラベグロン": "mirabegron",
+    "ビベグロン": "vibegron",
+}
+
+
+def normalize_text(s) -> str:
+    if not isinstance(s, str):
+        s = "" if pd.isna(s) else str(s)
+    return unicodedata.normalize("NFKC", s).strip().lower()
+
+
+def default_dictionary():
+    """Built-in OAB entries: [(pattern, token)] in priority order."""
+    return [(t, t) for t in OAB_GENERICS] + list(OAB_JP.items())
+
+
+def load_dictionary(path, pattern_col=None, token_col=None):
+    """External dictionary -> [(pattern, token)]; CSV/TSV (first two columns by default) or JSON object."""
+    path = Path(path)
+    if path.suffix.lower() == ".json":
+        return [(str(k), str(v)) for k, v in json.loads(path.read_text(encoding="utf-8")).items()]
+    df = pd.read_csv(path, sep=None, engine="python", dtype=str, encoding="utf-8-sig")
+    p = pattern_col or df.columns[0]
+    t = token_col or df.columns[1]
+    df = df[df[p].notna() & df[t].notna()]
+    return list(zip(df[p], df[t]))
+
+
+_END = ""   # trie key marking "a pattern ends here" (value: pattern index)
+
+
+def build_trie(patterns):
+    root = {}
+    for i, pat in enumerate(patterns):
+        node = root
+        for ch in pat:
+            node = node.setdefault(ch, {})
+        node.setdefault(_END, i)
+    return root
+
+
+def trie_regex(node):
+    """Regex equivalent to the trie (shared prefixes factored out, so no per-pattern backtracking)."""
+    alts = [re.escape(ch) + trie_regex(child) for ch, child in sorted(node.items()) if ch != _END]
+    if not alts:
+        return ""
+    body = alts[0] if len(alts) == 1 else "(?:" + "|".join(alts) + ")"
+    if _END in node:
+        return "(?:" + body + ")?"
+    return body
+
+
+_WORD_RE = re.compile(r"[^\W\d_]+")     # letter runs (doses/codes are not names)
+
+
+def trigrams(s):
+    s = f"  {s} "
+    return [s[i:i + 3] for i in range(len(s) - 2)]
+
+
+def _encode(strings, fill):
+    """Distinct strings -> padded code-point matrix rows (encoded once), plus lengths."""
+    codes, uniq = pd.factorize(pd.Series(list(strings), dtype=object))
+    lens = np.fromiter((len(x) for x in uniq), dtype=np.int64, count=len(uniq))
+    mat = np.full((len(uniq), max(int(lens.max()) if len(lens) else 1, 1)), fill, dtype=np.uint32)
+    for i, x in enumerate(uniq):
+        mat[i, :len(x)] = [ord(c) for c in x]
+    return mat[codes], lens[codes]
+
+
+def levenshtein_pairs(a, b, chunk=200_000) -> np.ndarray:
+    """Edit distance for each pair (a[i], b[i]); one DP row per character of a, vectorized over pairs."""
+    n = len(a)
+    if n == 0:
+        return np.zeros(0, dtype=np.int64)
+    if n > chunk:
+        return np.concatenate([levenshtein_pairs(a[s:s + chunk], b[s:s + chunk], chunk)
+                               for s in range(0, n, chunk)])
+    A, la = _encode(a, 0)
+    B, lb = _encode(b, 0xFFFFFFFF)
+    cols = np.arange(B.shape[1] + 1, dtype=np.int64)
+    prev = np.broadcast_to(cols, (n, len(cols))).copy()
+    out = np.where(la == 0, lb, 0)
+    rows = np.arange(n)
+    for i in range(1, A.shape[1] + 1):
+        sub = prev[:, :-1] + (A[:, i - 1:i] != B)
+        cur = np.empty_like(prev)
+        cur[:, 0] = i
+        cur[:, 1:] = np.minimum(prev[:, 1:] + 1, sub)
+        # insertions: cur[j] = min_k<=j (cur[k] + j - k)
+        cur = np.minimum.accumulate(cur - cols, axis=1) + cols
+        done = la == i
+        out[done] = cur[rows[done], lb[done]]
+        prev = cur
+    return out
+
+
+class TrigramIndex:
+    """Character-trigram inverted index over dictionary patterns (sparse pattern x trigram matrix)."""
+
+    def __init__(self, patterns):
+        self.patterns = list(patterns)
+        grams = [trigrams(p) for p in self.patterns]
+        self.vocab = {}
+        rows, cols = [], []
+        for r, gs in enumerate(grams):
+            for g in set(gs):
+                rows.append(r)
+                cols.append(self.vocab.setdefault(g, len(self.vocab)))
+        self.matrix = sparse.csr_matrix((np.ones(len(rows), dtype=np.int32), (rows, cols)),
+                                        shape=(len(self.patterns), max(len(self.vocab), 1)))
+        self.sizes = np.asarray(self.matrix.sum(axis=1)).ravel()
+
+    def shortlist(self, queries, top_k=5, min_dice=0.4, chunk=20_000):
+        """(query idx, pattern idx, dice) for the top_k patterns per query sharing enough trigrams."""
+        out = [self._shortlist(queries[s:s + chunk], s, top_k, min_dice) for s in range(0, len(queries), chunk)]
+        if not out:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), np.zeros(0)
+        return tuple(np.concatenate(parts) for parts in zip(*out))
+
+    def _shortlist(self, queries, offset, top_k, min_dice):
+        rows, cols = [], []
+        q_sizes = np.empty(len(queries), dtype=np.int64)
+        for r, q in enumerate(queries):
+            grams = set(trigrams(q))
+            q_sizes[r] = len(grams)
+            for g in grams:
+                c = self.vocab.get(g)
+                if c is not None:
+                    rows.append(r)
+                    cols.append(c)
+        Q = sparse.csr_matrix((np.ones(len(rows), dtype=np.int32), (rows, cols)),
+                              shape=(len(queries), self.matrix.shape[1]))
+        shared = (Q @ self.matrix.T).tocoo()
+        qi, pi = shared.row.astype(np.int64), shared.col.astype(np.int64)
+        dice = 2.0 * shared.data / (q_sizes[qi] + self.sizes[pi])
+        ok = dice >= min_dice
+        qi, pi, dice = qi[ok], pi[ok], dice[ok]
+        order = np.lexsort((-dice, qi))
+        qi, pi, dice = qi[order], pi[order], dice[order]
+        start = np.r_[0, np.flatnonzero(qi[1:] != qi[:-1]) + 1] if len(qi) else np.zeros(0, dtype=np.int64)
+        rank = np.arange(len(qi)) - np.repeat(start, np.diff(np.r_[start, len(qi)]))
+        keep = rank < top_k
+        return qi[keep] + offset, pi[keep], dice[keep]
+
+
+class DrugStandardizer:
+    """Compiled multi-pattern matcher + persisted raw -> token map."""
+
+    def __init__(self, entries=None, map_path=None, fuzzy=False, max_ratio=0.2, min_len=5, top_k=5):
+        entries = default_dictionary() if entries is None else entries
+        self.patterns, self.tokens = [], []
+        seen = set()
+        for pat, tok in entries:
+            pat = normalize_text(pat)
+            if pat and pat not in seen:          # first entry of a pattern keeps its priority
+                seen.add(pat)
+                self.patterns.append(pat)
+                self.tokens.append(str(tok))
+        self.fuzzy = (max_ratio, min_len, top_k) if fuzzy else None
+        self.fingerprint = hashlib.sha1(
+            json.dumps([self.patterns, self.tokens, self.fuzzy], ensure_ascii=False).encode("utf-8")).hexdigest()
+        self._compile()
+        self._index = None
+        self.map_path = Path(map_path) if map_path else None
+        self.known = {}
+        if self.map_path and self.map_path.exists():
+            saved = json.loads(self.map_path.read_text(encoding="utf-8"))
+            if saved.get("fingerprint") == self.fingerprint:
+                self.known = saved["map"]
+
+    def _compile(self):
+        if ahocorasick is not None and self.patterns:
+            self._auto = ahocorasick.Automaton()
+            for i, pat in enumerate(self.patterns):
+                self._auto.add_word(pat, i)
+            self._auto.make_automaton()
+        else:
+            self._auto = None
+            self._trie = build_trie(self.patterns)
+            self._any = re.compile(trie_regex(self._trie) or r"(?!x)x")
+
+    def match(self, text):
+        """Token of one raw string (None when no pattern occurs)."""
+        s = normalize_text(text)
+        if not s:
+            return None
+        if self._auto is not None:
+            best = min((i for _, i in self._auto.iter(s)), default=None)
+        else:
+            m = self._any.search(s)
+            if m is None:
+                return None
+            best = None
+            for start in range(m.start(), len(s)):
+                node = self._trie
+                for ch in s[start:]:
+                    node = node.get(ch)
+                    if node is None:
+                        break
+                    i = node.get(_END)
+                    if i is not None and (best is None or i < best):
+                        best = i
+        return None if best is None else self.tokens[best]
+
+    def fuzzy_match(self, texts):
+        """Tokens for strings without a substring hit (None where nothing is close enough)."""
+        max_ratio, min_len, top_k = self.fuzzy
+        if self._index is None:
+            self._index = TrigramIndex(self.patterns)
+        # query units: words and adjacent word pairs (multi-word patterns), deduplicated across strings
+        unit_of, units = [], {}
+        for t, text in enumerate(texts):
+            words = _WORD_RE.findall(normalize_text(text))
+            for u in words + [" ".join(p) for p in zip(words, words[1:])]:
+                if len(u) >= min_len:
+                    unit_of.append((t, units.setdefault(u, len(units))))
+        out = [None] * len(texts)
+        if not units:
+            return out
+        queries = list(units)
+        qi, pi, _ = self._index.shortlist(queries, top_k=top_k)
+        dist = levenshtein_pairs([queries[i] for i in qi], [self.patterns[i] for i in pi])
+        plen = np.fromiter((len(self.patterns[i]) for i in pi), dtype=np.int64, count=len(pi))
+        ok = dist <= np.maximum(1, (max_ratio * plen).astype(np.int64))
+        # best per unit: smallest distance, then dictionary order
+        best = pd.DataFrame({"q": qi[ok], "p": pi[ok], "d": dist[ok]}).sort_values(["q", "d", "p"]) \
+            .drop_duplicates("q").set_index("q")
+        pairs = pd.DataFrame(unit_of, columns=["t", "q"]).join(best, on="q", how="inner")
+        for t, p in pairs.sort_values(["t", "d", "p"]).drop_duplicates("t")[["t", "p"]].itertuples(index=False):
+            out[t] = self.tokens[p]
+        return out
+
+    def standardize(self, values) -> np.ndarray:
+        """Token per row (object array, None = no match); each distinct string is matched once."""
+        codes, uniques = pd.factorize(pd.Series(values), use_na_sentinel=True)
+        out_u = np.empty(len(uniques) + 1, dtype=object)     # last slot: missing input
+        misses = []
+        for k, raw in enumerate(uniques.astype(str)):
+            if raw in self.known:
+                out_u[k] = self.known[raw]
+            else:
+                out_u[k] = self.known[raw] = self.match(raw)
+                if out_u[k] is None and self.fuzzy:
+                    misses.append(k)
+        if misses:
+            raws = [str(uniques[k]) for k in misses]
+            for k, raw, tok in zip(misses, raws, self.fuzzy_match(raws)):
+                out_u[k] = self.known[raw] = tok
+        out_u[-1] = None
+        return out_u[np.where(codes < 0, len(uniques), codes)]
+
+    def save(self, map_path=None):
+        path = Path(map_path) if map_path else self.map_path
+        if path is None:
+            return
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(path.name + ".tmp")
+        tmp.write_text(json.dumps({"fingerprint": self.fingerprint, "map": self.known}, ensure_ascii=False),
+                       encoding="utf-8")
+        os.replace(tmp, path)
@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+duplicate_detect.py — probabilistic duplicate-report detection over the PLID (MinHash/LSH + blocking)
+
+Duplicates sent by different reporters get different caseids, so caseid/caseversion dedup
+keeps them all. Here:
+  - blocking: cases are only compared within the same (sex, age, event_dt, country) block
+    (columns that do not exist are left out of the key; cases missing a present key are skipped)
+  - MinHash: each case's drug set and reaction set get n_perm min-hash values each
+    (tokens hashed once per distinct string, then n_perm vectorized universal hashes)
+  - LSH: the signature is cut into bands of `rows` values; cases sharing (block, band) are
+    candidates. Candidates are taken from a sorted neighbourhood (each case vs the next
+    `window` cases with the same bucket key), so comparisons stay <= n * bands * window
+  - score: estimated Jaccard of the drug sets and of the reaction sets; a pair is a duplicate
+    when both reach `threshold`
+  - clusters: connected components of the duplicate pairs (scipy.sparse.csgraph); the highest
+    id in each cluster (latest report) is kept, the others are flagged for exclusion
+Cases with an empty drug or reaction set are never matched.
+
+Dual interface:
+  (A) MSIP node: globals table (PLID), table1 (DRUG: id, drug), table2 (REAC: id, pt)
+      -> result = clusters [id, cluster, cluster_size, keep]
+  (B) CLI:
+      python raw_code/analysis/duplicate_detect.py --plid F_PLID.csv --drug F_DRUG.csv --reac F_REAC.csv \
+        --out data/derived/duplicate_clusters.csv [--pairs-out pairs.csv] [--threshold 0.8]
+"""
+import argparse
+import numpy as np
+import pandas as pd
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
+
+from counts2x2 import ID_CANDIDATES, resolve_col, index_ids, unique_int
+
+try:
+    from msi.common.dataframe import pandas_to_dataframe as to_msi_df
+except Exception:
+    to_msi_df = None
+
+BLOCK_KEYS = [
+    ("sex", ("sex", "性別")),
+    ("age", ("age", "AGE", "年齢数値")),
+    ("event_dt", ("event_dt", "onset_dt", "有害事象の発現日")),
+    ("country", ("occr_country", "reporter_country", "country")),
+]
+DRUG_CANDIDATES = ("prod_ai", "drug_of_interest", "drug_generic", "drugname", "医薬品（一般名）")
+PT_CANDIDATES = ("pt", "有害事象")
+
+_MIX = np.uint64(0x9E3779B97F4A7C15)
+
+
+def block_codes(plid: pd.DataFrame):
+    """Per-case block id (int64, -1 = not blockable) and the key columns used."""
+    used, codes = [], []
+    for name, cands in BLOCK_KEYS:
+        col = next((c for c in cands if c in plid.columns), None)
+        if col is None:
+            continue
+        s = plid[col]
+        if name == "age":
+            s = pd.to_numeric(s, errors="coerce").round()
+        code, _ = pd.factorize(s)
+        used.append(col)
+        codes.append(code.astype(np.int64))
+    if not codes:
+        return np.zeros(len(plid), dtype=np.int64), used
+    mat = np.column_stack(codes)
+    ok = (mat >= 0).all(axis=1)
+    out = np.full(len(plid), -1, dtype=np.int64)
+    if ok.any():
+        out[ok] = pd.factorize(pd.MultiIndex.from_arrays(mat[ok].T))[0]
+    return out, used
+
+
+def _mix(h):
+    h = h ^ (h >> np.uint64(33))
+    h = h * np.uint64(0xFF51AFD7ED558CCD)
+    return h ^ (h >> np.uint64(33))
+
+
+def minhash(case_code, tokens, n_cases, n_perm=32, seed=0):
+    """
+    MinHash signatures (n_cases, n_perm) uint64 of the token set per case, plus a mask of
+    cases with at least one token. case_code: int per token row (-1 = not in universe).
+    """
+    ok = case_code >= 0
+    case_code = case_code[ok]
+    tok_code, uniq = pd.factorize(pd.Series(tokens)[ok])
+    keep = tok_code >= 0
+    case_code, tok_code = case_code[keep], tok_code[keep]
+    base = pd.util.hash_array(np.asarray(uniq, dtype=object))[tok_code]
+
+    order = np.argsort(case_code, kind="stable")
+    case_code, base = case_code[order], base[order]
+    has = np.zeros(n_cases, dtype=bool)
+    sig = np.full((n_cases, n_perm), np.iinfo(np.uint64).max, dtype=np.uint64)
+    if len(case_code) == 0:
+        return sig, has
+    starts = np.flatnonzero(np.r_[True, case_code[1:] != case_code[:-1]])
+    cases = case_code[starts]
+    has[cases] = True
+    rng = np.random.default_rng(seed)
+    salts = rng.integers(1, np.iinfo(np.int64).max, size=n_perm, dtype=np.int64).astype(np.uint64)
+    for i in range(n_perm):
+        sig[cases, i] = np.minimum.reduceat(_mix((base ^ salts[i]) * _MIX), starts)
+    return sig, has
+
+
+def _band_keys(block, sig, rows):
+    """One uint64 bucket key per case and band (block id mixed in)."""
+    n_bands = sig.shape[1] // rows
+    out = np.empty((len(block), n_bands), dtype=np.uint64)
+    b = block.astype(np.uint64)
+    for j in range(n_bands):
+        h = _mix(b * _MIX + np.uint64(j + 1))
+        for c in range(j * rows, (j + 1) * rows):
+            h = _mix((h ^ sig[:, c]) * _MIX)
+        out[:, j] = h
+    return out
+
+
+def candidate_pairs(block, sig, rows=4, window=50):
+    """Candidate (i, j), i < j: same block and same bucket in at least one band (sorted neighbourhood)."""
+    n = len(block)
+    pairs = []
+    for keys in _band_keys(block, sig, rows).T:
+        order = np.argsort(keys, kind="stable")
+        k = keys[order]
+        for d in range(1, min(window, n - 1) + 1):
+            same = np.flatnonzero(k[:-d] == k[d:])
+            if len(same) == 0:
+                break
+            a, b = order[same], order[same + d]
+            pairs.append(np.minimum(a, b).astype(np.int64) * n + np.maximum(a, b))
+    if not pairs:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    p = unique_int(np.concatenate(pairs))
+    return p // n, p % n
+
+
+def jaccard_est(sig, i, j, chunk=1_000_000):
+    out = np.empty(len(i), dtype=float)
+    for s in range(0, len(i), chunk):
+        out[s:s + chunk] = (sig[i[s:s + chunk]] == sig[j[s:s + chunk]]).mean(axis=1)
+    return out
+
+
+def detect_duplicates(plid: pd.DataFrame, drug: pd.DataFrame, reac: pd.DataFrame,
+                      threshold=0.8, n_perm=32, rows=4, window=50, seed=0):
+    """Returns (clusters DataFrame, scored duplicate pairs DataFrame)."""
+    id_col = resolve_col(plid, *ID_CANDIDATES)
+    cases = plid.dropna(subset=[id_col]).drop_duplicates(subset=[id_col]).reset_index(drop=True)
+    universe = cases[id_col].to_numpy()
+    block, used = block_codes(cases)
+    n = len(universe)
+
+    sig_d, has_d = minhash(index_ids(universe, drug[resolve_col(drug, *ID_CANDIDATES)]),
+                           drug[resolve_col(drug, *DRUG_CANDIDATES)].to_numpy(), n, n_perm, seed)
+    sig_r, has_r = minhash(index_ids(universe, reac[resolve_col(reac, *ID_CANDIDATES)]),
+                           reac[resolve_col(reac, *PT_CANDIDATES)].to_numpy(), n, n_perm, seed + 1)
+    active = np.flatnonzero((block >= 0) & has_d & has_r)
+
+    sig = np.concatenate([sig_d, sig_r], axis=1)[active]
+    ci, cj = candidate_pairs(block[active], sig, rows=rows, window=window)
+    jd = jaccard_est(sig_d[active], ci, cj)
+    jr = jaccard_est(sig_r[active], ci, cj)
+    dup = (jd >= threshold) & (jr >= threshold)
+    ci, cj = active[ci[dup]], active[cj[dup]]
+    pairs = pd.DataFrame({f"{id_col}_a": universe[ci], f"{id_col}_b": universe[cj],
+                          "jaccard_drug": jd[dup], "jaccard_reac": jr[dup]})
+    print(f"[DUP] {len(active):,} blockable cases, blocks on {used}, "
+          f"{len(dup):,} candidate pairs, {int(dup.sum()):,} duplicates")
+
+    graph = coo_matrix((np.ones(len(ci), dtype=np.int8), (ci, cj)), shape=(n, n))
+    _, label = connected_components(graph, directed=False)
+    size = np.bincount(label)
+    in_cluster = np.flatnonzero(size[label] > 1)
+    clusters = pd.DataFrame({id_col: universe[in_cluster], "cluster": label[in_cluster]})
+    clusters["cluster"] = pd.factorize(clusters["cluster"], sort=True)[0]
+    clusters["cluster_size"] = clusters.groupby("cluster")[id_col].transform("size")
+    latest = clusters.groupby("cluster")[id_col].transform("max")
+    clusters["keep"] = np.where(clusters[id_col] == latest, "Yes", "No")
+    return clusters.sort_values(["cluster", id_col]).reset_index(drop=True), pairs
+
+
+def main():
+    g = globals()
+    if "table" in g and "table1" in g and "table2" in g:
+        clusters, _ = detect_duplicates(g["table"].to_pandas(), g["table1"].to_pandas(), g["table2"].to_pandas())
+        g["result"] = to_msi_df(clusters) if to_msi_df else clusters
+        return
+
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--plid", required=True, help="PLID CSV [id, sex, age, event_dt, country...]")
+    ap.add_argument("--drug", required=True, help="DRUG CSV [id, prod_ai/drug name]")
+    ap.add_argument("--reac", required=True, help="REAC CSV [id, pt]")
+    ap.add_argument("--threshold", type=float, default=0.8, help="Min estimated Jaccard (drug and reaction sets)")
+    ap.add_argument("--perm", type=int, default=32, help="MinHash values per set")
+    ap.add_argument("--rows", type=int, default=4, help="Signature rows per LSH band")
+    ap.add_argument("--window", type=int, default=50, help="Neighbours compared per bucket position")
+    ap.add_argument("--out", required=True, help="Cluster CSV [id, cluster, cluster_size, keep]")
+    ap.add_argument("--pairs-out", default=None, help="Scored duplicate pairs CSV")
+    args = ap.parse_args()
+
+    clusters, pairs = detect_duplicates(pd.read_csv(args.plid), pd.read_csv(args.drug), pd.read_csv(args.reac),
+                                        threshold=args.threshold, n_perm=args.perm, rows=args.rows,
+                                        window=args.window)
+    clusters.to_csv(args.out, index=False)
+    print(f"[WRITE] {args.out} ({clusters['cluster'].nunique() if len(clusters) else 0} clusters)")
+    if args.pairs_out:
+        pairs.to_csv(args.pairs_out, index=False)
+        print(f"[WRITE] {args.pairs_out}")
+
+
+if __name__ == "__main__":
+    main()
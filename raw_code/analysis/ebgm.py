@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+"""
+ebgm.py — Multi-item Gamma Poisson Shrinker (DuMouchel GPS): EBGM, EB05, EB95
+
+Model: n11 ~ Poisson(lambda * E), E = n1plus * nplus1 / N, with a two-component
+gamma-mixture prior  lambda ~ P*Gamma(a1, b1) + (1-P)*Gamma(a2, b2).
+- fit_gps: maximum likelihood of the prior over all observed cells (negative-binomial
+  marginal, vectorized; (n, E) cells are squashed to weighted unique pairs first). Cells
+  below `trunc` are usually absent from a sparse screen, so the likelihood is
+  conditioned on n >= trunc (default 1, as in the FDA/openEBGM setup).
+- ebgm_scores: posterior EBGM (2^E[log2 lambda]) and EB05/EB95 quantiles for every
+  cell in batch (safeguarded Newton on the mixture CDF over all cells at once; no
+  per-cell root finding).
+
+Usage:
+  from ebgm import gps_metrics
+  eb = gps_metrics(n11, n1plus, nplus1, N)   # dict: EBGM, EB05, EB95, EBlog2 (+ "prior")
+"""
+import numpy as np
+from scipy.optimize import minimize
+from scipy.special import gammaln, digamma, gammainc, gammaincinv, expit, logit
+
+# DuMouchel / openEBGM starting values: a1, b1, a2, b2, P
+DEFAULT_THETA0 = (0.2, 0.1, 2.0, 4.0, 1 / 3)
+
+# Signal definition usable with disproportionality.evaluate_criteria
+EBGM_CRITERION = {"name": "met_EBGM", "min_n11": 0, "rules": [("EB05", ">=", 2)]}
+
+
+def _log_nb(n, E, a, b):
+    """log negative-binomial marginal of n for a Gamma(a, b) prior on lambda."""
+    return (gammaln(a + n) - gammaln(a) - gammaln(n + 1)
+            + a * np.log(b / (b + E)) + n * np.log(E / (b + E)))
+
+
+def _log_tail(E, a, b, trunc):
+    """log P(n >= trunc) under the negative-binomial marginal."""
+    if trunc <= 0:
+        return np.zeros_like(E)
+    head = np.zeros_like(E)
+    for k in range(trunc):
+        head = head + np.exp(_log_nb(k, E, a, b))
+    return np.log1p(-np.minimum(head, 1 - 1e-300))
+
+
+def _unpack(x):
+    a1, b1, a2, b2 = np.exp(x[:4])
+    return a1, b1, a2, b2, expit(x[4])
+
+
+def _negloglik(x, n, E, w, trunc):
+    a1, b1, a2, b2, P = _unpack(x)
+    l1 = np.log(P) + _log_nb(n, E, a1, b1)
+    l2 = np.log1p(-P) + _log_nb(n, E, a2, b2)
+    ll = np.logaddexp(l1, l2)
+    if trunc > 0:
+        t1 = np.log(P) + _log_tail(E, a1, b1, trunc)
+        t2 = np.log1p(-P) + _log_tail(E, a2, b2, trunc)
+        ll = ll - np.logaddexp(t1, t2)
+    return -np.sum(w * ll)
+
+
+def _collapse(n, E, squash_decimals):
+    """Unique (n, E) pairs with multiplicity weights (optionally E rounded in log10 space)."""
+    key_E = E if squash_decimals is None else 10 ** np.round(np.log10(E), squash_decimals)
+    order = np.lexsort((key_E, n))
+    n_s, E_s = n[order], key_E[order]
+    first = np.ones(len(n_s), dtype=bool)
+    first[1:] = (n_s[1:] != n_s[:-1]) | (E_s[1:] != E_s[:-1])
+    grp = np.cumsum(first) - 1
+    w = np.bincount(grp).astype(float)
+    return n_s[first], E_s[first], w
+
+
+def fit_gps(n11, E, trunc=1, theta0=DEFAULT_THETA0, squash_decimals=3, maxiter=500):
+    """
+    Maximum-likelihood gamma-mixture prior over all cells.
+    Returns dict(a1, b1, a2, b2, P, loglik, converged, cells).
+    squash_decimals: log10(E) is rounded to this many decimals before identical cells are
+    collapsed (data squashing; 3 -> E within ~0.1%). None fits on the exact E values.
+    """
+    n = np.asarray(n11, dtype=float)
+    E = np.asarray(E, dtype=float)
+    ok = np.isfinite(n) & np.isfinite(E) & (E > 0) & (n >= trunc)
+    n_u, E_u, w = _collapse(n[ok], E[ok], squash_decimals)
+
+    a1, b1, a2, b2, P = theta0
+    x0 = np.r_[np.log([a1, b1, a2, b2]), logit(P)]
+    with np.errstate(divide="ignore", invalid="ignore", over="ignore"):
+        res = minimize(_negloglik, x0, args=(n_u, E_u, w, trunc), method="L-BFGS-B",
+                       options={"maxiter": maxiter})
+    a1, b1, a2, b2, P = _unpack(res.x)
+    return {"a1": a1, "b1": b1, "a2": a2, "b2": b2, "P": P,
+            "loglik": -float(res.fun), "converged": bool(res.success), "cells": int(ok.sum())}
+
+
+def _mixture_quantile(q, Q, a1, b1, a2, b2, tol=1e-9, maxiter=100):
+    """
+    Quantile q of Q*Gamma(a1, b1) + (1-Q)*Gamma(a2, b2) (rate params), all cells at once.
+    Bracketed by the component quantiles; Newton steps in log(lambda) with a bisection
+    fallback, iterating only on the cells that have not converged yet.
+    """
+    x1 = gammaincinv(a1, q) / b1
+    x2 = gammaincinv(a2, q) / b2
+    lo = np.log(np.maximum(np.minimum(x1, x2), 1e-300))
+    hi = np.log(np.maximum(np.maximum(x1, x2), 1e-300))
+    y = np.where(Q >= 0.5, np.log(np.maximum(x1, 1e-300)), np.log(np.maximum(x2, 1e-300)))
+
+    act = np.flatnonzero(hi - lo > tol)
+    for _ in range(maxiter):
+        if len(act) == 0:
+            break
+        Qa, A1, B1, A2, B2 = Q[act], a1[act], b1[act], a2[act], b2[act]
+        ya = y[act]
+        lam = np.exp(ya)
+        F = Qa * gammainc(A1, B1 * lam) + (1 - Qa) * gammainc(A2, B2 * lam) - q
+        # dF/dy = lambda * mixture pdf(lambda)
+        dens = (Qa * np.exp(A1 * np.log(B1 * lam) - B1 * lam - gammaln(A1))
+                + (1 - Qa) * np.exp(A2 * np.log(B2 * lam) - B2 * lam - gammaln(A2)))
+        lo[act] = np.where(F < 0, ya, lo[act])
+        hi[act] = np.where(F < 0, hi[act], ya)
+        step = ya - F / dens
+        bad = ~np.isfinite(step) | (step <= lo[act]) | (step >= hi[act])
+        ynew = np.where(bad, 0.5 * (lo[act] + hi[act]), step)
+        done = (np.abs(ynew - ya) < tol) | (hi[act] - lo[act] < tol)
+        y[act] = ynew
+        act = act[~done]
+    return np.exp(y)
+
+
+def ebgm_scores(n11, E, prior, quantiles=(0.05, 0.95)):
+    """
+    Posterior summaries for every cell given a fitted prior.
+    Returns dict: EBGM, EBlog2, Qn (posterior weight of component 1), EB05, EB95.
+    Identical (n, E) cells are scored once.
+    """
+    n_all = np.asarray(n11, dtype=float)
+    E_all = np.asarray(E, dtype=float)
+    a1, b1, a2, b2, P = (prior[k] for k in ("a1", "b1", "a2", "b2", "P"))
+
+    cells = np.column_stack([n_all, E_all])
+    order = np.lexsort((E_all, n_all))
+    srt = cells[order]
+    first = np.ones(len(srt), dtype=bool)
+    first[1:] = (srt[1:] != srt[:-1]).any(axis=1)
+    inv = np.empty(len(cells), dtype=np.int64)
+    inv[order] = np.cumsum(first) - 1
+    n, E = srt[first, 0], srt[first, 1]
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        l1 = np.log(P) + _log_nb(n, E, a1, b1)
+        l2 = np.log1p(-P) + _log_nb(n, E, a2, b2)
+        Qn = np.exp(l1 - np.logaddexp(l1, l2))
+
+        # posterior components: Gamma(a + n, b + E)
+        pa1, pb1, pa2, pb2 = a1 + n, b1 + E, a2 + n, b2 + E
+        EBlog2 = (Qn * (digamma(pa1) - np.log(pb1))
+                  + (1 - Qn) * (digamma(pa2) - np.log(pb2))) / np.log(2)
+
+    out = {"EBGM": 2 ** EBlog2, "EBlog2": EBlog2, "Qn": Qn}
+    for q in quantiles:
+        name = f"EB{int(round(q * 100)):02d}"
+        with np.errstate(divide="ignore", invalid="ignore", over="ignore"):
+            out[name] = _mixture_quantile(q, Qn, pa1, pb1, pa2, pb2)
+    return {k: v[inv] for k, v in out.items()}
+
+
+def gps_metrics(n11, n1plus, nplus1, N, trunc=1, prior=None, **fit_kw):
+    """
+    EBGM/EB05/EB95 for count columns shaped like the disproportionality inputs
+    (scalars or per-row nplus1/N). The prior is fitted over the same cells unless given.
+    """
+    n11 = np.asarray(n11, dtype=float)
+    E = np.asarray(n1plus, dtype=float) * np.asarray(nplus1, dtype=float) / np.asarray(N, dtype=float)
+    E = np.broadcast_to(E, n11.shape)
+    if prior is None:
+        prior = fit_gps(n11, E, trunc=trunc, **fit_kw)
+    out = ebgm_scores(n11, E, prior)
+    out["E"] = E
+    out["prior"] = prior
+    return out
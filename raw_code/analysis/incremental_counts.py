@@ -0,0 +1,288 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+incremental_counts.py — quarterly FAERS delta update of the deduplicated case index and counts
+
+A state directory persists:
+  - the deduplicated case index (caseid -> latest caseversion, fda_dt, primaryid, stratum cell, AF flag)
+  - distinct (case, drug_of_interest) exposure pairs
+  - the base strata count cube (N, nplus1 per cell; n1plus, n11 per drug x cell; strata_cube.py)
+Applying a quarter only touches that quarter's rows:
+  - caseids not seen before are added
+  - a caseid whose (caseversion, fda_dt, primaryid) sorts after the stored one supersedes it:
+    the old version's contributions (cell, AF flag, exposure pairs) are subtracted, the new ones added
+  - stale versions (<= stored key) are ignored; --deleted caseids are retired
+    (and their rows in the same quarter dropped)
+Dedup rule as in faers/00_demo_dedup.py (demo_dedup.py): sort by (caseid, caseversion, fda_dt,
+primaryid) and keep the last row per caseid, so an incremental refresh keeps the same primaryids
+as a full rebuild.
+
+Quarter inputs (CSV):
+  --demo : quarter PLID rows [caseid, caseversion, fda_dt, primaryid, sex, age, number_of_drug]
+           (fda_dt optional: missing tie-breakers sort first, as in demo_dedup.py)
+  --oab  : [primaryid, drug_of_interest]      --af : [primaryid]
+  --deleted (optional): [caseid] from the quarter's deleted-cases list
+
+Usage:
+  python raw_code/analysis/incremental_counts.py update --state data/state/faers \
+    --demo q.csv --oab q_oab.csv --af q_af.csv [--deleted q_del.csv] --quarter 2025Q1
+  python raw_code/analysis/incremental_counts.py export --state data/state/faers \
+    --counts-out data/derived/counts2x2.csv [--strata-out ...] [--plid-out ...]
+(update on an empty state directory builds the initial state from a full extract)
+"""
+import argparse
+import json
+import os
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from counts2x2 import index_ids, unique_int, resolve_col
+from strata_cube import (DEFAULT_DIMENSIONS, DEFAULT_SUBGROUPS, cell_codes, base_counts,
+                         cube_from_base, stratified_metrics)
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "faers"))
+from demo_dedup import key_array, latest_positions
+
+STATE_ARRAYS = "state.npz"
+STATE_META = "meta.json"
+
+CASE_FIELDS = ("caseid", "caseversion", "fda_dt", "primaryid", "cell", "event", "alive")
+
+
+def empty_state(dims=DEFAULT_DIMENSIONS):
+    n_cells = int(np.prod([len(d["levels"]) + 1 for d in dims]))
+    return {
+        "caseid": np.zeros(0, np.int64), "caseversion": np.zeros(0, np.int64),
+        "fda_dt": np.zeros(0, np.int64), "primaryid": np.zeros(0, np.int64), "cell": np.zeros(0, np.int16),
+        "event": np.zeros(0, bool), "alive": np.zeros(0, bool),
+        "pair_row": np.zeros(0, np.int64), "pair_drug": np.zeros(0, np.int32),
+        "N": np.zeros(n_cells, np.int64), "nplus1": np.zeros(n_cells, np.int64),
+        "n1plus": np.zeros(0, np.int64), "n11": np.zeros(0, np.int64),
+        "drugs": [], "dims": [d["name"] for d in dims], "quarters": [],
+    }
+
+
+def load_state(state_dir, dims=DEFAULT_DIMENSIONS):
+    state_dir = Path(state_dir)
+    if not (state_dir / STATE_META).exists():
+        return empty_state(dims)
+    meta = json.loads((state_dir / STATE_META).read_text(encoding="utf-8"))
+    if meta["dims"] != [d["name"] for d in dims]:
+        raise ValueError(f"State was built with dimensions {meta['dims']}; rebuild it for {[d['name'] for d in dims]}")
+    with np.load(state_dir / STATE_ARRAYS) as z:
+        state = {k: z[k] for k in z.files}
+    state.update(meta)
+    if "fda_dt" not in state:   # states saved before fda_dt was tracked: unknown tie-breaker
+        state["fda_dt"] = np.full(len(state["caseid"]), -1, dtype=np.int64)
+    return state
+
+
+def save_state(state, state_dir):
+    """Arrays -> state.npz, labels/log -> meta.json (written to temp files, then replaced)."""
+    state_dir = Path(state_dir)
+    state_dir.mkdir(parents=True, exist_ok=True)
+    meta_keys = ("drugs", "dims", "quarters")
+    tmp = state_dir / (STATE_ARRAYS + ".tmp.npz")
+    np.savez(tmp, **{k: v for k, v in state.items() if k not in meta_keys})
+    os.replace(tmp, state_dir / STATE_ARRAYS)
+    tmp_meta = state_dir / (STATE_META + ".tmp")
+    tmp_meta.write_text(json.dumps({k: state[k] for k in meta_keys}, ensure_ascii=False, indent=1),
+                        encoding="utf-8")
+    os.replace(tmp_meta, state_dir / STATE_META)
+
+
+def latest_per_caseid(demo: pd.DataFrame) -> pd.DataFrame:
+    """Latest row per caseid within one extract under the demo_dedup.py rule (row order kept)."""
+    return demo.iloc[np.sort(latest_positions(demo))].reset_index(drop=True)
+
+
+def _subtract_rows(state, rows, n_cells):
+    """Remove the contributions of stored case rows (and their exposure pairs) from the counts."""
+    rows = rows[state["alive"][rows]]
+    if len(rows) == 0:
+        return
+    n_drugs = len(state["drugs"])
+    retire = np.zeros(len(state["caseid"]), dtype=bool)
+    retire[rows] = True
+    pm = retire[state["pair_row"]]
+    cell = state["cell"].astype(np.int64)
+    pair_row = state["pair_row"][pm]
+    flat = state["pair_drug"][pm].astype(np.int64) * n_cells + cell[pair_row]
+    N = np.bincount(cell[rows], minlength=n_cells)
+    nplus1 = np.bincount(cell[rows], weights=state["event"][rows], minlength=n_cells).astype(np.int64)
+    n1plus = np.bincount(flat, minlength=n_drugs * n_cells)
+    n11 = np.bincount(flat, weights=state["event"][pair_row], minlength=n_drugs * n_cells).astype(np.int64)
+    state["N"] -= N
+    state["nplus1"] -= nplus1
+    state["n1plus"] -= n1plus
+    state["n11"] -= n11
+    state["pair_row"] = state["pair_row"][~pm]
+    state["pair_drug"] = state["pair_drug"][~pm]
+    state["alive"][rows] = False
+
+
+def apply_quarter(state, demo: pd.DataFrame, oab: pd.DataFrame, af: pd.DataFrame,
+                  deleted=None, dims=DEFAULT_DIMENSIONS, quarter=None):
+    """Apply one quarter's new/superseded/deleted cases to `state` in place; returns a change summary."""
+    n_cells = len(state["N"])
+    q = latest_per_caseid(demo)
+    del_ids = None
+    if deleted is not None and len(deleted):
+        # deleted caseids are removed from the whole dataset, this quarter's rows included
+        del_ids = unique_int(pd.to_numeric(pd.Series(deleted), errors="coerce").dropna().astype(np.int64))
+        q_all = pd.to_numeric(q["caseid"], errors="coerce").to_numpy()
+        q = q[index_ids(del_ids, q_all) < 0].reset_index(drop=True)
+    keys = key_array(q)     # (caseid, caseversion, fda_dt, primaryid); q has no missing caseids
+    q_cid, q_ver, q_dt = keys[:, 0], keys[:, 1], keys[:, 2]
+
+    pos = index_ids(state["caseid"], q_cid)
+    seen = pos >= 0
+    stored_alive = np.zeros(len(q), dtype=bool)
+    stored_alive[seen] = state["alive"][pos[seen]]
+    stored = np.full((len(q), 3), -1, dtype=np.int64)
+    for j, k in enumerate(("caseversion", "fda_dt", "primaryid")):
+        stored[seen, j] = state[k][pos[seen]]
+    newer = np.zeros(len(q), dtype=bool)    # (caseversion, fda_dt, primaryid) > stored, lexicographic
+    tied = np.ones(len(q), dtype=bool)
+    for j in range(3):
+        newer |= tied & (keys[:, j + 1] > stored[:, j])
+        tied &= keys[:, j + 1] == stored[:, j]
+    accept = ~seen | ~stored_alive | newer
+    supersede = accept & seen
+
+    # 1) subtract superseded and deleted versions
+    retire = pos[supersede & stored_alive]
+    n_deleted = 0
+    if del_ids is not None:
+        dpos = index_ids(state["caseid"], del_ids)
+        drows = dpos[dpos >= 0]
+        drows = drows[state["alive"][drows]]
+        n_deleted = len(drows)
+        retire = np.concatenate([retire, drows])
+    _subtract_rows(state, unique_int(retire), n_cells)
+
+    # 2) place accepted cases: overwrite superseded rows, append new caseids
+    q = q[accept].reset_index(drop=True)
+    rows = pos[accept].copy()
+    new = rows < 0
+    n_old = len(state["caseid"])
+    rows[new] = n_old + np.arange(int(new.sum()))
+    n_total = n_old + int(new.sum())
+    for k in CASE_FIELDS:
+        grown = np.zeros(n_total, dtype=state[k].dtype)
+        grown[:n_old] = state[k]
+        state[k] = grown
+
+    q_pid = pd.to_numeric(q[resolve_col(q, "primaryid")], errors="coerce").to_numpy()
+    cell, _ = cell_codes(q, dims)
+    event = np.zeros(len(q), dtype=bool)
+    ev = index_ids(q_pid, pd.to_numeric(af[resolve_col(af, "primaryid")], errors="coerce").dropna())
+    event[ev[ev >= 0]] = True
+
+    state["caseid"][rows] = q_cid[accept]
+    state["caseversion"][rows] = q_ver[accept]
+    state["fda_dt"][rows] = q_dt[accept]
+    state["primaryid"][rows] = q_pid
+    state["cell"][rows] = cell
+    state["event"][rows] = event
+    state["alive"][rows] = True
+
+    # 3) exposure pairs of the accepted cases (new drug labels extend the drug axis)
+    labels = pd.Index(state["drugs"])
+    tok = oab[resolve_col(oab, "drug_of_interest")]
+    extra = pd.Index(pd.unique(tok.dropna())).difference(labels, sort=False)
+    if len(extra):
+        labels = labels.append(extra)
+        pad = np.zeros(len(extra) * n_cells, dtype=np.int64)
+        state["n1plus"] = np.concatenate([state["n1plus"], pad])
+        state["n11"] = np.concatenate([state["n11"], pad])
+        state["drugs"] = labels.tolist()
+    n_drugs = len(labels)
+
+    local = index_ids(q_pid, pd.to_numeric(oab[resolve_col(oab, "primaryid")], errors="coerce"))
+    drug_code = labels.get_indexer(tok)
+    ok = (local >= 0) & (drug_code >= 0)
+    pair = unique_int(local[ok] * n_drugs + drug_code[ok])
+    pair_local, pair_drug = pair // n_drugs, pair % n_drugs
+
+    N, nplus1, n1plus, n11 = base_counts(cell, event, pair_local, pair_drug, n_cells, n_drugs)
+    state["N"] += N
+    state["nplus1"] += nplus1
+    state["n1plus"] += n1plus
+    state["n11"] += n11
+    state["pair_row"] = np.concatenate([state["pair_row"], rows[pair_local]])
+    state["pair_drug"] = np.concatenate([state["pair_drug"], pair_drug.astype(np.int32)])
+
+    summary = {"quarter": quarter, "rows": int(len(demo)), "new": int(new.sum()),
+               "superseded": int(supersede.sum()), "stale": int((~accept).sum()),
+               "deleted": n_deleted, "cases": int(state["alive"].sum())}
+    state["quarters"] = list(state["quarters"]) + [summary]
+    return summary
+
+
+def state_cube(state, dims=DEFAULT_DIMENSIONS):
+    return cube_from_base(dims, state["drugs"], state["N"], state["nplus1"], state["n1plus"], state["n11"])
+
+
+def export_counts2x2(state, dims=DEFAULT_DIMENSIONS) -> pd.DataFrame:
+    """Overall counts in the counts2x2.py layout [drug_of_interest, n11, n12, n21, n22, N, n1plus, nplus1]."""
+    counts = state_cube(state, dims).counts([("Overall", {})])
+    return counts.drop(columns=["Subgroup"])
+
+
+def export_plid(state) -> pd.DataFrame:
+    """Deduplicated case index (alive cases)."""
+    alive = state["alive"]
+    return pd.DataFrame({"caseid": state["caseid"][alive], "caseversion": state["caseversion"][alive],
+                         "fda_dt": state["fda_dt"][alive], "primaryid": state["primaryid"][alive]})
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    sub = ap.add_subparsers(dest="cmd", required=True)
+
+    up = sub.add_parser("update", help="Apply one quarter (or the initial full extract)")
+    up.add_argument("--state", required=True)
+    up.add_argument("--demo", required=True, help="Quarter PLID CSV [caseid, caseversion, primaryid, sex, age, number_of_drug]")
+    up.add_argument("--oab", required=True, help="Quarter OAB_STD CSV [primaryid, drug_of_interest]")
+    up.add_argument("--af", required=True, help="Quarter AF case list CSV [primaryid]")
+    up.add_argument("--deleted", default=None, help="Optional deleted-cases CSV [caseid]")
+    up.add_argument("--quarter", default=None, help="Label for the update log (e.g. 2025Q1)")
+
+    ex = sub.add_parser("export", help="Write counts / stratified metrics / case index from the state")
+    ex.add_argument("--state", required=True)
+    ex.add_argument("--counts-out", default=None)
+    ex.add_argument("--strata-out", default=None, help="figure3-style stratified metrics")
+    ex.add_argument("--db", default="FAERS")
+    ex.add_argument("--plid-out", default=None)
+    args = ap.parse_args()
+
+    state = load_state(args.state)
+    if args.cmd == "update":
+        deleted = None
+        if args.deleted:
+            d = pd.read_csv(args.deleted)
+            deleted = d[resolve_col(d, "caseid")].to_numpy()
+        summary = apply_quarter(state, pd.read_csv(args.demo), pd.read_csv(args.oab), pd.read_csv(args.af),
+                                deleted=deleted, quarter=args.quarter)
+        save_state(state, args.state)
+        print("[UPDATE]", summary)
+        return
+
+    if args.counts_out:
+        export_counts2x2(state).to_csv(args.counts_out, index=False)
+        print(f"[WRITE] {args.counts_out}")
+    if args.strata_out:
+        counts = state_cube(state).counts(DEFAULT_SUBGROUPS)
+        stratified_metrics(counts, db=args.db).to_csv(args.strata_out, index=False)
+        print(f"[WRITE] {args.strata_out}")
+    if args.plid_out:
+        export_plid(state).to_csv(args.plid_out, index=False)
+        print(f"[WRITE] {args.plid_out}")
+
+
+if __name__ == "__main__":
+    main()
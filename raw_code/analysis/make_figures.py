@@ -13,6 +13,9 @@ Usage examples:
   # dry-run (show commands only)
   python raw_code/analysis/make_figures.py --dry-run
 
+  # re-render even if inputs are unchanged
+  python raw_code/analysis/make_figures.py --force
+
 Inputs (default locations):
   data/derived/figure2_source.csv
   data/derived/figure3_stratified.csv      (optional)
@@ -22,14 +25,21 @@ Inputs (default locations):
 
 Outputs:
   docs/figure2_forest_plot.(png|tif)
-  docs/figure3_forest_plot.png             (if stratified CSV exists)
+  docs/figure3_forest_plot.(png|tif)       (if stratified CSV exists)
   docs/volcano_<drug>.png                  (for each volcano_*.csv)
-  docs/figure5_tto_<name>.png              (for each tto_*.csv)
+  docs/figure5_tto_<name>.(png|tif)        (for each tto_*.csv)
   docs/figure6_km_raw.png                  (if figure6_km_source.csv exists)
+
+Each figure (and --prep standardization) is a node of the pipeline.py DAG: nodes run in-process
+in a worker pool (--workers), and a node whose script (and local modules), arguments and input
+contents are unchanged since its last successful run is skipped (state: data/derived/.pipeline_state.json).
+--pipeline adds upstream nodes (ingest/dedup/counts/metrics) from a JSON node list.
 """
 import argparse, subprocess, sys
 from pathlib import Path
 
+from pipeline import Node, nodes_from_config, run_pipeline
+
 REPO = Path(__file__).resolve().parents[2]  # repo root
 PLOTS = REPO / "raw_code" / "plots"
 DERIVED = REPO / "data" / "derived"
@@ -45,141 +55,136 @@ def ensure_docs():
     DOCS.mkdir(parents=True, exist_ok=True)
 
 
-def run_prep(py_exec, dry_run=False):
-    """Discover default inputs and call prep_standardize.py.
+def prep_nodes():
+    """Standardization nodes for the default inputs.
     Defaults:
       data/faers_DRUG.csv -> data/derived/faers_oab_standardized.csv
       data/jader_DRUG.csv -> data/derived/jader_oab_standardized.csv
     """
-    from pathlib import Path
-    import subprocess, sys
-    REPO = Path(__file__).resolve().parents[2]  # repo root
-    PREP = REPO / "raw_code" / "analysis" / "prep_standardize.py"
-    DERIVED = REPO / "data" / "derived"
-    DERIVED.mkdir(parents=True, exist_ok=True)
-
-    faers_in  = REPO / "data" / "faers_DRUG.csv"
-    faers_out = DERIVED / "faers_oab_standardized.csv"
-    jader_in  = REPO / "data" / "jader_DRUG.csv"
-    jader_out = DERIVED / "jader_oab_standardized.csv"
-
-    cmd = [str(py_exec), str(PREP)]
-    if faers_in.exists():
-        cmd += ["--faers-in", str(faers_in), "--faers-out", str(faers_out)]
-    if jader_in.exists():
-        cmd += ["--jader-in", str(jader_in), "--jader-out", str(jader_out)]
-
-    if len(cmd) == 2:
+    nodes = []
+    for db in ("faers", "jader"):
+        src = REPO / "data" / f"{db}_DRUG.csv"
+        out = DERIVED / f"{db}_oab_standardized.csv"
+        if src.exists():
+            nodes.append(Node(f"prep_{db}", REPO / "raw_code" / db / "01_oab_standardize.py",
+                              ["--in", src, "--out", out], inputs=[src], outputs=[out], stage="standardize"))
+    if not nodes:
         print("[PREP] No default inputs found (data/faers_DRUG.csv or data/jader_DRUG.csv). Skipping.")
-        return 0
-
-    if dry_run:
-        print("[DRY][PREP] ", " ".join(cmd))
-        return 0
-    print("[PREP] ", " ".join(cmd))
-    return subprocess.call(cmd)
-
-
-def main():
-    ap = argparse.ArgumentParser()
-    ap.add_argument("--fig2", action="store_true", help="Build Figure 2 (forest)")
-    ap.add_argument("--fig3", action="store_true", help="Build Figure 3 (stratified forest) if data present")
-    ap.add_argument("--fig4", action="store_true", help="Build Figure 4 (volcano) for each volcano_*.csv")
-    ap.add_argument("--fig5", action="store_true", help="Build Figure 5 (TTO distribution) for each tto_*.csv")
-    ap.add_argument("--fig6", action="store_true", help="Build Figure 6 (KM raw) if data present")
-    ap.add_argument("--all",  action="store_true", help="Build all (default if no flags)")
-    ap.add_argument("--prep", action="store_true", help="Run standardization (prep_standardize.py) before figures")
-    ap.add_argument("--prep-only", action="store_true", help="Run only standardization and exit")
-    ap.add_argument("--dry-run", action="store_true", help="Print commands without executing")
-    ap.add_argument("--py", default=sys.executable, help="Python executable to use for sub-commands")
-    args = ap.parse_args()
+    return nodes
 
-    # If prep-only, or prep requested, run standardization first
-    do_prep = getattr(args, 'prep', False) or getattr(args, 'prep_only', False)
-    dry = getattr(args, 'dry_run', False)
-    if do_prep:
-        rc = run_prep(py_exec=args.py if hasattr(args, 'py') else sys.executable, dry_run=dry)
-        if rc != 0:
-            sys.exit(rc)
-        if getattr(args, 'prep_only', False):
-            return
 
-    if not any([args.fig2, args.fig3, args.fig4, args.fig5, args.fig6, args.all]):
-        args.all = True
-
-    ensure_docs()
-
-    # Validate data (if validator exists)
-    validator = REPO / "raw_code" / "analysis" / "validate_data.py"
-    if validator.exists():
-        run([args.py, str(validator)], dry_run=args.dry_run)
+def figure_nodes(figs):
+    """One node per figure / per volcano_*.csv / per tto_*.csv for the selected figures."""
+    nodes = []
 
     # FIGURE 2
-    if args.fig2 or args.all:
+    if "fig2" in figs:
         src = DERIVED / "figure2_source.csv"
         if src.exists():
             out_png = DOCS / "figure2_forest_plot.png"
             out_tif = DOCS / "figure2_forest_plot.tif"
-            cmd = [args.py, str(PLOTS/"forest_plot.py"),
-                   "--table", str(src),
-                   "--out", str(out_png),
-                   "--tif", str(out_tif)]
-            run(cmd, dry_run=args.dry_run)
+            nodes.append(Node("fig2", PLOTS / "forest_plot.py",
+                              ["--table", src, "--out", out_png, "--tif", out_tif],
+                              inputs=[src], outputs=[out_png, out_tif], stage="figures"))
         else:
             print("[SKIP] Figure 2: missing", src)
 
     # FIGURE 3 (optional stratified forest)
-    if args.fig3 or args.all:
+    if "fig3" in figs:
         src = DERIVED / "figure3_stratified.csv"
         if src.exists():
             out_png = DOCS / "figure3_forest_plot.png"
-            cmd = [args.py, str(PLOTS/"forest_plot_multidrug.py"),
-                   "--table", str(src),
-                   "--out", str(out_png)]
-            run(cmd, dry_run=args.dry_run)
+            out_tif = DOCS / "figure3_forest_plot.tif"
+            nodes.append(Node("fig3", PLOTS / "forest_plot_multidrug.py",
+                              ["--table", src, "--out", out_png, "--tif", out_tif],
+                              inputs=[src], outputs=[out_png, out_tif], stage="figures"))
         else:
             print("[SKIP] Figure 3: missing", src)
 
     # FIGURE 4 (volcano per drug)
-    if args.fig4 or args.all:
+    if "fig4" in figs:
         found = False
         for csv in sorted(DERIVED.glob("volcano_*.csv")):
             found = True
             drug = csv.stem.replace("volcano_","")
             out_png = DOCS / f"volcano_{drug}.png"
-            cmd = [args.py, str(PLOTS/"volcano_plot.py"),
-                   "--table", str(csv),
-                   "--out", str(out_png),
-                   "--title", drug.upper()]
-            run(cmd, dry_run=args.dry_run)
+            nodes.append(Node(f"fig4_{drug}", PLOTS / "volcano_plot.py",
+                              ["--table", csv, "--out", out_png, "--title", drug.upper()],
+                              inputs=[csv], outputs=[out_png], stage="figures"))
         if not found:
             print("[SKIP] Figure 4: no volcano_*.csv found under", DERIVED)
 
     # FIGURE 5 (TTO distributions per file)
-    if args.fig5 or args.all:
+    if "fig5" in figs:
         found = False
         for csv in sorted(DERIVED.glob("tto_*.csv")):
             found = True
             name = csv.stem.replace("tto_","")
             out_png = DOCS / f"figure5_tto_{name}.png"
-            cmd = [args.py, str(PLOTS/"figure5_tto_distribution.py"),
-                   "--table", str(csv),
-                   "--out", str(out_png)]
-            run(cmd, dry_run=args.dry_run)
+            out_tif = DOCS / f"figure5_tto_{name}.tif"
+            nodes.append(Node(f"fig5_{name}", PLOTS / "figure5_tto_distribution.py",
+                              ["--table", csv, "--out", out_png, "--tif", out_tif],
+                              inputs=[csv], outputs=[out_png, out_tif], stage="figures"))
         if not found:
             print("[SKIP] Figure 5: no tto_*.csv found under", DERIVED)
 
     # FIGURE 6 (KM raw)
-    if args.fig6 or args.all:
+    if "fig6" in figs:
         src = DERIVED / "figure6_km_source.csv"
         if src.exists():
             out_png = DOCS / "figure6_km_raw.png"
-            cmd = [args.py, str(PLOTS/"kaplan_meier_raw.py"),
-                   "--table", str(src),
-                   "--out", str(out_png)]
-            run(cmd, dry_run=args.dry_run)
+            nodes.append(Node("fig6", PLOTS / "kaplan_meier_raw.py",
+                              ["--table", src, "--out", out_png],
+                              inputs=[src], outputs=[out_png], stage="figures"))
         else:
             print("[SKIP] Figure 6: missing", src)
+    return nodes
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--fig2", action="store_true", help="Build Figure 2 (forest)")
+    ap.add_argument("--fig3", action="store_true", help="Build Figure 3 (stratified forest) if data present")
+    ap.add_argument("--fig4", action="store_true", help="Build Figure 4 (volcano) for each volcano_*.csv")
+    ap.add_argument("--fig5", action="store_true", help="Build Figure 5 (TTO distribution) for each tto_*.csv")
+    ap.add_argument("--fig6", action="store_true", help="Build Figure 6 (KM raw) if data present")
+    ap.add_argument("--all",  action="store_true", help="Build all (default if no flags)")
+    ap.add_argument("--prep", action="store_true", help="Run standardization (01_oab_standardize.py) before figures")
+    ap.add_argument("--prep-only", action="store_true", help="Run only standardization and exit")
+    ap.add_argument("--pipeline", default=None, help="JSON node list of upstream stages (see pipeline.py)")
+    ap.add_argument("--workers", type=int, default=None, help="Worker processes (default: CPU count)")
+    ap.add_argument("--force", action="store_true", help="Re-run nodes even if their inputs are unchanged")
+    ap.add_argument("--dry-run", action="store_true", help="Print commands without executing")
+    ap.add_argument("--py", default=sys.executable,
+                    help="Python executable; a different interpreter runs each node as a subprocess")
+    args = ap.parse_args()
+
+    py = None if Path(args.py).resolve() == Path(sys.executable).resolve() else args.py
+    upstream = nodes_from_config(args.pipeline) if args.pipeline else []
+    prep = prep_nodes() if (args.prep or args.prep_only) else []
+
+    if args.prep_only:
+        status = run_pipeline(upstream + prep, [n.name for n in prep] or None, args.workers,
+                              force=args.force, dry_run=args.dry_run, py=py) if prep else {}
+        sys.exit(1 if "failed" in status.values() else 0)
+
+    figs = [f for f in ("fig2", "fig3", "fig4", "fig5", "fig6") if getattr(args, f)]
+    if args.all or not figs:
+        figs = ["fig2", "fig3", "fig4", "fig5", "fig6"]
+
+    ensure_docs()
+
+    # Validate data (if validator exists)
+    validator = REPO / "raw_code" / "analysis" / "validate_data.py"
+    if validator.exists():
+        run([args.py, str(validator)], dry_run=args.dry_run)
+
+    nodes = upstream + prep + figure_nodes(figs)
+    targets = [n.name for n in nodes if n.stage in ("standardize", "figures")] if args.pipeline else None
+    if not nodes:
+        return
+    status = run_pipeline(nodes, targets, args.workers, force=args.force, dry_run=args.dry_run, py=py)
+    sys.exit(1 if "failed" in status.values() else 0)
 
 if __name__ == "__main__":
     main()
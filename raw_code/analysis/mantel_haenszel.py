@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+mantel_haenszel.py — stratum-adjusted ROR (Mantel–Haenszel, RBG 95% CI) + Breslow–Day test
+
+All functions work on 2-D count arrays shaped (groups, strata) — one row per drug
+(or DB x drug), one column per stratum — so every drug is pooled at once:
+  ROR_MH   = sum(a*d/n) / sum(b*c/n)
+  CI       : Robins–Breslow–Greenland variance of log(ROR_MH)
+  Breslow–Day homogeneity chi2 (df = informative strata - 1), with Tarone's correction
+Empty strata (n = 0) and padded cells contribute nothing; a/b/c/d = n11/n12/n21/n22.
+
+Frame front-end: rows shaped like figure3_stratified.csv (DB, drug_of_interest, Subgroup,
+n11, n12, n21, n22). Overlapping subgroups are pooled per partition (e.g. Male + Female
+= sex-adjusted), see DEFAULT_PARTITIONS.
+
+Usage (CLI):
+  python raw_code/analysis/mantel_haenszel.py --table data/derived/figure3_stratified.csv \
+    --out data/derived/figure3_mh_adjusted.csv
+"""
+import argparse
+import numpy as np
+import pandas as pd
+from scipy.stats import chi2 as chi2_dist
+
+# Subgroups of figure3_stratified.csv that partition the cases (per adjustment factor)
+DEFAULT_PARTITIONS = {
+    "sex":     ["Male", "Female"],
+    "ageband": ["20-60s", "70-90s"],
+    "poly5":   ["Drugs<5", "Drugs>=5"],
+}
+
+MH_COLUMNS = [
+    "n11", "strata", "ROR_crude", "ROR_MH", "ROR_MH025", "ROR_MH975",
+    "BD_chi2", "BD_df", "BD_p", "BD_Tarone_chi2", "BD_Tarone_p",
+]
+
+
+def _as_2d(*arrays):
+    out = [np.atleast_2d(np.asarray(x, dtype=float)) for x in arrays]
+    return [np.nan_to_num(x, nan=0.0) for x in out]   # NaN padding = empty stratum
+
+
+def mh_ror(n11, n12, n21, n22, z=1.96):
+    """
+    Mantel–Haenszel pooled ROR with Robins–Breslow–Greenland CI, per row.
+    Returns dict: ROR_MH, ROR_MH025, ROR_MH975, se_log (arrays of length groups).
+    """
+    a, b, c, d = _as_2d(n11, n12, n21, n22)
+    n = a + b + c + d
+    with np.errstate(divide="ignore", invalid="ignore"):
+        inv_n = np.where(n > 0, 1.0 / n, 0.0)
+        R = a * d * inv_n
+        S = b * c * inv_n
+        P = (a + d) * inv_n
+        Q = (b + c) * inv_n
+        sR, sS = R.sum(axis=1), S.sum(axis=1)
+        ror = sR / sS
+        var = ((P * R).sum(axis=1) / (2 * sR**2)
+               + (P * S + Q * R).sum(axis=1) / (2 * sR * sS)
+               + (Q * S).sum(axis=1) / (2 * sS**2))
+        se = np.sqrt(var)
+        lo = np.exp(np.log(ror) - z * se)
+        hi = np.exp(np.log(ror) + z * se)
+
+    # NaN/Inf handling as in disproportionality.compute_metric_arrays
+    sanitize = lambda v: np.nan_to_num(v, nan=0, posinf=np.inf, neginf=0)
+    return {"ROR_MH": sanitize(ror), "ROR_MH025": sanitize(lo), "ROR_MH975": sanitize(hi), "se_log": se}
+
+
+def _expected_a(odds, m1, n1, N):
+    """
+    Expected n11 per stratum given the margins and a common odds ratio (row-wise `odds`):
+    root of (1-OR)A^2 + (N-m1-n1+OR(m1+n1))A - OR*m1*n1 = 0 within the feasible range.
+    """
+    OR = odds[:, None]
+    lo = np.maximum(0.0, m1 + n1 - N)
+    hi = np.minimum(m1, n1)
+    qa = 1.0 - OR
+    qb = N - m1 - n1 + OR * (m1 + n1)
+    qc = -OR * m1 * n1
+    with np.errstate(divide="ignore", invalid="ignore"):
+        disc = np.sqrt(np.maximum(qb**2 - 4 * qa * qc, 0.0))
+        q = -0.5 * (qb + np.where(qb >= 0, 1.0, -1.0) * disc)
+        r1, r2 = q / qa, qc / q
+        linear = -qc / qb                      # OR == 1 -> m1*n1/N
+    tol = 1e-7 * np.maximum(1.0, hi)
+    in1 = (r1 >= lo - tol) & (r1 <= hi + tol)
+    A = np.where(np.abs(qa) < 1e-12, linear, np.where(in1, r1, r2))
+    return np.clip(np.nan_to_num(A, nan=0.0), lo, hi)
+
+
+def breslow_day(n11, n12, n21, n22, odds=None):
+    """
+    Breslow–Day test of a common odds ratio across strata, per row (with Tarone's correction).
+    odds defaults to the MH estimate. Only strata with non-degenerate margins count toward df.
+    Returns dict: BD_chi2, BD_df, BD_p, BD_Tarone_chi2, BD_Tarone_p.
+    """
+    a, b, c, d = _as_2d(n11, n12, n21, n22)
+    if odds is None:
+        odds = mh_ror(a, b, c, d)["ROR_MH"]
+    odds = np.asarray(odds, dtype=float)
+    m1, n1 = a + b, a + c
+    N = a + b + c + d
+    ok_odds = np.isfinite(odds) & (odds > 0)
+
+    A = _expected_a(np.where(ok_odds, odds, 1.0), m1, n1, N)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        var = 1.0 / (1.0 / A + 1.0 / (m1 - A) + 1.0 / (n1 - A) + 1.0 / (N - m1 - n1 + A))
+    informative = (m1 > 0) & (n1 > 0) & (m1 < N) & (n1 < N) & np.isfinite(var) & (var > 0)
+    var = np.where(informative, var, 0.0)
+    resid = np.where(informative, a - A, 0.0)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        bd = np.where(informative, resid**2 / np.where(var > 0, var, 1.0), 0.0).sum(axis=1)
+        tarone = bd - resid.sum(axis=1)**2 / var.sum(axis=1)
+    df = informative.sum(axis=1) - 1
+    valid = ok_odds & (df >= 1)
+    bd = np.where(valid, bd, np.nan)
+    tarone = np.where(valid, tarone, np.nan)
+    return {
+        "BD_chi2": bd, "BD_df": df,
+        "BD_p": np.where(valid, chi2_dist.sf(bd, np.maximum(df, 1)), np.nan),
+        "BD_Tarone_chi2": tarone,
+        "BD_Tarone_p": np.where(valid, chi2_dist.sf(tarone, np.maximum(df, 1)), np.nan),
+    }
+
+
+def mh_summary(n11, n12, n21, n22):
+    """Crude (collapsed) ROR, MH ROR with RBG CI and Breslow–Day per row, as a dict of arrays."""
+    a, b, c, d = _as_2d(n11, n12, n21, n22)
+    mh = mh_ror(a, b, c, d)
+    bd = breslow_day(a, b, c, d, odds=mh["ROR_MH"])
+    A, B, C, D = a.sum(axis=1), b.sum(axis=1), c.sum(axis=1), d.sum(axis=1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        crude = np.nan_to_num((A * D) / (B * C), nan=0, posinf=np.inf, neginf=0)
+    out = {"n11": A.astype(np.int64), "strata": (a + b + c + d > 0).sum(axis=1), "ROR_crude": crude}
+    out.update({k: mh[k] for k in ("ROR_MH", "ROR_MH025", "ROR_MH975")})
+    out.update(bd)
+    return out
+
+
+def pivot_strata(df: pd.DataFrame, subgroups, by=("DB", "drug_of_interest")):
+    """
+    Long stratified rows -> (keys DataFrame, n11, n12, n21, n22) arrays shaped (groups, len(subgroups)).
+    Missing subgroup rows become empty strata.
+    """
+    by = [c for c in by if c in df.columns]
+    sub = df[df["Subgroup"].isin(subgroups)]
+    wide = sub.pivot_table(index=by, columns="Subgroup", values=["n11", "n12", "n21", "n22"],
+                           aggfunc="sum", fill_value=0)
+    keys = wide.index.to_frame(index=False)
+    cells = [wide[k].reindex(columns=list(subgroups), fill_value=0).to_numpy(dtype=float)
+             for k in ("n11", "n12", "n21", "n22")]
+    return keys, *cells
+
+
+def mh_table(df: pd.DataFrame, partitions=DEFAULT_PARTITIONS, by=("DB", "drug_of_interest")) -> pd.DataFrame:
+    """figure3-style rows -> one row per (DB, drug, adjusted_for) with MH ROR and Breslow–Day."""
+    frames = []
+    for factor, subgroups in partitions.items():
+        keys, a, b, c, d = pivot_strata(df, subgroups, by=by)
+        res = mh_summary(a, b, c, d)
+        part = keys.copy()
+        part["adjusted_for"] = factor
+        for k in MH_COLUMNS:
+            part[k] = res[k]
+        frames.append(part)
+    return pd.concat(frames, ignore_index=True)
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--table", required=True, help="Stratified CSV (figure3_stratified.csv layout)")
+    ap.add_argument("--out", required=True)
+    args = ap.parse_args()
+
+    df = pd.read_csv(args.table)
+    out = mh_table(df)
+    out.to_csv(args.out, index=False)
+    print(f"[WRITE] {args.out} ({len(out):,} rows)")
+
+
+if __name__ == "__main__":
+    main()
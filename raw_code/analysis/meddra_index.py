@@ -0,0 +1,339 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+meddra_index.py — MedDRA hierarchy index (LLT -> PT -> HLT -> HLGT -> SOC, SMQ) for event extraction
+
+Built once from the local MedDRA ASCII distribution ('$'-delimited *.asc: llt, pt, hlt, hlt_pt,
+hlgt, hlgt_hlt, soc, soc_hlgt, smq_list, smq_content; optional J-MedDRA llt_j/pt_j for the
+Japanese names used in JADER REAC) and saved as one .npz:
+  - PT axis: sorted PT codes; every term is an integer code, every PT an index on that axis
+  - descendant sets precomputed as CSR (ptr, pt_idx) per HLT / HLGT / SOC and per SMQ
+    (narrow = scope 2, broad = scope 1 or 2; child SMQs expanded recursively; inactive terms dropped)
+  - LLT -> PT and a name lookup (NFKC-lowered English/Japanese names of every level)
+
+Event definitions are plain config: {name: [term, ...]} or
+{name: {"terms": [...], "smq": [...], "scope": "narrow"|"broad", "exclude": [...]}}
+where a term is a code or a name of any level (resolved to all PTs below it).
+REAC rows (PT/LLT names or codes) -> per-case uint64 bitset (bit k = definition k) in one
+vectorized pass: distinct terms -> PT index -> definition bitmask lookup -> OR per case.
+
+Usage (CLI):
+  python raw_code/analysis/meddra_index.py build --meddra data/meddra/MedAscii [--jmeddra data/meddra/JMedAscii] \
+    --index data/cache/meddra_index.npz
+  python raw_code/analysis/meddra_index.py extract --index data/cache/meddra_index.npz --reac F_REAC.csv \
+    --definitions events.json --event AF --out F_AF.csv [--bits-out case_events.csv]
+"""
+import argparse
+import json
+import os
+import re
+import unicodedata
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from counts2x2 import ID_CANDIDATES, resolve_col
+
+LEVELS = ("SOC", "HLGT", "HLT", "PT", "LLT", "SMQ")
+TERM_CANDIDATES = ("pt", "pt_code", "llt_code", "有害事象")
+
+# column positions in the MedDRA ASCII files
+ASC_COLUMNS = {
+    "llt": {"llt_code": 0, "llt_name": 1, "pt_code": 2, "llt_currency": 9},
+    "pt": {"pt_code": 0, "pt_name": 1},
+    "hlt": {"hlt_code": 0, "hlt_name": 1},
+    "hlgt": {"hlgt_code": 0, "hlgt_name": 1},
+    "soc": {"soc_code": 0, "soc_name": 1},
+    "hlt_pt": {"hlt_code": 0, "pt_code": 1},
+    "hlgt_hlt": {"hlgt_code": 0, "hlt_code": 1},
+    "soc_hlgt": {"soc_code": 0, "hlgt_code": 1},
+    "smq_list": {"smq_code": 0, "smq_name": 1},
+    "smq_content": {"smq_code": 0, "term_code": 1, "term_level": 2, "term_scope": 3, "term_status": 6},
+    "llt_j": {"llt_code": 0, "llt_kanji": 1},
+    "pt_j": {"pt_code": 0, "pt_kanji": 1},
+}
+_SMQ_CHILD, _SMQ_PT, _SMQ_LLT = 0, 4, 5
+_SCOPE_BROAD, _SCOPE_NARROW = 1, 2
+
+
+def normalize_name(s) -> str:
+    return unicodedata.normalize("NFKC", str(s)).strip().lower()
+
+
+def read_asc(directory, name, encoding="latin-1"):
+    """One MedDRA .asc file (case-insensitive name) -> DataFrame with ASC_COLUMNS names; None if absent."""
+    directory = Path(directory)
+    hits = [p for p in directory.iterdir() if p.name.lower() == f"{name}.asc"]
+    if not hits or hits[0].stat().st_size <= 1:
+        return None
+    cols = ASC_COLUMNS[name]
+    df = pd.read_csv(hits[0], sep="$", header=None, dtype=str, usecols=list(cols.values()),
+                     encoding=encoding, quoting=3, keep_default_na=False, na_values=[""])
+    df = df.rename(columns={v: k for k, v in cols.items()})
+    for c in df.columns:
+        if c.endswith("_code") or c in ("term_level", "term_scope"):
+            df[c] = pd.to_numeric(df[c], errors="coerce").astype("Int64")
+    return df
+
+
+def _csr(groups, members, n_groups):
+    """(group idx, member idx) pairs -> CSR ptr/idx with distinct sorted members per group."""
+    pair = pd.DataFrame({"g": groups, "m": members}).drop_duplicates().sort_values(["g", "m"])
+    ptr = np.zeros(n_groups + 1, dtype=np.int64)
+    np.cumsum(np.bincount(pair["g"].to_numpy(), minlength=n_groups), out=ptr[1:])
+    return ptr, pair["m"].to_numpy(dtype=np.int32)
+
+
+def _expand_smq(content, llt_pt, scopes):
+    """SMQ -> PT pairs for the given scopes, child SMQs expanded until closed."""
+    c = content[content["term_status"].fillna("A").str.upper().eq("A")]
+    direct = c[c["term_level"].isin([_SMQ_PT, _SMQ_LLT]) & c["term_scope"].isin(scopes)]
+    llt = direct[direct["term_level"] == _SMQ_LLT].merge(llt_pt, left_on="term_code", right_on="llt_code")
+    pts = pd.concat([
+        direct.loc[direct["term_level"] == _SMQ_PT, ["smq_code", "term_code"]].rename(columns={"term_code": "pt_code"}),
+        llt[["smq_code", "pt_code"]],
+    ]).drop_duplicates()
+    child = c.loc[c["term_level"] == _SMQ_CHILD, ["smq_code", "term_code"]] \
+        .rename(columns={"smq_code": "parent", "term_code": "child"})
+    while len(child):
+        add = child.merge(pts, left_on="child", right_on="smq_code")[["parent", "pt_code"]] \
+            .rename(columns={"parent": "smq_code"})
+        merged = pd.concat([pts, add]).drop_duplicates()
+        if len(merged) == len(pts):
+            break
+        pts = merged
+    return pts
+
+
+def build_index(meddra_dir, jmeddra_dir=None, encoding="latin-1", j_encoding="cp932"):
+    """ASCII distribution -> index dict of numpy arrays (see module docstring)."""
+    t = {n: read_asc(meddra_dir, n, encoding) for n in
+         ("llt", "pt", "hlt", "hlgt", "soc", "hlt_pt", "hlgt_hlt", "soc_hlgt", "smq_list", "smq_content")}
+    if t["llt"] is None or t["pt"] is None:
+        raise FileNotFoundError(f"llt.asc / pt.asc not found in {meddra_dir}")
+    pt_codes = np.sort(t["pt"]["pt_code"].dropna().unique().to_numpy(dtype=np.int64))
+    pt_pos = pd.Index(pt_codes)
+    llt_pt = t["llt"][["llt_code", "pt_code"]].dropna()
+
+    index = {"pt_codes": pt_codes,
+             "llt_codes": llt_pt["llt_code"].to_numpy(dtype=np.int64),
+             "llt_pt_idx": pt_pos.get_indexer(llt_pt["pt_code"]).astype(np.int32)}
+
+    # HLT / HLGT / SOC -> PT, composed through the hierarchy link files
+    hlt_pt = t["hlt_pt"] if t["hlt_pt"] is not None else pd.DataFrame(columns=["hlt_code", "pt_code"])
+    hlgt_pt = (t["hlgt_hlt"].merge(hlt_pt, on="hlt_code") if t["hlgt_hlt"] is not None
+               else pd.DataFrame(columns=["hlgt_code", "pt_code"]))
+    soc_pt = (t["soc_hlgt"].merge(hlgt_pt, on="hlgt_code") if t["soc_hlgt"] is not None
+              else pd.DataFrame(columns=["soc_code", "pt_code"]))
+    smq = t["smq_content"]
+    smq_sets = {}
+    if smq is not None:
+        smq_sets["smq_narrow"] = _expand_smq(smq, llt_pt, [_SCOPE_NARROW])
+        smq_sets["smq_broad"] = _expand_smq(smq, llt_pt, [_SCOPE_BROAD, _SCOPE_NARROW])
+    groups = {"hlt": (hlt_pt, "hlt_code"), "hlgt": (hlgt_pt, "hlgt_code"), "soc": (soc_pt, "soc_code")}
+    groups.update({k: (v, "smq_code") for k, v in smq_sets.items()})
+    for key, (pairs, col) in groups.items():
+        pairs = pairs.dropna()
+        codes = np.sort(pairs[col].unique().astype(np.int64)) if len(pairs) else np.zeros(0, dtype=np.int64)
+        g = pd.Index(codes).get_indexer(pairs[col].astype(np.int64))
+        m = pt_pos.get_indexer(pairs["pt_code"].astype(np.int64))
+        ok = m >= 0
+        index[f"{key}_codes"] = codes
+        index[f"{key}_ptr"], index[f"{key}_idx"] = _csr(g[ok], m[ok], len(codes))
+
+    # name lookup (all levels; English + optional Japanese)
+    names, levels, codes = [], [], []
+
+    def add(df, name_col, code_col, level):
+        if df is None:
+            return
+        df = df[[name_col, code_col]].dropna()
+        names.extend(df[name_col].map(normalize_name))
+        levels.extend([LEVELS.index(level)] * len(df))
+        codes.extend(df[code_col].astype(np.int64))
+
+    add(t["soc"], "soc_name", "soc_code", "SOC")
+    add(t["hlgt"], "hlgt_name", "hlgt_code", "HLGT")
+    add(t["hlt"], "hlt_name", "hlt_code", "HLT")
+    add(t["pt"], "pt_name", "pt_code", "PT")
+    add(t["llt"], "llt_name", "llt_code", "LLT")
+    add(t["smq_list"], "smq_name", "smq_code", "SMQ")
+    if jmeddra_dir:
+        add(read_asc(jmeddra_dir, "pt_j", j_encoding), "pt_kanji", "pt_code", "PT")
+        add(read_asc(jmeddra_dir, "llt_j", j_encoding), "llt_kanji", "llt_code", "LLT")
+    index["names"] = np.asarray(names, dtype=str)
+    index["name_level"] = np.asarray(levels, dtype=np.int8)
+    index["name_code"] = np.asarray(codes, dtype=np.int64)
+    return index
+
+
+def save_index(index, path):
+    """Index -> .npz (temp file + replace)."""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + ".tmp.npz")
+    np.savez(tmp, **index)
+    os.replace(tmp, path)
+
+
+def load_index(path):
+    with np.load(path) as z:
+        return {k: z[k] for k in z.files}
+
+
+def _members(index, key, code):
+    codes = index[f"{key}_codes"]
+    i = np.searchsorted(codes, code)
+    if i >= len(codes) or codes[i] != code:
+        return np.zeros(0, dtype=np.int32)
+    return index[f"{key}_idx"][index[f"{key}_ptr"][i]:index[f"{key}_ptr"][i + 1]]
+
+
+def _lookup(index, term):
+    """Term (code or name) -> list of (level, code); names may exist on several levels (PT = LLT)."""
+    if isinstance(term, (int, np.integer)) or re.fullmatch(r"\s*\d+\s*", str(term)):
+        code = int(term)
+        hits = [("PT", code)] if np.isin(code, index["pt_codes"]) else []
+        hits += [("LLT", code)] if np.isin(code, index["llt_codes"]) else []
+        for key, level in (("hlt", "HLT"), ("hlgt", "HLGT"), ("soc", "SOC"),
+                           ("smq_narrow", "SMQ"), ("smq_broad", "SMQ")):
+            if f"{key}_codes" in index and np.isin(code, index[f"{key}_codes"]):
+                hits.append((level, code))
+        return list(dict.fromkeys(hits))
+    m = np.flatnonzero(index["names"] == normalize_name(term))
+    return list(dict.fromkeys((LEVELS[index["name_level"][i]], int(index["name_code"][i])) for i in m))
+
+
+def resolve(index, term, scope="narrow") -> np.ndarray:
+    """Any term / SMQ (code or name) -> sorted PT index array (positions on index['pt_codes'])."""
+    out = []
+    for level, code in _lookup(index, term):
+        if level == "PT":
+            out.append(np.searchsorted(index["pt_codes"], [code]))
+        elif level == "LLT":
+            out.append(index["llt_pt_idx"][index["llt_codes"] == code])
+        elif level == "SMQ":
+            out.append(_members(index, f"smq_{scope}", code))
+        else:
+            out.append(_members(index, level.lower(), code))
+    if not out:
+        raise KeyError(f"MedDRA term not found: {term!r}")
+    return np.unique(np.concatenate(out).astype(np.int32))
+
+
+def resolve_definition(index, spec) -> np.ndarray:
+    """Config entry (list of terms, or dict terms/smq/scope/exclude) -> PT index set."""
+    if not isinstance(spec, dict):
+        spec = {"terms": spec}
+    scope = spec.get("scope", "narrow")
+    terms = list(spec.get("terms", [])) + list(spec.get("smq", []))
+    pts = np.unique(np.concatenate([resolve(index, t, scope) for t in terms])) if terms \
+        else np.zeros(0, dtype=np.int32)
+    if spec.get("exclude"):
+        drop = np.concatenate([resolve(index, t, scope) for t in spec["exclude"]])
+        pts = np.setdiff1d(pts, drop)
+    return pts.astype(np.int32)
+
+
+def term_pt_index(index, terms) -> np.ndarray:
+    """REAC term values (PT/LLT names or codes) -> PT index (-1 unknown); resolved per distinct value."""
+    codes, uniq = pd.factorize(pd.Series(terms), use_na_sentinel=True)
+    out_u = np.full(len(uniq) + 1, -1, dtype=np.int64)
+    u = pd.Series(np.asarray(uniq, dtype=object))
+    num = pd.to_numeric(u, errors="coerce")
+    # codes: PT directly, else LLT -> PT
+    pt_hit = pd.Index(index["pt_codes"]).get_indexer(num.fillna(-1).astype(np.int64))
+    llt_hit = pd.Index(index["llt_codes"]).get_indexer(num.fillna(-1).astype(np.int64))
+    llt_pt = np.where(llt_hit >= 0, index["llt_pt_idx"][np.maximum(llt_hit, 0)], -1)
+    res = np.where(pt_hit >= 0, pt_hit, llt_pt)
+    # names: PT names first, then LLT names
+    need = (res < 0) & num.isna().to_numpy()
+    if need.any():
+        lookup = pd.DataFrame({"name": index["names"], "level": index["name_level"], "code": index["name_code"]})
+        lookup = lookup[lookup["level"].isin([LEVELS.index("PT"), LEVELS.index("LLT")])]
+        pt_idx = np.where(lookup["level"] == LEVELS.index("PT"),
+                          pd.Index(index["pt_codes"]).get_indexer(lookup["code"]),
+                          np.full(len(lookup), -1))
+        llt_i = pd.Index(index["llt_codes"]).get_indexer(lookup["code"])
+        pt_idx = np.where(pt_idx >= 0, pt_idx, np.where(llt_i >= 0, index["llt_pt_idx"][np.maximum(llt_i, 0)], -1))
+        lookup = lookup.assign(pt_idx=pt_idx, rank=lookup["level"]).sort_values("rank") \
+            .drop_duplicates("name").set_index("name")["pt_idx"]
+        names = u[need].map(normalize_name)
+        res[need] = names.map(lookup).fillna(-1).to_numpy(dtype=np.int64)
+    out_u[:-1] = res
+    return out_u[np.where(codes < 0, len(uniq), codes)]
+
+
+def event_bits(index, case_ids, reac_case_ids, reac_terms, definitions):
+    """
+    Per-case event bitset (uint64, bit k = k-th definition) in one pass over REAC.
+    definitions: {name: PT index array} (resolve_definition output), at most 64.
+    Returns (universe ids, bits, definition names).
+    """
+    names = list(definitions)
+    if len(names) > 64:
+        raise ValueError("At most 64 event definitions per bitset")
+    pt_mask = np.zeros(len(index["pt_codes"]) + 1, dtype=np.uint64)     # last slot: unknown term
+    for k, name in enumerate(names):
+        pt_mask[np.asarray(definitions[name], dtype=np.int64)] |= np.uint64(1) << np.uint64(k)
+
+    universe = pd.unique(pd.Series(case_ids).dropna())
+    case_code = pd.Index(universe).get_indexer(pd.Index(reac_case_ids))
+    pt_idx = term_pt_index(index, reac_terms)
+    row_bits = pt_mask[np.where(pt_idx < 0, len(pt_mask) - 1, pt_idx)]
+    ok = (case_code >= 0) & (row_bits != 0)
+    bits = np.zeros(len(universe), dtype=np.uint64)
+    np.bitwise_or.at(bits, case_code[ok], row_bits[ok])
+    return np.asarray(universe), bits, names
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    b = sub.add_parser("build", help="MedDRA ASCII files -> index .npz")
+    b.add_argument("--meddra", required=True, help="Directory with llt.asc, pt.asc, hlt_pt.asc, smq_content.asc, ...")
+    b.add_argument("--jmeddra", default=None, help="J-MedDRA directory (llt_j.asc, pt_j.asc) for Japanese names")
+    b.add_argument("--encoding", default="latin-1")
+    b.add_argument("--index", required=True)
+    e = sub.add_parser("extract", help="REAC -> event case list / per-case bitsets")
+    e.add_argument("--index", required=True)
+    e.add_argument("--reac", required=True, help="REAC CSV [id, pt / 有害事象 / pt_code]")
+    e.add_argument("--term-col", default=None)
+    e.add_argument("--definitions", required=True, help="JSON {name: [terms] | {terms, smq, scope, exclude}}")
+    e.add_argument("--event", default=None, help="Definition written to --out as the case list (F_AF layout)")
+    e.add_argument("--out", default=None, help="Case list CSV [id] for --event")
+    e.add_argument("--bits-out", default=None, help="Per-case CSV [id, bits, <definition>...]")
+    args = ap.parse_args()
+
+    if args.cmd == "build":
+        index = build_index(args.meddra, args.jmeddra, encoding=args.encoding)
+        save_index(index, args.index)
+        print(f"[WRITE] {args.index} ({len(index['pt_codes']):,} PTs, {len(index['names']):,} names)")
+        return
+
+    index = load_index(args.index)
+    config = json.loads(Path(args.definitions).read_text(encoding="utf-8"))
+    defs = {name: resolve_definition(index, spec) for name, spec in config.items()}
+    for name, pts in defs.items():
+        print(f"[EVENT] {name}: {len(pts)} PTs")
+    reac = pd.read_csv(args.reac)
+    id_col = resolve_col(reac, *ID_CANDIDATES)
+    term_col = args.term_col or resolve_col(reac, *TERM_CANDIDATES)
+    ids, bits, names = event_bits(index, reac[id_col], reac[id_col], reac[term_col], defs)
+
+    if args.out:
+        event = args.event or names[0]
+        k = np.uint64(1) << np.uint64(names.index(event))
+        pd.DataFrame({id_col: ids[(bits & k) != 0]}).to_csv(args.out, index=False)
+        print(f"[WRITE] {args.out} ({event})")
+    if args.bits_out:
+        out = pd.DataFrame({id_col: ids, "bits": bits})
+        for k, name in enumerate(names):
+            out[name] = ((bits >> np.uint64(k)) & np.uint64(1)).astype(np.int8)
+        out[bits != 0].to_csv(args.bits_out, index=False)
+        print(f"[WRITE] {args.bits_out}")
+
+
+if __name__ == "__main__":
+    main()
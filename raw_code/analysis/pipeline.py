@@ -0,0 +1,276 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+pipeline.py — in-process DAG runner with content-hash caching
+
+Nodes are CLI scripts (stage scripts, plots) with declared inputs and outputs:
+  Node(name, script, args, inputs=[...], outputs=[...], params={...}, after=[...], stage="figures")
+  - edges: a node depends on every node producing one of its inputs (plus `after` names)
+  - cache key: hash of the script source, the local modules it can import (`code`; default:
+    every *.py next to the script and in raw_code/analysis), its argv/params and the content of
+    every input (file digests memoized on size + mtime); a node is skipped when the key is
+    unchanged and all outputs exist. Keys are kept in a JSON state file written after each node.
+  - execution: ready nodes run concurrently in a process pool; each worker runs scripts
+    in-process (runpy, sys.argv set per node), so pandas/matplotlib/scipy are imported once
+    per worker instead of once per script. A failed node skips its dependents.
+  - py=<python executable> runs nodes as subprocesses instead (other interpreter).
+
+Pipelines of stages (ingest -> dedup -> standardize -> counts -> metrics -> figures) can be
+declared in JSON: [{"name", "script", "args", "inputs", "outputs", "params", "after", "stage", "code"}];
+relative paths are resolved against the repo root.
+
+Usage (CLI):
+  python raw_code/analysis/pipeline.py --config pipeline.json [--target NAME ...] [--workers 4] \
+    [--force] [--dry-run]
+"""
+import argparse
+import hashlib
+import json
+import os
+import runpy
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from pathlib import Path
+
+REPO = Path(__file__).resolve().parents[2]  # repo root
+ANALYSIS = REPO / "raw_code" / "analysis"
+STATE_FILE = REPO / "data" / "derived" / ".pipeline_state.json"
+
+
+class Node:
+    """One step: script + argv with declared inputs/outputs (paths), local code and extra cache params."""
+
+    def __init__(self, name, script, args=(), inputs=(), outputs=(), params=None, after=(), stage=None,
+                 code=None):
+        self.name = name
+        self.script = Path(script)
+        self.args = [str(a) for a in args]
+        self.inputs = [Path(p) for p in inputs]
+        self.outputs = [Path(p) for p in outputs]
+        self.params = dict(params or {})
+        self.after = list(after)
+        self.stage = stage
+        self.code = [Path(p) for p in code] if code is not None else local_modules(self.script)
+
+    def command(self, py=None):
+        return [str(py or sys.executable), str(self.script), *self.args]
+
+
+def nodes_from_config(path):
+    """JSON list of node dicts -> [Node]; relative paths are taken from the repo root."""
+    def resolve(p):
+        p = Path(p)
+        return p if p.is_absolute() else REPO / p
+
+    spec = json.loads(Path(path).read_text(encoding="utf-8"))
+    return [Node(d["name"], resolve(d["script"]), d.get("args", []),
+                 [resolve(p) for p in d.get("inputs", [])], [resolve(p) for p in d.get("outputs", [])],
+                 d.get("params"), d.get("after", []), d.get("stage"),
+                 [resolve(p) for p in d["code"]] if "code" in d else None) for d in spec]
+
+
+# ---- hashing / state ----
+
+def local_modules(script):
+    """Modules a script can import from the repo: *.py next to it and in raw_code/analysis."""
+    script = Path(script)
+    dirs = dict.fromkeys([script.parent.resolve(), ANALYSIS.resolve()])
+    return sorted({p for d in dirs for p in d.glob("*.py")} - {script.resolve()})
+
+
+def file_digest(path, memo):
+    """blake2b of the file content; memoized on (size, mtime_ns) so unchanged files are not re-read."""
+    path = Path(path)
+    if not path.exists():
+        return "missing"
+    st = path.stat()
+    stamp = [st.st_size, st.st_mtime_ns]
+    hit = memo.get(str(path))
+    if hit and hit[0] == stamp:
+        return hit[1]
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    memo[str(path)] = [stamp, h.hexdigest()]
+    return h.hexdigest()
+
+
+def node_key(node, memo):
+    payload = {
+        "script": file_digest(node.script, memo),
+        "code": {str(p): file_digest(p, memo) for p in node.code},
+        "args": node.args,
+        "params": node.params,
+        "inputs": {str(p): file_digest(p, memo) for p in node.inputs},
+    }
+    return hashlib.blake2b(json.dumps(payload, sort_keys=True).encode("utf-8"), digest_size=16).hexdigest()
+
+
+def load_state(path):
+    path = Path(path)
+    if path.exists():
+        try:
+            return json.loads(path.read_text(encoding="utf-8"))
+        except ValueError:
+            pass
+    return {"nodes": {}, "files": {}}
+
+
+def save_state(state, path):
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + ".tmp")
+    tmp.write_text(json.dumps(state, indent=1), encoding="utf-8")
+    os.replace(tmp, path)
+
+
+# ---- execution ----
+
+def run_script(script, argv, py=None):
+    """Run one CLI script; in-process (runpy as __main__) unless `py` is given. Returns (rc, seconds)."""
+    t0 = time.perf_counter()
+    if py:
+        return subprocess.call([str(py), str(script), *argv]), time.perf_counter() - t0
+    script = str(script)
+    saved_argv, saved_path = sys.argv, list(sys.path)
+    sys.argv = [script, *argv]
+    sys.path.insert(0, str(Path(script).parent))
+    rc = 0
+    try:
+        runpy.run_path(script, run_name="__main__")
+    except SystemExit as e:
+        rc = e.code if isinstance(e.code, int) else (0 if e.code is None else 1)
+    except Exception as e:
+        print(f"[ERROR] {Path(script).name}: {type(e).__name__}: {e}", file=sys.stderr)
+        rc = 1
+    finally:
+        sys.argv, sys.path[:] = saved_argv, saved_path
+        plt = sys.modules.get("matplotlib.pyplot")
+        if plt is not None:
+            plt.close("all")
+            sys.modules["matplotlib"].rc_file_defaults()  # rcParams set by one script must not leak into the next
+    sys.stdout.flush()
+    return rc, time.perf_counter() - t0
+
+
+def _closure(nodes, targets):
+    """Selected nodes plus everything upstream of them."""
+    if not targets:
+        return list(nodes)
+    by_name = {n.name: n for n in nodes}
+    producer = {str(o): n.name for n in nodes for o in n.outputs}
+    keep, stack = set(), list(targets)
+    while stack:
+        name = stack.pop()
+        if name in keep:
+            continue
+        if name not in by_name:
+            raise KeyError(f"Unknown pipeline node: {name}")
+        keep.add(name)
+        node = by_name[name]
+        stack += [producer[str(p)] for p in node.inputs if str(p) in producer] + node.after
+    return [n for n in nodes if n.name in keep]
+
+
+def run_pipeline(nodes, targets=None, workers=None, state_path=STATE_FILE, force=False, dry_run=False, py=None):
+    """Run the DAG; returns {node name: "ran" | "cached" | "failed" | "skipped" | "dry"}."""
+    nodes = _closure(nodes, targets)
+    producer = {}
+    for n in nodes:
+        for o in n.outputs:
+            if producer.setdefault(str(o), n.name) != n.name:
+                raise ValueError(f"Output {o} is declared by both {producer[str(o)]} and {n.name}")
+    deps = {n.name: {producer[str(p)] for p in n.inputs if str(p) in producer} | set(n.after) for n in nodes}
+    by_name = {n.name: n for n in nodes}
+    state = load_state(state_path)
+    status = {}
+
+    def ready():
+        return [n for n in nodes if n.name not in status and n.name not in running
+                and all(status.get(d) in ("ran", "cached", "dry") for d in deps[n.name])]
+
+    def settle_blocked():
+        changed = True
+        while changed:
+            changed = False
+            for n in nodes:
+                if n.name not in status and any(status.get(d) in ("failed", "skipped") for d in deps[n.name]):
+                    status[n.name] = "skipped"
+                    print(f"[SKIP] {n.name}: upstream failed")
+                    changed = True
+
+    running, keys = {}, {}
+    workers = max(1, workers or os.cpu_count() or 1)
+    pool = ProcessPoolExecutor(max_workers=workers) if workers > 1 and not dry_run else None
+    try:
+        while True:
+            for n in ready():
+                keys[n.name] = node_key(n, state["files"])
+                fresh = state["nodes"].get(n.name) == keys[n.name] and all(p.exists() for p in n.outputs)
+                if fresh and not force:
+                    status[n.name] = "cached"
+                    print(f"[CACHED] {n.name}")
+                    continue
+                if dry_run:
+                    status[n.name] = "dry"
+                    print("[DRY] ", " ".join(n.command(py)))
+                    continue
+                for p in n.outputs:
+                    p.parent.mkdir(parents=True, exist_ok=True)
+                print("[RUN] ", " ".join(n.command(py)))
+                if pool is None:
+                    _finish(n, run_script(n.script, n.args, py), status, state, keys)
+                    save_state(state, state_path)
+                else:
+                    running[n.name] = pool.submit(run_script, n.script, n.args, py)
+            settle_blocked()
+            if not running:
+                if ready():
+                    continue
+                break
+            done, _ = wait(list(running.values()), return_when=FIRST_COMPLETED)
+            for name in [k for k, f in running.items() if f in done]:
+                _finish(by_name[name], running.pop(name).result(), status, state, keys)
+            save_state(state, state_path)
+    finally:
+        if pool is not None:
+            pool.shutdown()
+    for n in nodes:
+        if n.name not in status:
+            status[n.name] = "skipped"
+            print(f"[SKIP] {n.name}: unresolved dependency {sorted(deps[n.name] - set(status))}")
+    return status
+
+
+def _finish(node, result, status, state, keys):
+    rc, seconds = result
+    if rc == 0:
+        status[node.name] = "ran"
+        state["nodes"][node.name] = keys[node.name]
+        print(f"[DONE] {node.name} ({seconds:.2f}s)")
+    else:
+        status[node.name] = "failed"
+        state["nodes"].pop(node.name, None)
+        print(f"[FAIL] {node.name} (exit {rc})")
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--config", required=True, help="Pipeline JSON (list of nodes)")
+    ap.add_argument("--target", action="append", default=None, help="Node(s) to build (default: all)")
+    ap.add_argument("--workers", type=int, default=None, help="Worker processes (default: CPU count)")
+    ap.add_argument("--state", default=str(STATE_FILE), help="Cache state JSON")
+    ap.add_argument("--force", action="store_true", help="Ignore the cache")
+    ap.add_argument("--dry-run", action="store_true", help="Print commands without executing")
+    args = ap.parse_args()
+
+    status = run_pipeline(nodes_from_config(args.config), args.target, args.workers, args.state,
+                          args.force, args.dry_run)
+    sys.exit(1 if "failed" in status.values() else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,287 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+scenario_runner.py — declarative sensitivity scenarios over one cached, integer-coded base
+
+The base is the case_table.py store (cases x flags, exposure pairs with role bits) plus named case sets
+(e.g. cases with a PS drug, AF in INDICATION) and named alternative exposure pair sets,
+all keyed by case_key and saved once as <store>/scenario_base.npz. A scenario is config:
+  {"include": [case sets], "exclude": [case sets],
+   "where": [[column, op, value], ...],      # sex/ageband/db by label (e.g. "Female"), age, number_of_drug
+   "exposure": "all" | <exposure set>,
+   "roles": "any" | "ps" | "ps_ss" | [role labels],   # bitwise filter on the exposure pairs' roles
+   "criteria": "main" | "conventional_prr" | [criteria dicts as in disproportionality.py],
+   "sanitize_ror": true | false}             # ROR NaN -> 0; default False for conventional_prr (as 04a)
+Each scenario is a boolean mask over the same case arrays; scenarios with the same mask and
+exposure share one count computation (bincount) and metric pass, and the distinct count
+computations run in a process pool. Output is one long table
+[scenario, db, drug_of_interest, N, nplus1, n1plus, <metrics>, IC_strength, met_*].
+
+Defaults mirror the documented flows: main, conventional_prr (04a, Scenario 1), ps_only
+(f50/j50, Scenario 2; case set "ps"), ps_exposure (PS-role exposure pairs only),
+af_indication_excluded (f60/j60, Scenario 3; case set "af_indication"). Scenarios whose case
+sets are not in the base, or that filter roles on exposures without role bits, are skipped.
+
+Usage (CLI):
+  python raw_code/analysis/scenario_runner.py base --store data/case_table \
+    --case-set ps FAERS F_PLID_PS.csv --case-set af_indication FAERS F_AF_INDI.csv \
+    [--exposure ps FAERS F_OAB_STD_PS.csv]
+  python raw_code/analysis/scenario_runner.py run --store data/case_table [--scenarios scenarios.json] \
+    [--db FAERS --db JADER] [--workers 4] --out data/derived/scenarios_long.csv
+"""
+import argparse
+import json
+import operator
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from case_table import (FLAG_EVENT, load_store, save_store, extend_dictionary, exposure_pairs, oab_roles,
+                        role_filter, case_keys)
+from counts2x2 import ID_CANDIDATES, resolve_col
+from disproportionality import (MAIN_CRITERIA, CONVENTIONAL_PRR_CRITERIA, compute_metric_arrays,
+                                metrics_frame, sanitize_ror_metrics)
+
+BASE_FILE = "scenario_base.npz"
+
+CRITERIA_SETS = {"main": MAIN_CRITERIA, "conventional_prr": CONVENTIONAL_PRR_CRITERIA}
+SANITIZE_ROR = {"main": True, "conventional_prr": False}   # as 01 / 04a; custom criteria: True
+
+DEFAULT_SCENARIOS = {
+    "main": {},
+    "conventional_prr": {"criteria": "conventional_prr"},
+    "ps_only": {"include": ["ps"]},
+    "ps_exposure": {"roles": "ps"},
+    "af_indication_excluded": {"exclude": ["af_indication"]},
+}
+
+_WHERE_OPS = {
+    ">": operator.gt, ">=": operator.ge, "<": operator.lt, "<=": operator.le,
+    "==": operator.eq, "!=": operator.ne,
+}
+_LABEL_COLUMNS = ("db", "sex", "ageband")
+
+
+# ---- base ----
+
+def load_base(store_dir):
+    """case_table store + case sets {name: bool[n_cases]} + exposures {name: (exp_case, exp_drug, exp_role)}."""
+    store = load_store(store_dir)
+    exp = store["exposure"]
+    base = {"store": store, "sets": {}, "exposures": {"all": (exp["exp_case"], exp["exp_drug"], exp["exp_role"])}}
+    path = Path(store_dir) / BASE_FILE
+    if path.exists():
+        with np.load(path) as z:
+            for k in z.files:
+                kind, name, *part = k.split("__")
+                if kind == "set":
+                    base["sets"][name] = z[k]
+                elif kind == "exp" and part == ["case"]:
+                    base["exposures"][name] = (z[k], z[f"exp__{name}__drug"], z[f"exp__{name}__role"])
+    return base
+
+
+def save_base(base, store_dir):
+    """Case sets / extra exposures -> scenario_base.npz (temp file + replace); dictionaries -> store."""
+    arrays = {f"set__{k}": v for k, v in base["sets"].items()}
+    for name, (case, drug, role) in base["exposures"].items():
+        if name != "all":
+            arrays[f"exp__{name}__case"], arrays[f"exp__{name}__drug"], arrays[f"exp__{name}__role"] = case, drug, role
+    path = Path(store_dir) / BASE_FILE
+    tmp = path.with_name(BASE_FILE + ".tmp.npz")
+    np.savez(tmp, **arrays)
+    os.replace(tmp, path)
+    save_store(base["store"], store_dir)
+
+
+def add_case_set(base, name, db, ids):
+    """Mark the cases of `db` whose id is in `ids` as members of case set `name` (other DBs kept)."""
+    n = len(base["store"]["ids"])
+    mask = base["sets"].get(name, np.zeros(n, dtype=bool)).copy()
+    mask[base["store"]["cases"]["db"] == base["store"]["dicts"]["db"].index(db)] = False
+    key = case_keys(base["store"], ids, db)
+    mask[key[key >= 0]] = True
+    base["sets"][name] = mask
+    return base
+
+
+def add_exposure(base, name, db, oab: pd.DataFrame):
+    """Alternative exposure pairs for `db` from an OAB_STD-style table [id, drug_of_interest(, role)]."""
+    store = base["store"]
+    case = case_keys(store, oab[resolve_col(oab, *ID_CANDIDATES)], db)
+    drug = extend_dictionary(store["dicts"]["drug"], oab[resolve_col(oab, "drug_of_interest")])
+    case, drug, role = exposure_pairs(case, drug, oab_roles(oab), len(store["dicts"]["drug"]))
+    db_code = store["dicts"]["db"].index(db)
+    old_case, old_drug, old_role = base["exposures"].get(
+        name, (np.zeros(0, np.int32), np.zeros(0, np.int16), np.zeros(0, np.uint8)))
+    keep = store["cases"]["db"][old_case] != db_code
+    base["exposures"][name] = (np.concatenate([old_case[keep], case]).astype(np.int32),
+                               np.concatenate([old_drug[keep], drug]).astype(np.int16),
+                               np.concatenate([old_role[keep], role]).astype(np.uint8))
+    return base
+
+
+# ---- scenarios ----
+
+def scenario_mask(base, spec, db=None):
+    """Boolean mask over cases for one scenario (and DB)."""
+    store = base["store"]
+    cases, dicts = store["cases"], store["dicts"]
+    mask = np.ones(len(cases["db"]), dtype=bool)
+    if db is not None:
+        mask &= cases["db"] == dicts["db"].index(db)
+    for name in spec.get("include", []):
+        mask &= base["sets"][name]
+    for name in spec.get("exclude", []):
+        mask &= ~base["sets"][name]
+    for col, op, value in spec.get("where", []):
+        if col in _LABEL_COLUMNS:
+            if value not in dicts[col]:
+                raise KeyError(f"{col} level {value!r} not in {dicts[col]}")
+            value = dicts[col].index(value)
+        vals = cases[col]
+        mask &= _WHERE_OPS[op](vals, value) & (vals >= 0 if col not in _LABEL_COLUMNS else True)
+    return mask
+
+
+def scenario_counts(base, mask, exposure="all", roles="any"):
+    """N, n+1 and per-drug n1+, n11 within the mask (exposure pairs filtered by the same mask and roles)."""
+    store = base["store"]
+    exp_case, exp_drug, exp_role = base["exposures"][exposure]
+    n_drugs = len(store["dicts"]["drug"])
+    is_event = (store["cases"]["flags"] & FLAG_EVENT).astype(bool) & mask
+    sel = mask[exp_case]
+    role_bits = role_filter(roles)
+    if role_bits is not None:
+        sel &= (exp_role & role_bits) != 0
+    drug = exp_drug[sel].astype(np.int64)
+    n1plus = np.bincount(drug, minlength=n_drugs)
+    n11 = np.bincount(drug, weights=is_event[exp_case[sel]], minlength=n_drugs).astype(np.int64)
+    return int(mask.sum()), int(is_event.sum()), n1plus, n11
+
+
+def _criteria(spec):
+    crit = spec.get("criteria", "main")
+    return CRITERIA_SETS[crit] if isinstance(crit, str) else crit
+
+
+def _sanitize_ror(spec):
+    crit = spec.get("criteria", "main")
+    return bool(spec.get("sanitize_ror", SANITIZE_ROR[crit] if isinstance(crit, str) else True))
+
+
+def _count_key(spec, db):
+    """Scenarios with the same key share counts and metrics (they differ only in criteria)."""
+    return json.dumps([db, sorted(spec.get("include", [])), sorted(spec.get("exclude", [])),
+                       spec.get("where", []), spec.get("exposure", "all"), spec.get("roles", "any")],
+                      ensure_ascii=False)
+
+
+_BASE = None
+
+
+def _init_worker(base):
+    global _BASE
+    _BASE = base
+
+
+def _run_group(task):
+    """One count computation + metric pass -> long rows for every scenario sharing it."""
+    db, spec, scenarios = task
+    base = _BASE
+    N, nplus1, n1plus, n11 = scenario_counts(base, scenario_mask(base, spec, db), spec.get("exposure", "all"),
+                                             spec.get("roles", "any"))
+    labels = np.asarray(base["store"]["dicts"]["drug"], dtype=object)
+    present = n1plus > 0
+    metrics = compute_metric_arrays(n11[present], n1plus[present], nplus1, N, sanitize_ror=False)
+    sanitized = None
+    frames = []
+    for name, criteria, sanitize_ror in scenarios:
+        if sanitize_ror and sanitized is None:
+            sanitized = sanitize_ror_metrics(metrics)
+        out = metrics_frame(sanitized if sanitize_ror else metrics, criteria, labels=labels[present])
+        out.insert(0, "scenario", name)
+        out.insert(1, "db", db if db is not None else "ALL")
+        out.insert(3, "N", N)
+        out.insert(4, "nplus1", nplus1)
+        out.insert(5, "n1plus", n1plus[present])
+        frames.append(out)
+    return frames
+
+
+def run_scenarios(base, scenarios=DEFAULT_SCENARIOS, dbs=None, workers=None):
+    """All scenarios x DBs -> one long DataFrame (count groups evaluated in a process pool)."""
+    dbs = list(dbs) if dbs else list(base["store"]["dicts"]["db"])
+    groups = {}
+    for name, spec in scenarios.items():
+        missing = [s for s in spec.get("include", []) + spec.get("exclude", []) if s not in base["sets"]]
+        exposure = spec.get("exposure", "all")
+        if exposure not in base["exposures"]:
+            missing.append(exposure)
+        elif role_filter(spec.get("roles", "any")) is not None and not base["exposures"][exposure][2].any():
+            missing.append(f"{exposure} role bits")
+        if missing:
+            print(f"[SKIP] {name}: not in base: {missing}")
+            continue
+        for db in dbs:
+            key = _count_key(spec, db)
+            groups.setdefault(key, (db, spec, []))[2].append((name, _criteria(spec), _sanitize_ror(spec)))
+    tasks = list(groups.values())
+    workers = min(workers or os.cpu_count() or 1, len(tasks))
+    if workers <= 1:
+        _init_worker(base)
+        results = [_run_group(t) for t in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(base,)) as pool:
+            results = list(pool.map(_run_group, tasks))
+    frames = [f for r in results for f in r]
+    if not frames:
+        return pd.DataFrame()
+    order = {name: i for i, name in enumerate(scenarios)}
+    out = pd.concat(frames, ignore_index=True)
+    out["_o"] = out["scenario"].map(order)
+    return out.sort_values(["_o", "db"], kind="stable").drop(columns="_o").reset_index(drop=True)
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    b = sub.add_parser("base", help="Add case sets / exposure sets to the scenario base")
+    b.add_argument("--store", required=True, help="case_table.py store directory")
+    b.add_argument("--case-set", nargs=3, action="append", default=[], metavar=("NAME", "DB", "CSV"),
+                   help="Case id list CSV -> case set NAME for DB (e.g. ps, af_indication)")
+    b.add_argument("--exposure", nargs=3, action="append", default=[], metavar=("NAME", "DB", "CSV"),
+                   help="OAB_STD-style CSV [id, drug_of_interest] -> exposure set NAME for DB")
+    r = sub.add_parser("run", help="Evaluate scenarios -> one long table")
+    r.add_argument("--store", required=True)
+    r.add_argument("--scenarios", default=None, help="JSON {name: spec} (default: main/conventional_prr/ps_only/af_indication_excluded)")
+    r.add_argument("--db", action="append", default=None, help="DB(s) to evaluate (default: all in the store)")
+    r.add_argument("--workers", type=int, default=None, help="Process pool size (default: CPU count)")
+    r.add_argument("--out", required=True)
+    args = ap.parse_args()
+
+    base = load_base(args.store)
+    if args.cmd == "base":
+        for name, db, path in args.case_set:
+            ids = pd.read_csv(path, dtype=str)
+            add_case_set(base, name, db, ids[resolve_col(ids, *ID_CANDIDATES)].dropna())
+            print(f"[SET] {name} ({db}): {int(base['sets'][name].sum()):,} cases")
+        for name, db, path in args.exposure:
+            add_exposure(base, name, db, pd.read_csv(path, dtype=str))
+            print(f"[EXPOSURE] {name} ({db}): {len(base['exposures'][name][0]):,} pairs")
+        save_base(base, args.store)
+        print(f"[WRITE] {Path(args.store) / BASE_FILE}")
+        return
+
+    scenarios = json.loads(Path(args.scenarios).read_text(encoding="utf-8")) if args.scenarios \
+        else DEFAULT_SCENARIOS
+    out = run_scenarios(base, scenarios, dbs=args.db, workers=args.workers)
+    out.to_csv(args.out, index=False)
+    print(f"[WRITE] {args.out} ({len(out):,} rows, {out['scenario'].nunique() if len(out) else 0} scenarios)")
+
+
+if __name__ == "__main__":
+    main()
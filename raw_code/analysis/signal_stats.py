@@ -0,0 +1,219 @@
+# -*- coding: utf-8 -*-
+"""
+signal_stats.py — array kernels shared by the disproportionality nodes
+
+- fisher_exact_batch: two-sided Fisher exact p (and log10 p) for many 2x2 tables at once.
+  Hypergeometric log-pmf math over the two "as extreme" tails of all tables at once
+  (bisection + pmf recurrence), so no per-row scipy.stats.fisher_exact call and no
+  walk over the full support; repeated tables are computed once per call (vectorized row dedup).
+- bcpnn_ic: BCPNN information component with 95% credibility interval over whole columns.
+
+Import from MSIP/CLI scripts placed in this folder:
+  from signal_stats import fisher_exact_batch, bcpnn_ic
+"""
+import numpy as np
+from scipy.special import betaln
+
+LN10 = np.log(10.0)
+
+# same relative tolerance scipy uses to collect tables "as extreme" as the observed one
+_FISHER_RTOL = 1 + 1e-7
+_FISHER_WINDOW_SD = 40
+
+
+def _logpmf(x, r1, c1, N):
+    """log P(X = x) for X ~ Hypergeom(N, r1, c1) (all arrays broadcastable)."""
+    # betaln form (as in scipy.stats.hypergeom): better conditioned than gammaln differences for large N
+    return (np.log(N + 1.0) - np.log(r1 + 1.0) - np.log(N - r1 + 1.0)
+            + betaln(N - c1 + 1, c1 + 1)
+            - betaln(x + 1, r1 - x + 1) - betaln(c1 - x + 1, N - r1 - c1 + x + 1))
+
+
+def _unique_rows(tab):
+    """np.unique(tab, axis=0, return_inverse=True) via lexsort (much faster on large int tables)."""
+    order = np.lexsort(tab.T[::-1])
+    srt = tab[order]
+    first = np.ones(len(srt), dtype=bool)
+    first[1:] = (srt[1:] != srt[:-1]).any(axis=1)
+    inv = np.empty(len(tab), dtype=np.int64)
+    inv[order] = np.cumsum(first) - 1
+    return srt[first], inv
+
+
+def _boundary(lp_at, left, right, thr, find_last):
+    """
+    Vectorized bisection on a monotone stretch of the log-pmf.
+    find_last=True : largest x in [left, right] with lp(x) <= thr (pmf rising; left-1 if none)
+    find_last=False: smallest x in [left, right] with lp(x) <= thr (pmf falling; right+1 if none)
+    """
+    # sentinels: find_last -> lp(a) <= thr, lp(b) > thr (b is the mode);
+    #            otherwise -> lp(a) > thr (a is the mode), lp(b) <= thr
+    a, b = left - 1, right + 1
+    active = b - a > 1
+    while active.any():
+        mid = (a + b) // 2
+        ok = np.zeros(len(a), dtype=bool)
+        ok[active] = lp_at(mid[active], active) <= thr[active]
+        if find_last:
+            a = np.where(active & ok, mid, a)
+            b = np.where(active & ~ok, mid, b)
+        else:
+            b = np.where(active & ok, mid, b)
+            a = np.where(active & ~ok, mid, a)
+        active = b - a > 1
+    return a if find_last else b
+
+
+def _fisher_logp_unique(tab, max_elems):
+    """
+    log two-sided p for unique integer tables (k, 4).
+
+    The hypergeometric pmf is log-concave, so the outcomes "as extreme" as the observed
+    one are the two tails [lo, bL] and [bR, hi] around the mode. bL/bR are found by
+    bisection; each tail is summed outward from its boundary only until the pmf has
+    dropped by ~e^-45 (local log-slope, capped at _FISHER_WINDOW_SD sd), using the
+    pmf ratio recurrence over the flattened segments of all tables (chunked by max_elems).
+    """
+    n11, n12, n21, n22 = (tab[:, i].astype(np.int64) for i in range(4))
+    r1 = n11 + n12
+    c1 = n11 + n21
+    N = r1 + n21 + n22
+    lo = np.maximum(0, r1 + c1 - N)
+    hi = np.minimum(r1, c1)
+    thr = _logpmf(n11, r1, c1, N) + np.log(_FISHER_RTOL)
+
+    Nf = np.maximum(N, 2).astype(float)
+    mode = np.clip(np.floor((r1 + 1) * (c1 + 1) / (Nf + 2)).astype(np.int64), lo, hi)
+    sd = np.sqrt(r1 * c1 * (Nf - r1) * (Nf - c1) / (Nf * Nf * (Nf - 1)))
+    cap = np.ceil(_FISHER_WINDOW_SD * sd).astype(np.int64) + 10
+
+    out = np.zeros(len(tab), dtype=float)
+    # observed table at least as probable as the mode -> every outcome counts, p = 1
+    todo = _logpmf(mode, r1, c1, N) > thr
+    if not todo.any():
+        return out
+    idx = np.flatnonzero(todo)
+    r1, c1, N, lo, hi, thr, mode, cap = (v[idx] for v in (r1, c1, N, lo, hi, thr, mode, cap))
+
+    lp_at = lambda x, m: _logpmf(x, r1[m], c1[m], N[m])
+    every = np.ones(len(idx), dtype=bool)
+    bL = _boundary(lp_at, lo, mode - 1, thr, find_last=True)
+    bR = _boundary(lp_at, mode + 1, hi, thr, find_last=False)
+
+    # tail lengths from the outward log-slope at each boundary
+    with np.errstate(divide="ignore", invalid="ignore", over="ignore"):
+        lpL, lpR = lp_at(bL, every), lp_at(bR, every)
+        slopeL = lpL - lp_at(bL - 1, every)
+        slopeR = lpR - lp_at(bR + 1, every)
+        nL = np.where(slopeL > 0, np.ceil(45.0 / slopeL), cap)
+        nR = np.where(slopeR > 0, np.ceil(45.0 / slopeR), cap)
+    nL = np.minimum(np.nan_to_num(nL, nan=0), cap).astype(np.int64)
+    nR = np.minimum(np.nan_to_num(nR, nan=0), cap).astype(np.int64)
+
+    # segments: left tail [sL, bL] walked upward, right tail [bR, eR]
+    sL = np.maximum(lo, bL - nL)
+    eR = np.minimum(hi, bR + nR)
+    seg_start = np.concatenate([sL, bR])
+    seg_size = np.concatenate([np.maximum(bL - sL + 1, 0), np.maximum(eR - bR + 1, 0)])
+    seg_tab = np.concatenate([np.arange(len(idx)), np.arange(len(idx))])
+    keep = seg_size > 0
+    seg_start, seg_size, seg_tab = seg_start[keep], seg_size[keep], seg_tab[keep]
+
+    m_seg = np.full(len(seg_start), -np.inf)
+    s_seg = np.zeros(len(seg_start))
+
+    # group consecutive segments into chunks whose flattened size fits max_elems
+    bounds = [0]
+    acc = 0
+    for i, sz in enumerate(seg_size):
+        if acc and acc + sz > max_elems:
+            bounds.append(i)
+            acc = 0
+        acc += sz
+    bounds.append(len(seg_size))
+
+    for a, b in zip(bounds[:-1], bounds[1:]):
+        sz = seg_size[a:b]
+        seg = np.repeat(np.arange(b - a), sz)
+        starts = np.concatenate(([0], np.cumsum(sz)[:-1]))
+        t = seg_tab[a:b]
+        x0 = seg_start[a:b]
+        x = x0[seg] + (np.arange(sz.sum()) - starts[seg])
+        # log pmf by recurrence: log p(x)/p(x-1) = log((r1-x+1)(c1-x+1)) - log(x (N-r1-c1+x))
+        rr, cc, nn = r1[t][seg], c1[t][seg], N[t][seg]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            inc = np.log(((rr - x + 1) * (cc - x + 1)).astype(float)) \
+                - np.log((x * (nn - rr - cc + x)).astype(float))
+        inc[starts] = 0.0
+        cs = np.cumsum(inc)
+        lp = _logpmf(x0, r1[t], c1[t], N[t])[seg] + (cs - cs[starts][seg])
+        m = np.maximum.reduceat(lp, starts)
+        m_seg[a:b] = m
+        s_seg[a:b] = np.add.reduceat(np.exp(lp - m[seg]), starts)
+
+    # combine the (up to) two tail segments per table in log space
+    m_tab = np.full(len(idx), -np.inf)
+    np.maximum.at(m_tab, seg_tab, m_seg)
+    s_tab = np.zeros(len(idx))
+    np.add.at(s_tab, seg_tab, s_seg * np.exp(m_seg - m_tab[seg_tab]))
+    with np.errstate(divide="ignore"):
+        out[idx] = np.minimum(m_tab + np.log(s_tab), 0.0)
+    return out
+
+
+def fisher_exact_batch(n11, n12, n21, n22, max_elems=5_000_000):
+    """
+    Two-sided Fisher exact test for arrays of 2x2 tables.
+
+    Returns (p, log10_p) as float arrays. log10_p stays finite where p underflows
+    to 0.0, so downstream -log10(p) (volcano y-axis) keeps extreme signals apart.
+    Rows with missing/negative counts yield NaN. Identical tables are computed once
+    (lexsort-unique of the int64 rows).
+    """
+    n = int(np.broadcast(np.asarray(n11), np.asarray(n12),
+                         np.asarray(n21), np.asarray(n22)).size)
+    cells = np.column_stack([np.broadcast_to(np.asarray(v, dtype=float), (n,))
+                             for v in (n11, n12, n21, n22)])
+    valid = np.isfinite(cells).all(axis=1) & (cells >= 0).all(axis=1)
+
+    logp = np.full(n, np.nan)
+    if valid.any():
+        tab = np.rint(cells[valid]).astype(np.int64)
+        uniq, inv = _unique_rows(tab)
+        logp[valid] = _fisher_logp_unique(uniq, max_elems)[inv]
+
+    return np.exp(logp), logp / LN10
+
+
+def bcpnn_ic(n11, n1plus, nplus1, N, alpha=2, beta=2, alpha1=1, beta1=1, gamma11=1,
+             z=2.0, decimals=3):
+    """
+    BCPNN IC with credibility interval E[IC] -/+ z*sd, vectorized over rows.
+
+    n11/n1plus are per-row; nplus1 and N may be scalars (single event) or per-row arrays.
+    Priors follow the original node (alpha=beta=2, alpha1=beta1=1, gamma11=1).
+    decimals=None skips rounding. Returns (IC, IC025, IC975) as float arrays.
+    """
+    a = np.asarray(n11, dtype=float)
+    a1 = np.asarray(n1plus, dtype=float)
+    a2 = np.asarray(nplus1, dtype=float)
+    N = np.asarray(N, dtype=float)
+    ln2_sq = 1 / (np.log(2)) ** 2
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        gamma_total = gamma11 * (N + alpha) * (N + beta) / ((a1 + alpha1) * (a2 + beta1))
+
+        num_eic = (a + gamma11) * (N + alpha) * (N + beta)
+        den_eic = (N + gamma_total) * (a1 + alpha1) * (a2 + beta1)
+        e_ic = np.log2(num_eic / den_eic)
+
+        v1 = (N - a + gamma_total - gamma11) / ((a + gamma11) * (N + gamma_total))
+        v2 = (N - a1 + alpha - alpha1) / ((a1 + alpha1) * (N + alpha))
+        v3 = (N - a2 + beta - beta1) / ((a2 + beta1) * (N + beta))
+        sd = np.sqrt(ln2_sq * (v1 + v2 + v3))
+
+    ic025 = e_ic - z * sd
+    ic975 = e_ic + z * sd
+    if decimals is not None:
+        e_ic, ic025, ic975 = (np.round(v, decimals) for v in (e_ic, ic025, ic975))
+    return e_ic, ic025, ic975
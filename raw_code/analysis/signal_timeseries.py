@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+signal_timeseries.py — cumulative-by-quarter disproportionality time series + first signal quarter
+
+Time-indexed count store: every case is assigned to its report quarter (fda_dt / init_fda_dt /
+report date), and one bincount gives the per-quarter increments
+  N[q], nplus1[q], n1plus[drug, q], n11[drug, q].
+Prefix sums (cumsum over q) give the counts at every cutoff quarter, so ROR/PRR/IC with CIs
+(and the met_* criteria) for every drug x cutoff come from one compute_metric_arrays call
+instead of re-running 01_disproportionality on truncated data.
+
+Outputs:
+  - tidy time series [drug_of_interest, quarter, n11..n22, ROR.., IC.., met_*]
+  - first-signal table [drug_of_interest, first_<criterion>..., signal_at_end_<criterion>...]
+
+Usage (CLI):
+  python raw_code/analysis/signal_timeseries.py --plid F_PLID.csv --oab F_OAB_STD.csv --af F_AF.csv \
+    --out data/derived/signal_timeseries.csv --first-out data/derived/first_signal.csv [--store ts.npz]
+"""
+import argparse
+import re
+import warnings
+import numpy as np
+import pandas as pd
+
+from counts2x2 import index_ids, unique_int, resolve_col, ID_CANDIDATES
+from disproportionality import compute_metric_arrays, metrics_frame, evaluate_criteria, MAIN_CRITERIA
+
+DATE_CANDIDATES = ("fda_dt", "init_fda_dt", "rept_dt", "event_dt", "report_date", "報告日")
+
+_QUARTER_RE = re.compile(r"^\s*(\d{4})\s*[-/]?\s*Q([1-4])\s*$", re.IGNORECASE)
+UNPARSED_WARN = 0.05  # warn when more than this share of non-missing dates cannot be parsed
+
+
+def quarter_index(values):
+    """
+    Dates (YYYYMMDD ints/strings, ISO dates) or 'YYYYQn' labels -> int quarter index
+    (year * 4 + quarter - 1); -1 where unparseable.
+    Numeric input (YYYYMMDD read as float64 because of blanks) is taken as integers first,
+    so 20240315.0 parses like 20240315.
+    """
+    s = pd.Series(values)
+    if pd.api.types.is_numeric_dtype(s.dtype) and not pd.api.types.is_bool_dtype(s.dtype):
+        txt = s.where(s % 1 == 0).astype("Int64").astype("string")
+    else:
+        txt = s.astype("string").str.strip().str.replace(r"^(\d{8})\.0+$", r"\1", regex=True)
+    out = np.full(len(s), -1, dtype=np.int64)
+
+    m = txt.str.extract(_QUARTER_RE)
+    is_q = m[0].notna().to_numpy()
+    if is_q.any():
+        out[is_q] = m[0][is_q].astype(int).to_numpy() * 4 + m[1][is_q].astype(int).to_numpy() - 1
+
+    rest = ~is_q & txt.notna().to_numpy()
+    if rest.any():
+        r = txt[rest]
+        ymd = r.str.fullmatch(r"\d{8}").fillna(False).to_numpy()
+        dt = pd.Series(pd.NaT, index=r.index, dtype="datetime64[ns]")
+        dt[ymd] = pd.to_datetime(r[ymd], format="%Y%m%d", errors="coerce")
+        dt[~ymd] = pd.to_datetime(r[~ymd], errors="coerce")
+        ok = dt.notna().to_numpy()
+        idx = np.flatnonzero(rest)
+        out[idx[ok]] = dt[ok].dt.year.to_numpy() * 4 + (dt[ok].dt.month.to_numpy() - 1) // 3
+
+    given = int(txt.notna().sum())
+    bad = int(((out < 0) & txt.notna().to_numpy()).sum())
+    if given and bad > UNPARSED_WARN * given:
+        warnings.warn(f"quarter_index: {bad:,} of {given:,} non-missing dates could not be parsed "
+                      f"(e.g. {txt[(out < 0) & txt.notna().to_numpy()].iloc[0]!r}); these cases are left out")
+    return out
+
+
+def quarter_label(qi):
+    qi = np.asarray(qi, dtype=np.int64)
+    return np.char.add(np.char.add((qi // 4).astype(str), "Q"), (qi % 4 + 1).astype(str))
+
+
+def build_store(case_ids, case_quarters, drug_case_ids, drug_tokens, event_case_ids, drugs=None):
+    """
+    Per-quarter count increments over the full quarter range (empty quarters included).
+    Cases without a parseable quarter are left out of the series.
+    Returns dict: quarters (int index), drugs, N, nplus1 (Q,), n1plus, n11 (drugs, Q).
+    """
+    cases = pd.DataFrame({"id": np.asarray(case_ids), "q": np.asarray(case_quarters, dtype=np.int64)})
+    cases = cases[(cases["q"] >= 0) & cases["id"].notna()].drop_duplicates(subset=["id"])
+    universe = cases["id"].to_numpy()
+    qidx = cases["q"].to_numpy()
+
+    q0 = int(qidx.min()) if len(qidx) else 0
+    n_q = int(qidx.max()) - q0 + 1 if len(qidx) else 0
+    qpos = qidx - q0
+
+    is_event = np.zeros(len(universe), dtype=bool)
+    ev = index_ids(universe, pd.Series(event_case_ids).dropna())
+    is_event[ev[ev >= 0]] = True
+
+    case_code = index_ids(universe, drug_case_ids)
+    tok = pd.Series(drug_tokens)
+    if drugs is None:
+        drug_code, labels = pd.factorize(tok)
+    else:
+        labels = pd.Index(drugs)
+        drug_code = labels.get_indexer(tok)
+    n_drugs = len(labels)
+    ok = (case_code >= 0) & (drug_code >= 0)
+    pair = unique_int(case_code[ok] * n_drugs + drug_code[ok])
+    pair_case, pair_drug = pair // n_drugs, pair % n_drugs
+
+    flat = pair_drug * n_q + qpos[pair_case]
+    return {
+        "quarters": np.arange(q0, q0 + n_q, dtype=np.int64),
+        "drugs": np.asarray(labels),
+        "N": np.bincount(qpos, minlength=n_q),
+        "nplus1": np.bincount(qpos, weights=is_event, minlength=n_q).astype(np.int64),
+        "n1plus": np.bincount(flat, minlength=n_drugs * n_q).reshape(n_drugs, n_q),
+        "n11": np.bincount(flat, weights=is_event[pair_case], minlength=n_drugs * n_q)
+                 .astype(np.int64).reshape(n_drugs, n_q),
+    }
+
+
+def save_store(store, path):
+    np.savez(path, **{k: (v.astype(str) if k == "drugs" else v) for k, v in store.items()})
+
+
+def load_store(path):
+    with np.load(path) as z:
+        return {k: z[k] for k in z.files}
+
+
+def cumulative_metrics(store, criteria=MAIN_CRITERIA, start=None):
+    """
+    Prefix sums over quarters -> metrics for every drug x cutoff quarter in one call.
+    start: optional first cutoff ('YYYYQn' or quarter index) to trim the leading quarters.
+    Returns (tidy DataFrame, masks {criterion: bool array (drugs, Q)}, cutoff quarter indices).
+    """
+    quarters = store["quarters"]
+    n_drugs, n_q = store["n11"].shape
+    N = np.cumsum(store["N"])
+    nplus1 = np.cumsum(store["nplus1"])
+    n1plus = np.cumsum(store["n1plus"], axis=1)
+    n11 = np.cumsum(store["n11"], axis=1)
+
+    sel = np.ones(n_q, dtype=bool)
+    if start is not None:
+        s0 = start if isinstance(start, (int, np.integer)) else int(quarter_index([start])[0])
+        sel = quarters >= s0
+    quarters, N, nplus1, n1plus, n11 = quarters[sel], N[sel], nplus1[sel], n1plus[:, sel], n11[:, sel]
+    n_q = len(quarters)
+
+    # drug-major flattening: row = drug * n_q + quarter
+    metrics = compute_metric_arrays(n11.ravel(), n1plus.ravel(),
+                                    np.tile(nplus1, n_drugs), np.tile(N, n_drugs))
+    out = metrics_frame(metrics, criteria, labels=np.repeat(store["drugs"], n_q))
+    out.insert(1, "quarter", np.tile(quarter_label(quarters), n_drugs))
+    out.insert(2, "N", np.tile(N, n_drugs))
+    masks = {k: (v == "Yes").reshape(n_drugs, n_q) for k, v in evaluate_criteria(metrics, criteria).items()}
+    return out, masks, quarters
+
+
+def first_signal(store_drugs, masks, quarters):
+    """First cutoff quarter at which each criterion is met, and whether it is still met at the end."""
+    out = pd.DataFrame({"drug_of_interest": np.asarray(store_drugs)})
+    labels = quarter_label(quarters)
+    for name, m in masks.items():
+        if m.shape[1] == 0:
+            out[f"first_{name}"], out[f"signal_at_end_{name}"] = None, "No"
+            continue
+        first = labels[np.argmax(m, axis=1)]
+        out[f"first_{name}"] = np.where(m.any(axis=1), first, None)
+        out[f"signal_at_end_{name}"] = np.where(m[:, -1], "Yes", "No")
+    return out
+
+
+def store_from_frames(plid: pd.DataFrame, oab: pd.DataFrame, af: pd.DataFrame, date_col=None, drugs=None):
+    id_col = resolve_col(plid, *ID_CANDIDATES)
+    date_col = date_col or resolve_col(plid, *DATE_CANDIDATES)
+    return build_store(
+        plid[id_col].to_numpy(), quarter_index(plid[date_col]),
+        oab[resolve_col(oab, *ID_CANDIDATES)], oab[resolve_col(oab, "drug_of_interest")],
+        af[resolve_col(af, *ID_CANDIDATES)], drugs=drugs,
+    )
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--plid", default=None, help="PLID CSV with id + report date (fda_dt / init_fda_dt / ...)")
+    ap.add_argument("--oab", default=None, help="OAB_STD CSV [id, drug_of_interest]")
+    ap.add_argument("--af", default=None, help="AF case list CSV [id]")
+    ap.add_argument("--date-col", default=None)
+    ap.add_argument("--store", default=None, help="Count store .npz: written when building, read when --plid is omitted")
+    ap.add_argument("--start", default=None, help="First cutoff quarter (e.g. 2012Q3)")
+    ap.add_argument("--out", required=True, help="Tidy time series CSV")
+    ap.add_argument("--first-out", default=None, help="First-signal quarter per drug CSV")
+    args = ap.parse_args()
+
+    if args.plid:
+        store = store_from_frames(pd.read_csv(args.plid), pd.read_csv(args.oab), pd.read_csv(args.af),
+                                  date_col=args.date_col)
+        if args.store:
+            save_store(store, args.store)
+            print(f"[WRITE] {args.store}")
+    elif args.store:
+        store = load_store(args.store)
+    else:
+        ap.error("--plid/--oab/--af or --store is required")
+
+    ts, masks, quarters = cumulative_metrics(store, start=args.start)
+    ts.to_csv(args.out, index=False)
+    print(f"[WRITE] {args.out} ({len(store['drugs'])} drugs x {len(quarters)} quarters)")
+    if args.first_out:
+        first_signal(store["drugs"], masks, quarters).to_csv(args.first_out, index=False)
+        print(f"[WRITE] {args.first_out}")
+
+
+if __name__ == "__main__":
+    main()
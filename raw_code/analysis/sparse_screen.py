@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+sparse_screen.py — database-wide drug x event (MedDRA PT) disproportionality screen
+
+Builds binary CSR incidence matrices (cases x drugs, cases x PTs) from DRUG/REAC rows,
+gets every n11 with one sparse product D.T @ E, and the marginals from column sums:
+  n1plus = cases per drug, nplus1 = cases per PT, N = cases in the universe.
+The long count table feeds disproportionality.compute_metric_arrays directly
+(per-row nplus1/N), so no per-drug MSIP run is needed.
+
+Usage (CLI):
+  python raw_code/analysis/sparse_screen.py \
+    --drug data/faers_DRUG.csv --reac data/faers_REAC.csv [--plid data/faers_PLID.csv] \
+    --out data/derived/screen_all_drug_pt.csv [--min-n11 3] [--counts-only] [--ebgm]
+"""
+import argparse
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+
+from counts2x2 import index_ids, resolve_col, ID_CANDIDATES
+from disproportionality import compute_metric_arrays, metrics_frame, MAIN_CRITERIA
+from ebgm import gps_metrics, EBGM_CRITERION
+
+DRUG_CANDIDATES = ("drug_of_interest", "prod_ai", "drugname", "医薬品（一般名）")
+PT_CANDIDATES = ("pt", "PT", "有害事象")
+
+
+def incidence_matrix(case_codes, item_codes, n_cases, n_items):
+    """Binary CSR (n_cases x n_items); duplicate (case, item) rows count once."""
+    case_codes = np.asarray(case_codes, dtype=np.int64)
+    item_codes = np.asarray(item_codes, dtype=np.int64)
+    ok = (case_codes >= 0) & (item_codes >= 0)
+    m = sp.csr_matrix(
+        (np.ones(int(ok.sum()), dtype=np.int32), (case_codes[ok], item_codes[ok])),
+        shape=(n_cases, n_items),
+    )
+    m.sum_duplicates()
+    m.data[:] = 1
+    return m
+
+
+def build_incidence(drug_case_ids, drug_names, reac_case_ids, reac_pts, case_ids=None):
+    """
+    Code cases/drugs/PTs to integers and build the two incidence matrices.
+
+    case_ids: optional case universe (e.g. deduplicated PLID); defaults to the union of
+    cases seen in DRUG and REAC. Rows outside the universe are dropped.
+    Returns (D, E, drug_labels, pt_labels).
+    """
+    if case_ids is None:
+        universe = pd.unique(pd.concat([pd.Series(drug_case_ids), pd.Series(reac_case_ids)],
+                                       ignore_index=True).dropna())
+    else:
+        universe = pd.unique(pd.Series(case_ids).dropna())
+
+    drug_code, drug_labels = pd.factorize(pd.Series(drug_names))
+    pt_code, pt_labels = pd.factorize(pd.Series(reac_pts))
+
+    D = incidence_matrix(index_ids(universe, drug_case_ids), drug_code, len(universe), len(drug_labels))
+    E = incidence_matrix(index_ids(universe, reac_case_ids), pt_code, len(universe), len(pt_labels))
+    return D, E, np.asarray(drug_labels), np.asarray(pt_labels)
+
+
+def screen_counts(D, E, drug_labels, pt_labels, min_n11=3):
+    """
+    All drug x PT cells with n11 >= min_n11 from one sparse product.
+    Returns DataFrame [drug_of_interest, pt, n11, n1plus, nplus1, N].
+    """
+    C = (D.T.tocsr() @ E).tocoo()
+    keep = C.data >= min_n11
+    drug_i, pt_j, n11 = C.row[keep], C.col[keep], C.data[keep].astype(np.int64)
+
+    n1plus = np.asarray(D.sum(axis=0)).ravel().astype(np.int64)
+    nplus1 = np.asarray(E.sum(axis=0)).ravel().astype(np.int64)
+    order = np.lexsort((pt_j, drug_i))
+    drug_i, pt_j, n11 = drug_i[order], pt_j[order], n11[order]
+
+    return pd.DataFrame({
+        "drug_of_interest": drug_labels[drug_i],
+        "pt": pt_labels[pt_j],
+        "n11": n11,
+        "n1plus": n1plus[drug_i],
+        "nplus1": nplus1[pt_j],
+        "N": np.int64(D.shape[0]),
+    })
+
+
+def screen_metrics(counts: pd.DataFrame, criteria=MAIN_CRITERIA, ebgm=False, trunc=1) -> pd.DataFrame:
+    """
+    Count table -> metrics (ROR/PRR/chi2/IC/Fisher + met_* flags) per drug x PT.
+    ebgm=True adds GPS EBGM/EB05/EB95 (prior fitted over all cells, truncated at `trunc`)
+    and the met_EBGM flag (EB05 >= 2).
+    """
+    cols = [counts[c].to_numpy() for c in ("n11", "n1plus", "nplus1", "N")]
+    metrics = compute_metric_arrays(*cols)
+    if ebgm:
+        eb = gps_metrics(*cols, trunc=trunc)
+        print("[GPS] prior:", {k: round(float(v), 4) for k, v in eb["prior"].items()})
+        metrics.update({k: eb[k] for k in ("EBGM", "EB05", "EB95")})
+        criteria = list(criteria) + [EBGM_CRITERION]
+    out = metrics_frame(metrics, criteria, labels=counts["drug_of_interest"])
+    out.insert(1, "pt", counts["pt"].to_numpy())
+    if ebgm:
+        pos = out.columns.get_loc("IC975") + 1
+        for i, k in enumerate(("EBGM", "EB05", "EB95")):
+            out.insert(pos + i, k, metrics[k])
+    return out
+
+
+def run_screen(drug: pd.DataFrame, reac: pd.DataFrame, plid: pd.DataFrame = None,
+               min_n11=3, counts_only=False, ebgm=False) -> pd.DataFrame:
+    """DataFrame front-end (column names resolved as in counts2x2)."""
+    D, E, drug_labels, pt_labels = build_incidence(
+        drug[resolve_col(drug, *ID_CANDIDATES)], drug[resolve_col(drug, *DRUG_CANDIDATES)],
+        reac[resolve_col(reac, *ID_CANDIDATES)], reac[resolve_col(reac, *PT_CANDIDATES)],
+        case_ids=None if plid is None else plid[resolve_col(plid, *ID_CANDIDATES)],
+    )
+    counts = screen_counts(D, E, drug_labels, pt_labels, min_n11=min_n11)
+    return counts if counts_only else screen_metrics(counts, ebgm=ebgm, trunc=min_n11)
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--drug", required=True, help="DRUG CSV [id, drug name/token]")
+    ap.add_argument("--reac", required=True, help="REAC CSV [id, pt]")
+    ap.add_argument("--plid", default=None, help="Optional case universe CSV (deduplicated)")
+    ap.add_argument("--out",  required=True)
+    ap.add_argument("--min-n11", type=int, default=3)
+    ap.add_argument("--counts-only", action="store_true", help="Write counts without metrics")
+    ap.add_argument("--ebgm", action="store_true", help="Add GPS EBGM/EB05/EB95 (ebgm.py)")
+    args = ap.parse_args()
+
+    drug = pd.read_csv(args.drug)
+    reac = pd.read_csv(args.reac)
+    plid = pd.read_csv(args.plid) if args.plid else None
+    out = run_screen(drug, reac, plid, min_n11=args.min_n11, counts_only=args.counts_only, ebgm=args.ebgm)
+    out.to_csv(args.out, index=False)
+    print(f"[WRITE] {args.out} ({len(out):,} drug x PT cells, n11 >= {args.min_n11})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,277 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+strata_cube.py — all-strata 2x2 count cube in one grouped pass (Figure 3 / volcano inputs)
+
+Replaces the per-stratum CASE expressions + count runs of msip/*/f30_strata_base.md and
+j30_strata_base.md. Every configured dimension (sex, ageband, poly5, ...) is encoded
+once as small-int codes; one bincount over the mixed-radix cell code gives
+  N[cell], nplus1[cell]                 (cases / AF cases per stratum cell)
+  n1plus[drug, cell], n11[drug, cell]   (exposed / exposed & AF per drug x cell)
+Each axis then gets an extra "All" level (sum over the axis), so every marginal and
+rollup (Male, 70-90s, Drugs>=5, Male x 70-90s, Overall, ...) is an index lookup.
+
+Dimension specs (list of dicts):
+  {"name": "sex", "column": ("sex", "性別"), "map": {"M": "Male", "男性": "Male", ...},
+   "levels": ["Male", "Female"]}
+  {"name": "ageband", "column": ("age", "AGE"), "bins": [20, 70, 100], "levels": ["20-60s", "70-90s"]}
+Values outside levels/bins are coded as the "NA" level (kept in N, excluded from
+the level strata, included in "All"), unless the spec names an "else" level
+(poly5: CASE WHEN number_of_drug >= 5 ... ELSE '<5').
+
+Dual interface:
+  (A) MSIP node: globals table (PLID + sex/age/number_of_drug), table1 (OAB_STD), table2 (AF)
+      -> result = long stratified metrics (one row per drug x Subgroup)
+  (B) CLI:
+  python raw_code/analysis/strata_cube.py --plid F_PLID.csv --oab F_OAB_STD.csv --af F_AF.csv \
+    --db FAERS --out data/derived/figure3_stratified.csv
+"""
+import argparse
+import numpy as np
+import pandas as pd
+
+try:
+    from msi.common.dataframe import pandas_to_dataframe as to_msi_df
+except Exception:
+    to_msi_df = None
+
+from counts2x2 import index_ids, unique_int, resolve_col, ID_CANDIDATES
+from disproportionality import compute_metric_arrays, metrics_frame, MAIN_CRITERIA
+
+NA_LEVEL = "NA"
+ALL_LEVEL = "All"
+
+DEFAULT_DIMENSIONS = [
+    {"name": "sex", "column": ("sex", "性別"),
+     "map": {"M": "Male", "F": "Female", "Male": "Male", "Female": "Female",
+             "男性": "Male", "女性": "Female"},
+     "levels": ["Male", "Female"]},
+    {"name": "ageband", "column": ("age", "AGE", "年齢数値"),
+     "bins": [20, 70, 100], "levels": ["20-60s", "70-90s"]},
+    {"name": "poly5", "column": ("number_of_drug", "drug_count", "服薬数"),
+     "bins": [0, 5, np.inf], "levels": ["Drugs<5", "Drugs>=5"], "else": "Drugs<5"},
+]
+
+# Subgroup rows in the order used by figure3_stratified.csv / volcano_*.csv
+DEFAULT_SUBGROUPS = [
+    ("Male",     {"sex": "Male"}),
+    ("Female",   {"sex": "Female"}),
+    ("20-60s",   {"ageband": "20-60s"}),
+    ("70-90s",   {"ageband": "70-90s"}),
+    ("Drugs<5",  {"poly5": "Drugs<5"}),
+    ("Drugs>=5", {"poly5": "Drugs>=5"}),
+    ("Overall",  {}),
+]
+
+
+def encode_dimension(values, spec):
+    """Small-int codes 0..k-1 for spec['levels'], k for NA (unmapped / out of range)."""
+    k = len(spec["levels"])
+    na_code = spec["levels"].index(spec["else"]) if "else" in spec else k
+    s = pd.Series(values)
+    if "bins" in spec:
+        num = pd.to_numeric(s, errors="coerce")
+        codes = pd.cut(num, bins=spec["bins"], right=False, labels=False)
+        codes = codes.to_numpy(dtype=float)
+    else:
+        lab = s.map(spec["map"]) if "map" in spec else s
+        codes = pd.Index(spec["levels"]).get_indexer(lab).astype(float)
+        codes[codes < 0] = np.nan
+    return np.where(np.isnan(codes), na_code, codes).astype(np.int8)
+
+
+class StrataCube:
+    """Count cube with an extra NA and All level per axis (shape: k_d + 2 per dimension)."""
+
+    def __init__(self, dims, drugs, N, nplus1, n1plus, n11):
+        self.dims = dims
+        self.drugs = np.asarray(drugs)
+        self.N, self.nplus1, self.n1plus, self.n11 = N, nplus1, n1plus, n11
+
+    def _index(self, where):
+        idx = []
+        for d in self.dims:
+            lvl = where.get(d["name"], ALL_LEVEL)
+            if lvl == ALL_LEVEL:
+                idx.append(len(d["levels"]) + 1)
+            elif lvl == NA_LEVEL:
+                idx.append(len(d["levels"]))
+            else:
+                idx.append(d["levels"].index(lvl))
+        return tuple(idx)
+
+    def counts(self, subgroups=DEFAULT_SUBGROUPS):
+        """Long table [drug_of_interest, Subgroup, n11, n12, n21, n22, N, n1plus, nplus1]."""
+        frames = []
+        for label, where in subgroups:
+            ix = self._index(where)
+            n11 = self.n11[(slice(None),) + ix]
+            n1plus = self.n1plus[(slice(None),) + ix]
+            N, nplus1 = self.N[ix], self.nplus1[ix]
+            frames.append(pd.DataFrame({
+                "drug_of_interest": self.drugs, "Subgroup": label,
+                "n11": n11, "n12": n1plus - n11, "n21": nplus1 - n11,
+                "n22": N - n1plus - nplus1 + n11,
+                "N": N, "n1plus": n1plus, "nplus1": nplus1,
+            }))
+        out = pd.concat(frames, ignore_index=True)
+        # drug-major order, subgroups in the given order (as in figure3_stratified.csv)
+        order = {lab: i for i, (lab, _) in enumerate(subgroups)}
+        drug_order = {d: i for i, d in enumerate(self.drugs)}
+        key = out["drug_of_interest"].map(drug_order) * len(order) + out["Subgroup"].map(order)
+        return out.iloc[np.argsort(key.to_numpy(), kind="stable")].reset_index(drop=True)
+
+    def cross_cells(self, names):
+        """
+        Joint strata of the named dimensions (NA levels excluded, other dimensions summed)
+        -> (stratum labels, n11, n12, n21, n22) with arrays shaped (drugs, strata);
+        direct input for mantel_haenszel.mh_summary (e.g. sex x ageband x poly5 adjustment).
+        """
+        grids = [d["levels"] if d["name"] in names else [ALL_LEVEL] for d in self.dims]
+        combos = pd.MultiIndex.from_product(grids).tolist()
+        labels, ix = [], []
+        for combo in combos:
+            where = {d["name"]: lvl for d, lvl in zip(self.dims, combo) if lvl != ALL_LEVEL}
+            labels.append(" & ".join(where.values()))
+            ix.append(self._index(where))
+        ix = tuple(np.array(i) for i in zip(*ix))
+        n11 = self.n11[(slice(None),) + ix]
+        n1plus = self.n1plus[(slice(None),) + ix]
+        N, nplus1 = self.N[ix][None, :], self.nplus1[ix][None, :]
+        return labels, n11, n1plus - n11, nplus1 - n11, N - n1plus - nplus1 + n11
+
+    def all_rollups(self):
+        """Every combination of (level | NA | All) across dimensions -> subgroup list."""
+        grids = [d["levels"] + [NA_LEVEL, ALL_LEVEL] for d in self.dims]
+        combos = pd.MultiIndex.from_product(grids).tolist()
+        subgroups = []
+        for combo in combos:
+            where = {d["name"]: lvl for d, lvl in zip(self.dims, combo) if lvl != ALL_LEVEL}
+            label = " & ".join(f"{k}={v}" for k, v in where.items()) or "Overall"
+            subgroups.append((label, where))
+        return subgroups
+
+
+def _add_all_levels(a, first_axis):
+    for ax in range(first_axis, a.ndim):
+        a = np.concatenate([a, a.sum(axis=ax, keepdims=True)], axis=ax)
+    return a
+
+
+def cell_codes(cases: pd.DataFrame, dims=DEFAULT_DIMENSIONS):
+    """Mixed-radix stratum cell code per row -> (int64 codes, cube shape without All levels)."""
+    shape = [len(d["levels"]) + 1 for d in dims]   # levels + NA
+    cell = np.zeros(len(cases), dtype=np.int64)
+    for d, k in zip(dims, shape):
+        col = d["column"] if isinstance(d["column"], str) else resolve_col(cases, *d["column"])
+        cell = cell * k + encode_dimension(cases[col].to_numpy(), d)
+    return cell, shape
+
+
+def base_counts(cell, is_event, pair_case, pair_drug, n_cells, n_drugs):
+    """
+    Flat (N, nplus1, n1plus, n11) for coded cases and distinct (case, drug) pairs:
+    N/nplus1 have n_cells entries, n1plus/n11 n_drugs * n_cells (drug-major).
+    """
+    N = np.bincount(cell, minlength=n_cells)
+    nplus1 = np.bincount(cell, weights=is_event, minlength=n_cells).astype(np.int64)
+    flat = pair_drug * n_cells + cell[pair_case]
+    n1plus = np.bincount(flat, minlength=n_drugs * n_cells)
+    n11 = np.bincount(flat, weights=is_event[pair_case], minlength=n_drugs * n_cells).astype(np.int64)
+    return N, nplus1, n1plus, n11
+
+
+def cube_from_base(dims, drugs, N, nplus1, n1plus, n11) -> StrataCube:
+    """Flat base counts (see base_counts) -> StrataCube with the NA/All levels per axis."""
+    shape = [len(d["levels"]) + 1 for d in dims]
+    n_drugs = len(drugs)
+    return StrataCube(
+        dims, np.asarray(drugs),
+        _add_all_levels(np.asarray(N).reshape(shape), 0),
+        _add_all_levels(np.asarray(nplus1).reshape(shape), 0),
+        _add_all_levels(np.asarray(n1plus).reshape([n_drugs] + shape), 1),
+        _add_all_levels(np.asarray(n11).reshape([n_drugs] + shape), 1),
+    )
+
+
+def build_cube(cases: pd.DataFrame, exposure: pd.DataFrame, events: pd.DataFrame,
+               dims=DEFAULT_DIMENSIONS, drugs=None) -> StrataCube:
+    """
+    cases    : one row per case (extra rows per case are dropped; first wins) with the
+               dimension columns
+    exposure : [id, drug_of_interest]
+    events   : [id] of cases with the event (AF)
+    """
+    id_col = resolve_col(cases, *ID_CANDIDATES)
+    cases = cases.drop_duplicates(subset=[id_col])
+    universe = cases[id_col].to_numpy()
+    n_cases = len(universe)
+
+    cell, shape = cell_codes(cases, dims)
+    n_cells = int(np.prod(shape))
+
+    is_event = np.zeros(n_cases, dtype=bool)
+    ev = index_ids(universe, events[resolve_col(events, *ID_CANDIDATES)].dropna())
+    is_event[ev[ev >= 0]] = True
+
+    case_code = index_ids(universe, exposure[resolve_col(exposure, *ID_CANDIDATES)])
+    tok = exposure[resolve_col(exposure, "drug_of_interest")]
+    if drugs is None:
+        drug_code, labels = pd.factorize(tok)
+    else:
+        labels = pd.Index(drugs)
+        drug_code = labels.get_indexer(tok)
+    n_drugs = len(labels)
+    ok = (case_code >= 0) & (drug_code >= 0)
+    pair = unique_int(case_code[ok] * n_drugs + drug_code[ok])
+    pair_case, pair_drug = pair // n_drugs, pair % n_drugs
+
+    # one grouped pass per quantity
+    counts = base_counts(cell, is_event, pair_case, pair_drug, n_cells, n_drugs)
+    return cube_from_base(dims, labels, *counts)
+
+
+def stratified_metrics(counts: pd.DataFrame, db=None, criteria=MAIN_CRITERIA) -> pd.DataFrame:
+    """
+    Long counts -> figure3-style rows [DB, drug_of_interest, Subgroup, n11.., ROR.., IC..].
+    p_value stays numeric as in figure3_stratified.csv / volcano_*.csv (log10_p kept for the volcano).
+    """
+    metrics = compute_metric_arrays(counts["n11"].to_numpy(), counts["n1plus"].to_numpy(),
+                                    counts["nplus1"].to_numpy(), counts["N"].to_numpy())
+    out = metrics_frame(metrics, criteria, labels=counts["drug_of_interest"])
+    out["p_value"] = metrics["p"]
+    out = out.drop(columns=["p"])
+    out.insert(1, "Subgroup", counts["Subgroup"].to_numpy())
+    if db is not None:
+        out.insert(0, "DB", db)
+    return out
+
+
+def main():
+    g = globals()
+    if "table" in g and "table1" in g and "table2" in g:
+        cube = build_cube(g["table"].to_pandas(), g["table1"].to_pandas(), g["table2"].to_pandas())
+        out_df = stratified_metrics(cube.counts(DEFAULT_SUBGROUPS))
+        g["result"] = to_msi_df(out_df) if to_msi_df else out_df
+        return
+
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--plid", required=True, help="Case table with id, sex, age, number_of_drug")
+    ap.add_argument("--oab",  required=True, help="OAB_STD CSV [id, drug_of_interest]")
+    ap.add_argument("--af",   required=True, help="AF case list CSV [id]")
+    ap.add_argument("--db",   default=None, help="DB label for the output (FAERS/JADER)")
+    ap.add_argument("--out",  required=True)
+    ap.add_argument("--all-rollups", action="store_true",
+                    help="Emit every level/NA/All combination instead of the Figure 3 subgroups")
+    ap.add_argument("--counts-only", action="store_true")
+    args = ap.parse_args()
+
+    cube = build_cube(pd.read_csv(args.plid), pd.read_csv(args.oab), pd.read_csv(args.af))
+    counts = cube.counts(cube.all_rollups() if args.all_rollups else DEFAULT_SUBGROUPS)
+    out = counts if args.counts_only else stratified_metrics(counts, db=args.db)
+    out.to_csv(args.out, index=False)
+    print(f"[WRITE] {args.out} ({len(out):,} rows)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,334 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+table_cache.py — persistent columnar cache of FAERS/JADER tables, partitioned by DB and quarter
+
+Layout (hive-style, one directory per partition):
+  <root>/DB=FAERS/table=DRUG/quarter=2023Q1/part-0.parquet         (pyarrow available)
+  <root>/DB=FAERS/table=DRUG/quarter=2023Q1/_meta.json + c000.npy  (fallback: numpy column files)
+Fallback format: one .npy per column, loaded with mmap_mode="r" so only touched pages are
+read. String columns are dictionary-encoded (int32 codes + fixed-width unicode categories);
+nullable ints keep a separate NA mask.
+
+Loads use
+  - projection: columns=[...] reads only those column files / Parquet columns
+  - predicate pushdown: filters=[(col, op, value), ...] (ops: == != < <= > >= in, not in);
+    DB/quarter filters prune partitions, other filters are evaluated on the (memmapped)
+    filter columns before any projected column is gathered (pyarrow: dataset filter).
+
+Usage:
+  from table_cache import load_table
+  drug = load_table("data/cache", "FAERS", "DRUG", columns=["primaryid", "drug_seq"])
+  ps = load_table("data/cache", "FAERS", "DRUG", columns=["primaryid", "prod_ai"],
+                  filters=[("role_cod", "in", ["PS"]), ("quarter", ">=", "2013Q1")])
+CLI:
+  python raw_code/analysis/table_cache.py ingest-faers --root data/cache --zip "data/raw/faers_ascii_*.zip"
+  python raw_code/analysis/table_cache.py ingest-csv --root data/cache --db JADER --table DRUG \
+    --csv data/jader_DRUG.csv --encoding cp932
+  python raw_code/analysis/table_cache.py ls --root data/cache
+"""
+import argparse
+import json
+import operator
+import shutil
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+try:
+    import pyarrow as pa
+    import pyarrow.dataset as pa_ds
+    import pyarrow.parquet as pq
+except Exception:
+    pa = None
+
+FAERS_TABLES = ("DEMO", "DRUG", "REAC", "OUTC", "INDI", "THER")
+PARTITION_KEYS = ("DB", "quarter")
+META = "_meta.json"
+PARQUET_PART = "part-0.parquet"
+
+_OPS = {
+    "==": operator.eq, "!=": operator.ne,
+    "<": operator.lt, "<=": operator.le,
+    ">": operator.gt, ">=": operator.ge,
+}
+
+
+def partition_dir(root, db, table, quarter):
+    return Path(root) / f"DB={db}" / f"table={table}" / f"quarter={quarter}"
+
+
+def list_partitions(root, db, table):
+    base = Path(root) / f"DB={db}" / f"table={table}"
+    if not base.exists():
+        return []
+    parts = [p for p in base.iterdir() if p.is_dir() and p.name.startswith("quarter=")]
+    return sorted(parts, key=lambda p: p.name)
+
+
+# ---- write ----
+def _write_npy(df: pd.DataFrame, out: Path):
+    cols = []
+    for i, c in enumerate(df.columns):
+        s = df[c]
+        stem = f"c{i:03d}"
+        entry = {"name": str(c), "file": stem}
+        if isinstance(s.dtype, pd.CategoricalDtype) or s.dtype == object or pd.api.types.is_string_dtype(s.dtype):
+            codes, cats = pd.factorize(s.astype(object), use_na_sentinel=True)
+            np.save(out / f"{stem}.npy", codes.astype(np.int32))
+            cats = np.asarray(cats, dtype=str) if len(cats) else np.zeros(0, dtype="<U1")
+            np.save(out / f"{stem}.cats.npy", cats)
+            entry["kind"] = "dict"
+        elif pd.api.types.is_datetime64_any_dtype(s.dtype):
+            np.save(out / f"{stem}.npy", s.to_numpy(dtype="datetime64[ns]"))
+            entry["kind"] = "plain"
+        elif pd.api.types.is_integer_dtype(s.dtype) and s.isna().any():
+            np.save(out / f"{stem}.npy", s.fillna(0).to_numpy(dtype=np.int64))
+            np.save(out / f"{stem}.na.npy", s.isna().to_numpy())
+            entry["kind"] = "masked"
+        else:
+            arr = s.to_numpy()
+            if arr.dtype == object:   # mixed numeric with NA -> float
+                arr = pd.to_numeric(s, errors="coerce").to_numpy(dtype=float)
+            np.save(out / f"{stem}.npy", arr)
+            entry["kind"] = "plain"
+        cols.append(entry)
+    (out / META).write_text(json.dumps({"rows": int(len(df)), "columns": cols}, ensure_ascii=False),
+                            encoding="utf-8")
+
+
+def write_partition(df: pd.DataFrame, root, db, table, quarter, fmt="auto"):
+    """Replace one (DB, table, quarter) partition; fmt: auto | parquet | npy."""
+    fmt = ("parquet" if pa is not None else "npy") if fmt == "auto" else fmt
+    if fmt == "parquet" and pa is None:
+        raise ImportError("pyarrow is required for fmt='parquet' (use fmt='npy')")
+    out = partition_dir(root, db, table, quarter)
+    tmp = out.with_name(out.name + ".tmp")
+    shutil.rmtree(tmp, ignore_errors=True)
+    tmp.mkdir(parents=True)
+    df = df.drop(columns=[c for c in ("quarter", "DB") if c in df.columns])
+    if fmt == "parquet":
+        pq.write_table(pa.Table.from_pandas(df, preserve_index=False), tmp / PARQUET_PART)
+    else:
+        _write_npy(df.reset_index(drop=True), tmp)
+    shutil.rmtree(out, ignore_errors=True)
+    tmp.rename(out)
+    return out
+
+
+# ---- read ----
+def _partition_value(part: Path):
+    return part.name.split("=", 1)[1]
+
+
+def _match_value(value, op, ref):
+    if op == "in":
+        return value in set(ref)
+    if op == "not in":
+        return value not in set(ref)
+    return _OPS[op](value, ref)
+
+
+def _mask_npy(part, meta, col, op, ref):
+    entry = next((c for c in meta["columns"] if c["name"] == col), None)
+    if entry is None:
+        raise KeyError(f"Filter column {col!r} not in {part}")
+    arr = np.load(part / f"{entry['file']}.npy", mmap_mode="r")
+    if entry["kind"] == "dict":
+        cats = np.load(part / f"{entry['file']}.cats.npy")
+        # evaluate once per category, then look the codes up (-1 = missing -> False)
+        lut = np.array([_match_value(v, op, ref) for v in cats.tolist()] + [False], dtype=bool)
+        return lut[np.where(arr < 0, len(cats), arr)]
+    vals = np.asarray(arr)
+    if op in ("in", "not in"):
+        m = np.isin(vals, np.asarray(list(ref)))
+        m = m if op == "in" else ~m
+    else:
+        m = _OPS[op](vals, ref)
+    if entry["kind"] == "masked":
+        m &= ~np.load(part / f"{entry['file']}.na.npy", mmap_mode="r")
+    return m
+
+
+def _read_npy(part: Path, columns, row_filters, as_category):
+    meta = json.loads((part / META).read_text(encoding="utf-8"))
+    mask = None
+    for col, op, ref in row_filters:
+        m = _mask_npy(part, meta, col, op, ref)
+        mask = m if mask is None else (mask & m)
+    idx = None if mask is None else np.flatnonzero(mask)
+
+    entries = meta["columns"] if columns is None else \
+        [e for c in columns for e in meta["columns"] if e["name"] == c]
+    data = {}
+    for e in entries:
+        arr = np.load(part / f"{e['file']}.npy", mmap_mode="r")
+        arr = np.asarray(arr if idx is None else arr[idx])
+        if e["kind"] == "dict":
+            cats = np.load(part / f"{e['file']}.cats.npy")
+            cat = pd.Categorical.from_codes(arr, categories=pd.Index(cats.astype(object)), validate=False)
+            data[e["name"]] = cat if as_category else np.asarray(cat, dtype=object)
+        elif e["kind"] == "masked":
+            na = np.load(part / f"{e['file']}.na.npy", mmap_mode="r")
+            na = np.asarray(na if idx is None else na[idx])
+            data[e["name"]] = pd.arrays.IntegerArray(arr.astype(np.int64), na)
+        else:
+            data[e["name"]] = arr
+    n = meta["rows"] if idx is None else len(idx)
+    return pd.DataFrame(data, index=pd.RangeIndex(n))
+
+
+def _arrow_filter(row_filters):
+    expr = None
+    for col, op, ref in row_filters:
+        f = pa_ds.field(col)
+        if op == "in":
+            e = f.isin(list(ref))
+        elif op == "not in":
+            e = ~f.isin(list(ref))
+        else:
+            e = {"==": f == ref, "!=": f != ref, "<": f < ref, "<=": f <= ref,
+                 ">": f > ref, ">=": f >= ref}[op]
+        expr = e if expr is None else (expr & e)
+    return expr
+
+
+def _read_parquet(part: Path, columns, row_filters, as_category):
+    dset = pa_ds.dataset(part / PARQUET_PART, format="parquet")
+    tbl = dset.to_table(columns=list(columns) if columns is not None else None,
+                        filter=_arrow_filter(row_filters))
+    return tbl.to_pandas(strings_to_categorical=as_category)
+
+
+def concat_frames(frames):
+    """Concatenate chunk/partition frames, keeping categorical columns categorical (union dictionary)."""
+    frames = [f for f in frames if len(f.columns)]
+    if not frames:
+        return pd.DataFrame()
+    if len(frames) == 1:
+        return frames[0]
+    cat_cols = list(dict.fromkeys(c for f in frames for c in f.columns
+                                  if isinstance(f[c].dtype, pd.CategoricalDtype)))
+    for c in cat_cols:   # unify dictionaries so the column stays categorical
+        ref = next(f[c].cat.categories.dtype for f in frames
+                   if c in f.columns and isinstance(f[c].dtype, pd.CategoricalDtype))
+        for f in frames:   # chunks that were not dictionary-encoded, or with other category dtypes
+            if c not in f.columns:
+                continue
+            if not isinstance(f[c].dtype, pd.CategoricalDtype):
+                f[c] = f[c].astype(ref).astype("category")
+            elif f[c].cat.categories.dtype != ref:
+                f[c] = f[c].cat.rename_categories(f[c].cat.categories.astype(ref))
+        u = union_categoricals([f[c] for f in frames if c in f.columns], ignore_order=True)
+        for f in frames:
+            if c in f.columns:
+                f[c] = pd.Categorical(f[c], categories=u.categories)
+    return pd.concat(frames, ignore_index=True)
+
+
+def load_table(root, db, table, columns=None, filters=None, as_category=True, add_quarter=False):
+    """
+    Load one cached table across partitions with column projection and predicate pushdown.
+    String columns come back as categoricals (as_category=False -> object strings).
+    """
+    filters = list(filters or [])
+    part_filters = [f for f in filters if f[0] in PARTITION_KEYS]
+    row_filters = [f for f in filters if f[0] not in PARTITION_KEYS]
+    if any(f[0] == "DB" and not _match_value(db, f[1], f[2]) for f in part_filters):
+        return pd.DataFrame(columns=columns)
+
+    frames = []
+    for part in list_partitions(root, db, table):
+        q = _partition_value(part)
+        if not all(_match_value(q, op, ref) for c, op, ref in part_filters if c == "quarter"):
+            continue
+        if (part / META).exists():
+            df = _read_npy(part, columns, row_filters, as_category)
+        elif (part / PARQUET_PART).exists():
+            if pa is None:
+                raise ImportError(f"{part} is Parquet; install pyarrow to read it")
+            df = _read_parquet(part, columns, row_filters, as_category)
+        else:
+            continue
+        if add_quarter:
+            df["quarter"] = q
+        frames.append(df)
+    if not frames:
+        return pd.DataFrame(columns=columns)
+    return concat_frames(frames)
+
+
+# ---- ingest ----
+def ingest_faers(root, zips, tables=FAERS_TABLES, fmt="auto", force=False):
+    """Quarterly FAERS zips -> one partition per (table, quarter); existing partitions are kept unless force."""
+    sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "faers"))
+    from faers_ascii import list_zips, iter_table, quarter_of
+
+    for z in list_zips(zips):
+        quarter = quarter_of(z) or Path(z).stem
+        for table in tables:
+            if not force and partition_dir(root, "FAERS", table, quarter).exists():
+                continue
+            try:
+                chunks = list(iter_table(z, table))
+            except KeyError:
+                print(f"[SKIP] {table} not in {z}")
+                continue
+            df = pd.concat(chunks, ignore_index=True) if chunks else pd.DataFrame()
+            write_partition(df, root, "FAERS", table, quarter, fmt=fmt)
+            print(f"[CACHE] FAERS {table} {quarter}: {len(df):,} rows")
+
+
+def ingest_csv(root, db, table, csv_path, quarter="ALL", quarter_col=None, encoding="utf-8", fmt="auto"):
+    """One CSV -> partition(s); split by quarter_col ('YYYYQn' values) when given."""
+    df = pd.read_csv(csv_path, encoding=encoding, low_memory=False)
+    if quarter_col:
+        for q, part in df.groupby(quarter_col, sort=True):
+            write_partition(part.reset_index(drop=True), root, db, table, str(q), fmt=fmt)
+            print(f"[CACHE] {db} {table} {q}: {len(part):,} rows")
+    else:
+        write_partition(df, root, db, table, quarter, fmt=fmt)
+        print(f"[CACHE] {db} {table} {quarter}: {len(df):,} rows")
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    sub = ap.add_subparsers(dest="cmd", required=True)
+
+    f = sub.add_parser("ingest-faers", help="Cache FAERS quarterly zips (faers_ascii.py)")
+    f.add_argument("--root", required=True)
+    f.add_argument("--zip", nargs="+", required=True)
+    f.add_argument("--tables", nargs="+", default=list(FAERS_TABLES))
+    f.add_argument("--format", default="auto", choices=["auto", "parquet", "npy"])
+    f.add_argument("--force", action="store_true", help="Rewrite partitions that already exist")
+
+    c = sub.add_parser("ingest-csv", help="Cache one CSV table")
+    c.add_argument("--root", required=True)
+    c.add_argument("--db", required=True)
+    c.add_argument("--table", required=True)
+    c.add_argument("--csv", required=True)
+    c.add_argument("--quarter", default="ALL")
+    c.add_argument("--quarter-col", default=None)
+    c.add_argument("--encoding", default="utf-8")
+    c.add_argument("--format", default="auto", choices=["auto", "parquet", "npy"])
+
+    ls = sub.add_parser("ls", help="List cached partitions")
+    ls.add_argument("--root", required=True)
+    args = ap.parse_args()
+
+    if args.cmd == "ingest-faers":
+        ingest_faers(args.root, args.zip, tables=args.tables, fmt=args.format, force=args.force)
+    elif args.cmd == "ingest-csv":
+        ingest_csv(args.root, args.db, args.table, args.csv, quarter=args.quarter,
+                   quarter_col=args.quarter_col, encoding=args.encoding, fmt=args.format)
+    else:
+        for p in sorted(Path(args.root).glob("DB=*/table=*/quarter=*")):
+            kind = "npy" if (p / META).exists() else "parquet"
+            print(p.relative_to(args.root), kind)
+
+
+if __name__ == "__main__":
+    main()
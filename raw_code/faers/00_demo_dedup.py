@@ -3,10 +3,18 @@
 # -*- coding: utf-8 -*-
 """
 FAERS DEMO — deduplicate to latest caseversion per caseid.
+- Rule: sort by (caseid, caseversion, fda_dt, primaryid), keep the last row per caseid
+  (caseversion ties -> later fda_dt -> higher primaryid; deterministic)
 - MSIP mode: consumes global `table`, produces `result`
-- CLI mode:  --in CSV --out CSV
+- CLI mode:  --in CSV --out CSV  (or --zip faers_ascii_*.zip / --cache ROOT: out-of-core via
+  demo_dedup.py — survivors from the key columns under --mem-mb, then DEMO streamed and filtered;
+  --ids-out writes the surviving primaryids as a sorted int64 .npy)
 """
 import argparse
+import sys
+from pathlib import Path
+
+import numpy as np
 import pandas as pd
 
 try:
@@ -14,6 +22,11 @@ try:
 except Exception:
     to_msi_df = None
 
+try:
+    from demo_dedup import latest_positions
+except Exception:
+    latest_positions = None
+
 def transform(df: pd.DataFrame) -> pd.DataFrame:
     # Ensure numeric caseversion for correct ordering
     if "caseversion" in df.columns:
@@ -24,11 +37,42 @@ def transform(df: pd.DataFrame) -> pd.DataFrame:
     if "caseid" not in df.columns:
         raise KeyError("Missing required column: caseid")
 
-    # idx of max caseversion per caseid
-    idx = df.groupby("caseid")["caseversion"].idxmax()
-    out = df.loc[idx].reset_index(drop=True)
+    if latest_positions is not None:
+        return df.iloc[latest_positions(df)].reset_index(drop=True)
+
+    # same rule without demo_dedup.py (e.g. pasted into an MSIP node on its own)
+    df = df.reset_index(drop=True)
+    keys = [c for c in ("caseid", "caseversion", "fda_dt", "primaryid") if c in df.columns]
+    sort_df = pd.DataFrame({c: pd.to_numeric(df[c], errors="coerce") for c in keys})
+    sort_df = sort_df[sort_df["caseid"].notna()]
+    sort_df = sort_df.sort_values(keys, kind="mergesort", na_position="first")
+    out = df.loc[sort_df.index[~sort_df["caseid"].duplicated(keep="last").to_numpy()]].reset_index(drop=True)
     return out
 
+def stream_dedup(args):
+    """Out-of-core path: bounded-memory survivor ids, then a second streamed pass writes the rows."""
+    from demo_dedup import dedup_primaryids, filter_rows, iter_demo_keys
+    keep = dedup_primaryids(iter_demo_keys(zips=args.zip, cache=args.cache), mem_mb=args.mem_mb)
+    if args.ids_out:
+        np.save(args.ids_out, keep)
+        print(f"[WRITE] {args.ids_out} ({len(keep):,} primaryids)")
+
+    if args.zip:
+        from faers_ascii import iter_table, list_zips
+        chunks = (df for p in list_zips(args.zip) for df in iter_table(p, "DEMO", add_quarter=True))
+    else:
+        sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "analysis"))
+        from table_cache import list_partitions, load_table
+        chunks = (load_table(args.cache, "FAERS", "DEMO", as_category=False, add_quarter=True,
+                             filters=[("quarter", "==", part.name.split("=", 1)[1])])
+                  for part in list_partitions(args.cache, "FAERS", "DEMO"))
+    emitted = np.zeros(len(keep), dtype=bool)
+    first = True
+    for df in chunks:
+        filter_rows(df, keep, emitted).to_csv(args.out_csv, index=False, mode="w" if first else "a",
+                                              header=first)
+        first = False
+
 def main():
     g = globals()
     if "table" in g:
@@ -38,11 +82,22 @@ def main():
         return
 
     ap = argparse.ArgumentParser()
-    ap.add_argument("--in", dest="in_csv", required=True)
+    ap.add_argument("--in", dest="in_csv", default=None)
+    ap.add_argument("--zip", nargs="+", default=None, help="FAERS quarterly zip(s)/glob(s) instead of --in")
+    ap.add_argument("--cache", default=None, help="Columnar cache root (raw_code/analysis/table_cache.py)")
+    ap.add_argument("--mem-mb", type=float, default=256, help="Key buffer budget for --zip/--cache")
+    ap.add_argument("--ids-out", default=None, help="Surviving primaryids (.npy, sorted int64)")
     ap.add_argument("--out", dest="out_csv", required=True)
     args = ap.parse_args()
 
-    df = pd.read_csv(args.in_csv)
+    if args.zip or args.cache:
+        stream_dedup(args)
+        print(f"[WRITE] {args.out_csv}")
+        return
+    if args.in_csv:
+        df = pd.read_csv(args.in_csv)
+    else:
+        ap.error("--in, --zip or --cache is required")
     out_df = transform(df)
     out_df.to_csv(args.out_csv, index=False)
     print(f"[WRITE] {args.out_csv}")
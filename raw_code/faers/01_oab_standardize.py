@@ -7,15 +7,33 @@
 Dual interface:
   (A) MSIP node: expects a global 'table' and returns msi.DataFrame via pandas_to_dataframe.
   (B) CLI: read CSV with ['primaryid', ('drug_of_interest' or 'prod_ai')] and write 'primaryid,drug_of_interest'.
+      --zip streams DRUG straight from the quarterly FAERS zips (faers_ascii.py), chunk by chunk;
+      --cache ROOT reads only primaryid, prod_ai from the columnar cache (table_cache.py).
+      Tokens come from drug_standardizer.py (distinct strings matched once by a compiled matcher);
+      --dictionary CSV/JSON replaces the 8 OAB tokens, --map-cache JSON persists raw -> token,
+      --fuzzy also resolves misspelled names (trigram shortlist + edit distance),
+      --name-col picks the source column (e.g. drugname instead of prod_ai),
+      --keep-role adds role_cod (PS/SS/C/I), distinct per primaryid x drug x role, for the
+      role bitmask of case_table.py.
 
 Usage (CLI):
   python raw_code/faers/01_oab_standardize.py \
     --in data/faers_DRUG.csv \
     --out data/derived/faers_oab_standardized.csv
+  python raw_code/faers/01_oab_standardize.py \
+    --zip "data/raw/faers_ascii_*.zip" \
+    --out data/derived/faers_oab_standardized.csv
 """
 import argparse, sys, unicodedata
+from pathlib import Path
 import pandas as pd
 
+try:
+    sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "analysis"))
+    from drug_standardizer import DrugStandardizer, load_dictionary
+except Exception:
+    DrugStandardizer = None
+
 # canonical OAB tokens to search (lowercase)
 GENERIC_TOKENS = [
     "oxybutynin",
@@ -41,19 +59,30 @@ def _map_token(txt: str):
             return tok
     return None
 
-def _standardize_df(df: pd.DataFrame) -> pd.DataFrame:
+def _standardize_df(df: pd.DataFrame, std=None, src_col=None, keep_role=False) -> pd.DataFrame:
     if "primaryid" not in df.columns:
         raise ValueError("Input must contain 'primaryid'")
     # choose source column
-    src_col = None
-    for c in ["drug_of_interest","prod_ai"]:
+    if src_col is not None and src_col not in df.columns:
+        raise ValueError(f"Input must contain '{src_col}'")
+    for c in ([] if src_col else ["drug_of_interest","prod_ai"]):
         if c in df.columns:
             src_col = c; break
     if src_col is None:
         raise ValueError("Input must contain 'drug_of_interest' or 'prod_ai'")
-    tmp = df.loc[df["primaryid"].notna() & df[src_col].notna(), ["primaryid", src_col]].copy()
-    tmp["drug_of_interest"] = tmp[src_col].map(_map_token)
-    out = (tmp.loc[tmp["drug_of_interest"].notna(), ["primaryid","drug_of_interest"]]
+    if keep_role and "role_cod" not in df.columns:
+        raise ValueError("Input must contain 'role_cod' with --keep-role")
+    role = ["role_cod"] if keep_role else []
+    tmp = df.loc[df["primaryid"].notna() & df[src_col].notna(), ["primaryid", src_col] + role].copy()
+    if std is None and DrugStandardizer is not None:
+        std = DrugStandardizer([(t, t) for t in GENERIC_TOKENS])
+    if std is not None:
+        tmp["drug_of_interest"] = std.standardize(tmp[src_col])
+    else:
+        # distinct strings only, then broadcast
+        codes, uniques = pd.factorize(tmp[src_col])
+        tmp["drug_of_interest"] = pd.Series(uniques).map(_map_token).to_numpy()[codes]
+    out = (tmp.loc[tmp["drug_of_interest"].notna(), ["primaryid","drug_of_interest"] + role]
              .drop_duplicates()
              .reset_index(drop=True))
     return out
@@ -70,19 +99,58 @@ def standardize_oab_faers(table) -> "msi.DataFrame":
 def main():
     ap = argparse.ArgumentParser()
     ap.add_argument("--in",  dest="inp",  required=False, help="Input CSV (FAERS DRUG)")
+    ap.add_argument("--zip", nargs="+", default=None, help="FAERS quarterly zip(s)/glob(s) instead of --in")
+    ap.add_argument("--cache", default=None, help="Columnar cache root (raw_code/analysis/table_cache.py)")
     ap.add_argument("--out", dest="outp", required=False, help="Output CSV [primaryid,drug_of_interest]")
+    ap.add_argument("--dictionary", default=None, help="Drug dictionary CSV/TSV [pattern, token] or JSON (default: OAB tokens)")
+    ap.add_argument("--map-cache", default=None, help="JSON file persisting the raw -> token map between runs")
+    ap.add_argument("--fuzzy", action="store_true", help="Also resolve misspelled names (edit distance)")
+    ap.add_argument("--name-col", default=None, help="Source column (default: drug_of_interest or prod_ai)")
+    ap.add_argument("--keep-role", action="store_true", help="Keep role_cod (one row per primaryid x drug x role)")
     args = ap.parse_args()
 
+    std = None
+    if DrugStandardizer is not None:
+        entries = load_dictionary(args.dictionary) if args.dictionary else [(t, t) for t in GENERIC_TOKENS]
+        std = DrugStandardizer(entries, map_path=args.map_cache, fuzzy=args.fuzzy)
+    name_col = args.name_col or "prod_ai"
+    role = ["role_cod"] if args.keep_role else []
+
+    if args.cache and args.outp:
+        sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "analysis"))
+        from table_cache import load_table
+        df = load_table(args.cache, "FAERS", "DRUG", columns=["primaryid", name_col] + role)
+        out = _standardize_df(df, std, name_col, args.keep_role)
+        if std is not None:
+            std.save()
+        out.to_csv(args.outp, index=False, encoding="utf-8")
+        print(f"[01_oab_standardize_FAERS] wrote {len(out):,} rows -> {args.outp}")
+        return
+
+    if args.zip and args.outp:
+        from faers_ascii import list_zips, iter_table
+        parts = [_standardize_df(chunk, std, name_col, args.keep_role)
+                 for z in list_zips(args.zip)
+                 for chunk in iter_table(z, "DRUG", usecols=["primaryid", name_col] + role)]
+        out = pd.concat(parts, ignore_index=True).drop_duplicates().reset_index(drop=True)
+        if std is not None:
+            std.save()
+        out.to_csv(args.outp, index=False, encoding="utf-8")
+        print(f"[01_oab_standardize_FAERS] wrote {len(out):,} rows -> {args.outp}")
+        return
+
     if args.inp is None and "table" in globals():
         out = standardize_oab_faers(globals()["table"])
         print(out)
         return
 
     if args.inp is None or args.outp is None:
-        ap.error("CLI mode requires --in and --out")
+        ap.error("CLI mode requires --in (or --zip/--cache) and --out")
 
     df = pd.read_csv(args.inp)
-    out = _standardize_df(df)
+    out = _standardize_df(df, std, args.name_col, args.keep_role)
+    if std is not None:
+        std.save()
     out.to_csv(args.outp, index=False, encoding="utf-8")
     print(f"[01_oab_standardize_FAERS] wrote {len(out):,} rows -> {args.outp}")
 
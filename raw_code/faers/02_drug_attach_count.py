@@ -4,9 +4,14 @@
 """
 FAERS DRUG — attach drug count per primaryid.
 - Count `drug_seq` per `primaryid`, rename to `number_of_drug`, left-merge.
-- MSIP mode and CLI mode supported.
+- MSIP mode and CLI mode supported (CLI: --in CSV, --zip faers_ascii_*.zip via faers_ascii.py,
+  or --cache ROOT: reads only primaryid, drug_seq from the columnar cache, table_cache.py;
+  --zip streams [primaryid, drug_seq] chunks and sums the counts per chunk).
 """
 import argparse
+import sys
+from pathlib import Path
+
 import pandas as pd
 
 try:
@@ -26,6 +31,19 @@ def transform(df: pd.DataFrame) -> pd.DataFrame:
     merged = df.merge(cnt, on="primaryid", how="left")
     return merged
 
+def transform_chunks(chunks) -> pd.DataFrame:
+    """Streaming variant of transform() for [primaryid, drug_seq] chunks: counts are summed per chunk."""
+    parts, counts = [], []
+    for chunk in chunks:
+        chunk = chunk[chunk["primaryid"].notna()]
+        parts.append(chunk)
+        counts.append(chunk.groupby("primaryid")["drug_seq"].count())
+    if not parts:
+        return transform(pd.DataFrame(columns=["primaryid", "drug_seq"]))
+    cnt = pd.concat(counts).groupby(level=0).sum().rename("number_of_drug").reset_index()
+    df = pd.concat(parts, ignore_index=True)
+    return df.merge(cnt, on="primaryid", how="left")
+
 def main():
     g = globals()
     if "table" in g:
@@ -35,11 +53,27 @@ def main():
         return
 
     ap = argparse.ArgumentParser()
-    ap.add_argument("--in", dest="in_csv", required=True)
+    ap.add_argument("--in", dest="in_csv", default=None)
+    ap.add_argument("--zip", nargs="+", default=None, help="FAERS quarterly zip(s)/glob(s) instead of --in")
+    ap.add_argument("--cache", default=None, help="Columnar cache root (raw_code/analysis/table_cache.py)")
     ap.add_argument("--out", dest="out_csv", required=True)
     args = ap.parse_args()
 
-    df = pd.read_csv(args.in_csv)
+    if args.cache:
+        sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "analysis"))
+        from table_cache import load_table
+        df = load_table(args.cache, "FAERS", "DRUG", columns=["primaryid", "drug_seq"])
+    elif args.zip:
+        from faers_ascii import list_zips, iter_table
+        out_df = transform_chunks(chunk for z in list_zips(args.zip)
+                                  for chunk in iter_table(z, "DRUG", usecols=["primaryid", "drug_seq"]))
+        out_df.to_csv(args.out_csv, index=False)
+        print(f"[WRITE] {args.out_csv}")
+        return
+    elif args.in_csv:
+        df = pd.read_csv(args.in_csv)
+    else:
+        ap.error("--in, --zip or --cache is required")
     out_df = transform(df)
     out_df.to_csv(args.out_csv, index=False)
     print(f"[WRITE] {args.out_csv}")
@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+demo_dedup.py — out-of-core FAERS DEMO deduplication (latest report per caseid)
+
+Rule: sort by (caseid, caseversion, fda_dt, primaryid) and keep the last row per caseid, so
+ties on caseversion go to the later FDA receipt date, then to the higher primaryid
+(deterministic, independent of file/row order). Missing keys sort first; rows without a
+caseid are dropped.
+
+Engine (bounded memory, ~mem_mb for the key arrays):
+  1. stream only the 4 key columns per quarter (faers_ascii zips, table_cache partitions or
+     CSV chunks) into an int64 buffer
+  2. when the buffer is full: lexsort, keep the last row per caseid, spill as a sorted run (.npy)
+  3. k-way merge of the runs in vectorized blocks (memmapped): every caseid below the smallest
+     block-end caseid is complete across runs, so it is reduced and emitted; the rest waits
+Result: sorted int64 array of surviving primaryids (np.save-able, np.searchsorted-joinable).
+
+Usage:
+  from demo_dedup import dedup_primaryids, iter_demo_keys
+  keep = dedup_primaryids(iter_demo_keys(zips=["data/raw/faers_ascii_*.zip"]), mem_mb=256)
+CLI:
+  python raw_code/faers/demo_dedup.py --zip "data/raw/faers_ascii_*.zip" --out data/faers_primaryid_keep.npy
+  python raw_code/faers/demo_dedup.py --cache data/cache --out data/faers_primaryid_keep.npy --mem-mb 128
+"""
+import argparse
+import shutil
+import sys
+import tempfile
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+DEDUP_KEYS = ("caseid", "caseversion", "fda_dt", "primaryid")
+_ROW_BYTES = 8 * len(DEDUP_KEYS)
+
+
+def _keys(df: pd.DataFrame) -> np.ndarray:
+    for c in ("caseid", "caseversion"):
+        if c not in df.columns:
+            raise KeyError(f"Missing required column: {c}")
+    out = np.empty((len(df), len(DEDUP_KEYS)), dtype=np.int64)
+    for j, c in enumerate(DEDUP_KEYS):
+        if c not in df.columns:           # fda_dt/primaryid optional tie-breakers
+            out[:, j] = -1
+            continue
+        s = df[c]
+        if s.dtype != np.int64:
+            s = pd.to_numeric(s, errors="coerce").fillna(-1)
+        out[:, j] = s.to_numpy(dtype=np.int64)
+    return out
+
+
+def key_array(df: pd.DataFrame) -> np.ndarray:
+    """DEMO frame -> (n, 4) int64 keys in DEDUP_KEYS order; missing -> -1, rows without caseid dropped."""
+    keys = _keys(df)
+    return keys[keys[:, 0] >= 0]
+
+
+def last_rows(keys: np.ndarray) -> np.ndarray:
+    """
+    Row indices of the last row per caseid under lexicographic key order, sorted by caseid.
+    One stable argsort on caseid, then per-group max filtering column by column
+    (cheaper than a full lexsort over all key columns).
+    """
+    order = np.argsort(keys[:, 0], kind="stable")
+    cid = keys[order, 0]
+    first = np.ones(len(cid), dtype=bool)
+    first[1:] = cid[1:] != cid[:-1]
+    starts = np.flatnonzero(first)
+    grp = np.cumsum(first) - 1
+    cand = np.ones(len(cid), dtype=bool)
+    for j in range(1, keys.shape[1]):
+        v = keys[order, j]
+        gmax = np.maximum.reduceat(np.where(cand, v, np.iinfo(np.int64).min), starts)
+        cand &= v == gmax[grp]
+    idx = np.flatnonzero(cand)
+    g = grp[idx]
+    last = np.ones(len(idx), dtype=bool)
+    last[:-1] = g[1:] != g[:-1]
+    return order[idx[last]]
+
+
+def last_per_caseid(keys: np.ndarray) -> np.ndarray:
+    """Sorted by caseid, one row per caseid: the last under (caseid, caseversion, fda_dt, primaryid)."""
+    if len(keys) == 0:
+        return keys
+    return keys[last_rows(keys)]
+
+
+def latest_positions(df: pd.DataFrame) -> np.ndarray:
+    """In-memory variant of the same rule: positions of the surviving rows, in caseid order."""
+    keys = _keys(df)
+    pos = np.flatnonzero(keys[:, 0] >= 0)
+    # exact duplicate rows -> last position (like keep="last")
+    keys = np.column_stack([keys[pos], pos])
+    return pos[last_rows(keys)]
+
+
+# ---- sources (key columns only) ----
+def iter_demo_keys(zips=None, cache=None, csv=None, chunksize=1_000_000):
+    """Yield (n, 4) key blocks per quarter zip / cache partition / CSV chunk."""
+    usecols = list(DEDUP_KEYS)
+    if zips:
+        from faers_ascii import iter_table, list_zips
+        for p in list_zips(zips):
+            for df in iter_table(p, "DEMO", usecols=usecols):
+                yield key_array(df)
+    elif cache:
+        sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "analysis"))
+        from table_cache import list_partitions, load_table
+        for part in list_partitions(cache, "FAERS", "DEMO"):
+            q = part.name.split("=", 1)[1]
+            yield key_array(load_table(cache, "FAERS", "DEMO", columns=usecols, as_category=False,
+                                       filters=[("quarter", "==", q)]))
+    elif csv:
+        for df in pd.read_csv(csv, usecols=lambda c: c in usecols, chunksize=chunksize):
+            yield key_array(df)
+    else:
+        raise ValueError("zips, cache or csv is required")
+
+
+# ---- external sort ----
+def _spill(buf, tmpdir, runs):
+    run = last_per_caseid(np.concatenate(buf))
+    path = Path(tmpdir) / f"run{len(runs):05d}.npy"
+    np.save(path, run)
+    runs.append(path)
+
+
+def sorted_runs(blocks, tmpdir, budget_rows):
+    """Buffer key blocks up to budget_rows, spill each buffer as a reduced, caseid-sorted run."""
+    runs, buf, n = [], [], 0
+    for keys in blocks:
+        for start in range(0, len(keys), budget_rows):
+            part = keys[start:start + budget_rows]
+            if n + len(part) > budget_rows and buf:
+                _spill(buf, tmpdir, runs)
+                buf, n = [], 0
+            buf.append(part)
+            n += len(part)
+    if buf:
+        _spill(buf, tmpdir, runs)
+    return runs
+
+
+def merge_runs(runs, block_rows):
+    """
+    Vectorized k-way merge: yields survivor key blocks in caseid order.
+    Each run holds unique caseids, so a loaded block of >= 2 rows always advances.
+    """
+    mms = [np.load(p, mmap_mode="r") for p in runs]
+    pos = [0] * len(mms)
+    block_rows = max(2, block_rows)
+    while True:
+        blocks = [np.asarray(m[p:p + block_rows]) for m, p in zip(mms, pos)]
+        live = [i for i, b in enumerate(blocks) if len(b)]
+        if not live:
+            return
+        # a run whose block reaches its end imposes no bound
+        bounds = [blocks[i][-1, 0] for i in live if pos[i] + len(blocks[i]) < len(mms[i])]
+        bound = min(bounds) if bounds else None
+        take = []
+        for i in live:
+            b = blocks[i]
+            n = len(b) if bound is None else int(np.searchsorted(b[:, 0], bound, side="left"))
+            take.append(b[:n])
+            pos[i] += n
+        yield last_per_caseid(np.concatenate(take))
+
+
+def dedup_primaryids(blocks, mem_mb=256, tmpdir=None) -> np.ndarray:
+    """Stream key blocks -> sorted int64 array of surviving primaryids, within ~mem_mb of keys."""
+    budget_rows = max(1024, int(mem_mb * (1 << 20)) // _ROW_BYTES)
+    work = Path(tempfile.mkdtemp(prefix="demo_dedup_", dir=tmpdir))
+    try:
+        runs = sorted_runs(blocks, work, budget_rows)
+        if not runs:
+            return np.zeros(0, dtype=np.int64)
+        out = [k[:, 3].copy() for k in merge_runs(runs, budget_rows // (2 * len(runs)))]
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+    keep = np.concatenate(out) if out else np.zeros(0, dtype=np.int64)
+    keep.sort()
+    return keep
+
+
+def filter_rows(df: pd.DataFrame, keep: np.ndarray, emitted: np.ndarray = None) -> pd.DataFrame:
+    """Rows whose primaryid is in the sorted keep array; emitted (bool, len(keep)) drops repeats across chunks."""
+    pid = pd.to_numeric(df["primaryid"], errors="coerce").fillna(-1).to_numpy(dtype=np.int64)
+    i = np.searchsorted(keep, pid)
+    i[i >= len(keep)] = 0
+    rows = np.flatnonzero(keep[i] == pid) if len(keep) else np.zeros(0, dtype=np.int64)
+    if emitted is not None:
+        k = i[rows]
+        fresh = ~emitted[k] & ~pd.Series(k).duplicated().to_numpy()
+        rows = rows[fresh]
+        emitted[k[fresh]] = True
+    hit = np.zeros(len(df), dtype=bool)
+    hit[rows] = True
+    return df[hit]
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--zip", nargs="+", default=None, help="FAERS quarterly zip(s)/glob(s)")
+    ap.add_argument("--cache", default=None, help="Columnar cache root (raw_code/analysis/table_cache.py)")
+    ap.add_argument("--in", dest="in_csv", default=None, help="DEMO CSV (read in chunks)")
+    ap.add_argument("--mem-mb", type=float, default=256, help="Memory budget for the key buffer")
+    ap.add_argument("--tmpdir", default=None, help="Where sorted runs are spilled")
+    ap.add_argument("--out", required=True, help="Surviving primaryids (.npy, sorted int64)")
+    args = ap.parse_args()
+
+    if not (args.zip or args.cache or args.in_csv):
+        ap.error("--zip, --cache or --in is required")
+    keep = dedup_primaryids(iter_demo_keys(zips=args.zip, cache=args.cache, csv=args.in_csv),
+                            mem_mb=args.mem_mb, tmpdir=args.tmpdir)
+    np.save(args.out, keep)
+    print(f"[WRITE] {args.out} ({len(keep):,} primaryids)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,276 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+faers_ascii.py — streaming reader for the FAERS/LAERS quarterly ASCII zip archives
+
+Reads DEMO/DRUG/REAC/OUTC/INDI/THER (and RPSR) directly from faers_ascii_YYYYqN.zip
+(or aers_ascii_YYYYqN.zip) without unzipping, in bounded-size chunks:
+  - a background thread decompresses the member in ~chunk_bytes blocks (cut at line ends)
+    into a small queue, so inflate and parsing overlap
+  - each block is parsed by the pandas C parser with explicit dtypes ('$'-delimited,
+    no quoting, latin-1)
+Known quirks handled:
+  - member names vary in case/folder/suffix (ascii/DEMO12Q4.txt, ASCII/DRUG18Q1_new.txt)
+  - LAERS headers (ISR, CASE) are mapped to primaryid/caseid; headers are lower-cased
+  - trailing '$' on every line (extra empty column) is dropped
+  - records broken over several lines (embedded newlines) are re-joined
+  - lines with more fields than the header ('$' inside free text) are skipped and counted
+  - the literal "NA" (e.g. Namibia in *_country) is kept as a string; only empty is missing
+  - non-numeric amounts (age=UNK, wt=..) become NaN rather than failing the stream
+Malformed lines are found with a vectorized per-line '$' count, so clean blocks go
+straight to the C parser.
+
+Usage:
+  from faers_ascii import read_table, iter_table
+  demo = read_table(["faers_ascii_2023q1.zip", ...], "DEMO")
+  for chunk in iter_table("faers_ascii_2023q1.zip", "DRUG", usecols=["primaryid", "drug_seq", "prod_ai"]): ...
+CLI (zip -> CSV, streamed):
+  python raw_code/faers/faers_ascii.py --zip data/raw/faers_ascii_*.zip --table DEMO --out data/faers_DEMO.csv
+"""
+import argparse
+import csv
+import glob
+import io
+import queue
+import re
+import threading
+import zipfile
+
+import numpy as np
+import pandas as pd
+
+TABLES = ("DEMO", "DRUG", "REAC", "OUTC", "INDI", "THER", "RPSR")
+
+# LAERS (<= 2012Q3) -> FAERS column names
+HEADER_ALIASES = {"isr": "primaryid", "case": "caseid"}
+
+_ID_COLS = ("primaryid", "caseid", "caseversion", "drug_seq", "dsg_drug_seq", "indi_drug_seq")
+_CATEGORY_COLS = ("i_f_code", "i_f_cod", "rept_cod", "mfr_sndr", "sex", "age_cod", "age_grp",
+                  "e_sub", "wt_cod", "occp_cod", "reporter_country", "occr_country",
+                  "role_cod", "route", "dechal", "rechal", "dose_unit", "dose_form", "dose_freq",
+                  "outc_cod", "rpsr_cod", "dur_cod", "exp_dt_cod")
+_NUMERIC_COLS = ("age", "wt", "dose_amt", "nda_num", "dur", "val_vbm", "cum_dose_chr")
+
+_QUARTER_RE = re.compile(r"(\d{4})q([1-4])", re.IGNORECASE)
+_NL, _DELIM = 10, 36   # b"\n", b"$"
+
+
+def quarter_of(path):
+    """'faers_ascii_2019q1.zip' -> '2019Q1' (None if the name carries no quarter)."""
+    m = _QUARTER_RE.search(str(path))
+    return f"{m.group(1)}Q{m.group(2)}" if m else None
+
+
+def list_zips(patterns):
+    """Expand globs -> zip paths sorted by quarter (name order for unlabeled files)."""
+    paths = []
+    for p in ([patterns] if isinstance(patterns, str) else patterns):
+        paths.extend(sorted(glob.glob(str(p))) or [str(p)])
+    return sorted(dict.fromkeys(paths), key=lambda p: (quarter_of(p) or "", p))
+
+
+def find_member(zf: zipfile.ZipFile, table: str) -> str:
+    table = table.upper()
+    pat = re.compile(rf"(^|/){table}\d{{2}}Q[1-4](_new)?\.txt$", re.IGNORECASE)
+    hits = [n for n in zf.namelist() if pat.search(n)]
+    if not hits:
+        raise KeyError(f"No {table} member in {zf.filename}")
+    # prefer the corrected *_new file when both are shipped
+    return sorted(hits, key=lambda n: "_new" not in n.lower())[0]
+
+
+def column_dtypes(columns):
+    """
+    Explicit dtypes: categories for codes, str otherwise. Id/seq columns are parsed natively
+    (int64) and only become nullable Int64 when a chunk has missing ids (parsing straight into
+    Int64 is several times slower in the C parser). Amounts (_NUMERIC_COLS) are read as str and
+    coerced to float after the read, so a stray token ("UNK") becomes NaN instead of an error.
+    """
+    out = {}
+    for c in columns:
+        if c in _ID_COLS:
+            continue
+        elif c in _CATEGORY_COLS:
+            out[c] = "category"
+        else:
+            out[c] = "object"
+    return out
+
+
+def _blocks(fh, chunk_bytes, out_q, stop):
+    """Producer: inflate fixed-size blocks, cut at the last newline, hand over via the queue."""
+    try:
+        tail = b""
+        while not stop.is_set():
+            data = fh.read(chunk_bytes)
+            if not data:
+                break
+            data = tail + data
+            cut = data.rfind(b"\n") + 1
+            if cut == 0:
+                tail = data
+                continue
+            tail = data[cut:]
+            out_q.put(data[:cut])
+        if tail:
+            out_q.put(tail + b"\n")
+        out_q.put(None)
+    except BaseException as exc:   # surfaced in the consumer
+        out_q.put(exc)
+
+
+def _line_delims(buf):
+    """Per-line '$' counts for a block of complete lines (vectorized)."""
+    a = np.frombuffer(buf, dtype=np.uint8)
+    nl = np.flatnonzero(a == _NL)
+    csum = np.cumsum(a == _DELIM, dtype=np.int64)
+    at_nl = csum[nl]
+    return np.diff(np.concatenate(([0], at_nl))), nl
+
+
+class _Repair:
+    """Slow path for blocks with broken lines; carries a partial record across blocks."""
+
+    def __init__(self, expected):
+        self.expected = expected
+        self.pending = None
+        self.pending_n = 0
+        self.joined = 0
+        self.skipped = 0
+
+    def fix(self, buf):
+        out = []
+        for line in buf.split(b"\n"):
+            line = line.rstrip(b"\r")
+            if not line:
+                continue
+            n = line.count(b"$")
+            if self.pending is not None:
+                if self.pending_n + n <= self.expected:
+                    self.pending += b" " + line
+                    self.pending_n += n
+                    self.joined += 1
+                    if self.pending_n == self.expected:
+                        out.append(self.pending)
+                        self.pending = None
+                    continue
+                out.append(self.pending)     # genuinely short record
+                self.pending = None
+            if n == self.expected:
+                out.append(line)
+            elif n < self.expected:
+                self.pending, self.pending_n = line, n
+            else:
+                self.skipped += 1
+        return b"\n".join(out) + b"\n" if out else b""
+
+    def flush(self):
+        if self.pending is None:
+            return b""
+        buf, self.pending = self.pending + b"\n", None
+        return buf
+
+
+def iter_table(zip_path, table, usecols=None, chunk_bytes=32 << 20, prefetch=2,
+               add_quarter=False, stats=None):
+    """
+    Yield DataFrame chunks of one table from one quarterly zip.
+    usecols: subset of (normalized, lower-case) columns to keep.
+    stats: optional dict updated with rows/joined/skipped counts.
+    """
+    with zipfile.ZipFile(zip_path) as zf, zf.open(find_member(zf, table)) as fh:
+        header_line = fh.readline().rstrip(b"\r\n")
+        raw = header_line.decode("latin-1").split("$")
+        trailing = raw[-1] == ""
+        names = [HEADER_ALIASES.get(c.strip().lower(), c.strip().lower()) for c in (raw[:-1] if trailing else raw)]
+        expected = header_line.count(b"$")
+        all_names = names + (["_trailing"] if trailing else [])
+        keep = [c for c in names if usecols is None or c in usecols]
+        dtypes = {c: t for c, t in column_dtypes(names).items() if c in keep}
+        quarter = quarter_of(zip_path)
+
+        q = queue.Queue(maxsize=max(1, prefetch))
+        stop = threading.Event()
+        worker = threading.Thread(target=_blocks, args=(fh, chunk_bytes, q, stop), daemon=True)
+        worker.start()
+        fixer = _Repair(expected)
+        rows = 0
+
+        def parse(buf):
+            df = pd.read_csv(io.BytesIO(buf), sep="$", header=None, names=all_names, usecols=keep,
+                             dtype=dtypes, quoting=csv.QUOTE_NONE, encoding="latin-1",
+                             keep_default_na=False, na_values=[""], engine="c")
+            for c in _ID_COLS:
+                if c in df.columns and df[c].dtype != np.int64:
+                    df[c] = pd.to_numeric(df[c], errors="coerce").astype("Int64")
+            for c in _NUMERIC_COLS:
+                if c in df.columns:
+                    df[c] = pd.to_numeric(df[c], errors="coerce").astype("float64")
+            if add_quarter:
+                df["quarter"] = quarter
+            return df
+
+        try:
+            while True:
+                buf = q.get()
+                if isinstance(buf, BaseException):
+                    raise buf
+                if buf is None:
+                    break
+                counts, _ = _line_delims(buf)
+                if fixer.pending is not None or (counts != expected).any():
+                    buf = fixer.fix(buf)
+                if buf:
+                    df = parse(buf)
+                    rows += len(df)
+                    yield df
+            buf = fixer.flush()
+            if buf:
+                df = parse(buf)
+                rows += len(df)
+                yield df
+        finally:
+            stop.set()
+            while worker.is_alive():        # unblock a producer waiting on a full queue
+                try:
+                    q.get_nowait()
+                except queue.Empty:
+                    worker.join(timeout=0.05)
+        if stats is not None:
+            stats[quarter or str(zip_path)] = {"rows": rows, "joined": fixer.joined, "skipped": fixer.skipped}
+
+
+def read_table(zip_paths, table, usecols=None, add_quarter=True, stats=None, **kw) -> pd.DataFrame:
+    """Concatenate one table over several quarterly zips (column union; categories re-unified)."""
+    frames = [df for p in list_zips(zip_paths)
+              for df in iter_table(p, table, usecols=usecols, add_quarter=add_quarter, stats=stats, **kw)]
+    if not frames:
+        return pd.DataFrame()
+    out = pd.concat(frames, ignore_index=True)
+    for c in out.columns:
+        if c in _CATEGORY_COLS and out[c].dtype != "category":
+            out[c] = out[c].astype("category")
+    return out
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--zip", nargs="+", required=True, help="Quarterly zip(s) or glob(s)")
+    ap.add_argument("--table", required=True, choices=TABLES)
+    ap.add_argument("--usecols", default=None, help="Comma-separated columns to keep")
+    ap.add_argument("--out", required=True)
+    args = ap.parse_args()
+
+    usecols = args.usecols.split(",") if args.usecols else None
+    stats, first = {}, True
+    for p in list_zips(args.zip):
+        for df in iter_table(p, args.table, usecols=usecols, add_quarter=True, stats=stats):
+            df.to_csv(args.out, index=False, mode="w" if first else "a", header=first)
+            first = False
+    for k, v in stats.items():
+        print(f"[READ] {args.table} {k}: {v['rows']:,} rows (joined {v['joined']}, skipped {v['skipped']})")
+    print(f"[WRITE] {args.out}")
+
+
+if __name__ == "__main__":
+    main()
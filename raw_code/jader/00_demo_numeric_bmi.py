@@ -1,12 +1,18 @@
-
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 """
 JADER DEMO cleaner — numeric AGE/HEIGHT/WEIGHT + BMI
 - MSIP mode: read global `table`, write `result` (msi DataFrame)
 - CLI mode:  --in CSV --out CSV
+- 年齢/身長/体重 (or age_text/height_text/weight_text from jader_ingest.py) are parsed once per
+  distinct string: NFKC first (full-width digits), "未満" -> 0, else the first integer
+  ("70歳代" -> 70, "50kg台" -> 50); WEIGHT/HEIGHT (+5) and BMI are column arithmetic.
+- Numeric columns are nullable Int16 (BMI float64, 2 decimals).
 """
 import argparse
+import unicodedata
+
+import numpy as np
 import pandas as pd
 
 # MSIP bridge (optional)
@@ -15,54 +21,50 @@ try:
 except Exception:
     MSIDataFrame = None
 
-def extract_numeric_or_zero(val: object):
-    import pandas as _pd
-    if _pd.isna(val):
-        return None
-    s = str(val).strip()
-    if s == "":
-        return None
-    # treat "未満" as 0
-    if "未満" in s:
-        return 0
-    # pick first integer in the string
-    m = _pd.Series([s]).str.extract(r"(\d+)")
-    return int(m.iloc[0,0]) if _pd.notnull(m.iloc[0,0]) else None
+# (source column, fallback alias written by jader_ingest.py, numeric column)
+DEMO_FIELDS = [
+    ("体重", "weight_text", "体重数値"),
+    ("身長", "height_text", "身長数値"),
+    ("年齢", "age_text", "年齢数値"),
+]
 
-def calculate_bmi(weight, height_cm):
-    import pandas as _pd
-    if _pd.isna(weight) or _pd.isna(height_cm) or float(height_cm) == 0.0:
-        return None
-    h_m = float(height_cm) / 100.0
-    return round(float(weight) / (h_m**2), 2)
+def _compact_int(values: pd.Series) -> pd.Series:
+    """Float series with NaN -> nullable Int16 (Int32 if out of range)."""
+    hi = values.abs().max()
+    dtype = "Int16" if pd.isna(hi) or hi <= np.iinfo(np.int16).max else "Int32"
+    return values.astype(dtype)
 
-def transform(df: pd.DataFrame) -> pd.DataFrame:
-    # Column aliases (Japanese -> internal); fallbacks are no-op if not present
-    col_weight = "体重"
-    col_height = "身長"
-    col_age    = "年齢"
+def parse_numeric(values: pd.Series) -> pd.Series:
+    """Strings -> first integer ("未満" -> 0, empty -> NA), evaluated on the distinct strings only."""
+    codes, uniques = pd.factorize(values, use_na_sentinel=True)   # NA stays NA (no "nan" strings)
+    u = pd.Series(uniques, dtype=object).map(lambda s: unicodedata.normalize("NFKC", str(s)).strip())
+    num = pd.to_numeric(u.str.extract(r"(\d+)", expand=False), errors="coerce")
+    num = num.where(~u.str.contains("未満", regex=False), 0.0)
+    parsed = np.append(num.to_numpy(dtype=float), np.nan)
+    return _compact_int(pd.Series(parsed[np.where(codes < 0, len(uniques), codes)], index=values.index))
 
-    # Safe-string views
-    for col in [col_weight, col_height, col_age]:
-        if col in df.columns:
-            df[f"{col}_str"] = df[col].apply(lambda x: str(x) if pd.notnull(x) else "")
-        else:
-            # create empty if missing
-            df[f"{col}_str"] = ""
+def calculate_bmi(weight: pd.Series, height_cm: pd.Series) -> pd.Series:
+    """BMI = weight / (height[m])^2, rounded to 2 decimals; NA when either is missing or height is 0."""
+    w = weight.astype("float64")
+    h = height_cm.astype("float64").replace(0.0, np.nan) / 100.0
+    return (w / (h ** 2)).round(2)
+
+def transform(df: pd.DataFrame) -> pd.DataFrame:
+    # Safe-string views ("" if missing)
+    for col, alias, _ in DEMO_FIELDS:
+        src = col if col in df.columns else alias if alias in df.columns else None
+        df[f"{col}_str"] = df[src].where(df[src].notna(), "").astype(str) if src else ""
 
     # Extract numerics
-    df["体重数値"] = df["体重_str"].apply(extract_numeric_or_zero)
-    df["身長数値"] = df["身長_str"].apply(extract_numeric_or_zero)
-    df["年齢数値"] = df["年齢_str"].apply(extract_numeric_or_zero)
+    for col, _, num_col in DEMO_FIELDS:
+        df[num_col] = parse_numeric(df[f"{col}_str"].replace("", np.nan))
 
     # +5 only to weight/height, age is no offset
-    df["WEIGHT"] = pd.to_numeric(df["体重数値"], errors="coerce") + 5
-    df["HEIGHT"] = pd.to_numeric(df["身長数値"], errors="coerce") + 5
-    df["AGE"]    = pd.to_numeric(df["年齢数値"], errors="coerce")
-
-    # BMI
-    df["BMI"] = df.apply(lambda r: calculate_bmi(r.get("WEIGHT"), r.get("HEIGHT")), axis=1)
+    df["WEIGHT"] = df["体重数値"] + 5
+    df["HEIGHT"] = df["身長数値"] + 5
+    df["AGE"]    = df["年齢数値"]
 
+    df["BMI"] = calculate_bmi(df["WEIGHT"], df["HEIGHT"])
     return df
 
 def main():
@@ -72,8 +74,8 @@ def main():
         df = g["table"].to_pandas()
         out_df = transform(df)
         if MSIDataFrame is not None:
-            # keep types as object to be safe with MSIP
-            result_df = out_df.astype(object)
+            # keep types as object to be safe with MSIP (NA -> None)
+            result_df = out_df.astype(object).where(out_df.notna(), None)
             g["result"] = MSIDataFrame(result_df.to_dict(orient="list"))
         else:
             g["result"] = out_df
@@ -1,50 +1,108 @@
 """
 JADER OAB name standardization
-- Input columns: '識別番号', '医薬品（一般名）' (from JADER DRUG)
+- Input columns: '識別番号', '医薬品（一般名）' (from JADER DRUG; or j_id, drug_generic as written by jader_ingest.py)
 - Output columns: 'j_id', 'drug_of_interest' (ASCII tokens)
+- Spelling variants are substring-matched on distinct names only (drug_standardizer.py: one compiled
+  matcher, tokens broadcast back to the rows)
+- CLI: --in CSV or --cache ROOT (columnar cache), --out CSV;
+  --dictionary CSV/JSON [pattern, token] replaces the OAB entries, --map-cache JSON persists raw -> token,
+  --fuzzy also resolves misspelled names (trigram shortlist + edit distance),
+  --keep-role adds drug_role (医薬品の関与: 被疑薬/併用薬/相互作用) for the case_table.py role bitmask
 """
 
+import argparse
+import sys
+from pathlib import Path
+
 import pandas as pd
-from msi.common.dataframe import pandas_to_dataframe
 
-def normalize_oab_jader(table) -> "msi.DataFrame":
-    df = table.to_pandas()
-    df = df[df['識別番号'].notna() & df['医薬品（一般名）'].notna()].copy()
-
-    # handle spelling variants (substring match) in Japanese generics
-    yure_dict = {
-        "オキシブチニン":"オキシブチニン",
-        "プロピベリン":"プロピベリン",
-        "ソリフェナシン":"ソリフェナシン",
-        "イミダフェナシン":"イミダフェナシン",
-        "トルテロジン":"トルテロジン",
-        "フェソテロジン":"フェソテロジン",
-        "ミラベグロン":"ミラベグロン",
-        "ビベグロン":"ビベグロン",
-    }
-    def norm_jp(s: str) -> str:
-        for k, canon in yure_dict.items():
-            if k in s:
-                return canon
-        return s
-
-    df['__jp_norm'] = df['医薬品（一般名）'].astype(str).map(norm_jp)
-
-    # map to ASCII tokens for downstream uniformity
-    jp_to_ascii = {
-        "オキシブチニン":"oxybutynin",
-        "プロピベリン":"propiverine",
-        "ソリフェナシン":"solifenacin",
-        "イミダフェナシン":"imidafenacin",
-        "トルテロジン":"tolterodine",
-        "フェソテロジン":"fesoterodine",
-        "ミラベグロン":"mirabegron",
-        "ビベグロン":"vibegron",
-    }
-    df['drug_of_interest'] = df['__jp_norm'].map(jp_to_ascii)
-
-    out = (df.loc[df['drug_of_interest'].notna(), ['識別番号','drug_of_interest']]
+try:
+    sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "analysis"))
+    from drug_standardizer import DrugStandardizer, load_dictionary
+except Exception:
+    DrugStandardizer = None
+
+# handle spelling variants (substring match) in Japanese generics -> ASCII tokens for downstream uniformity
+jp_to_ascii = {
+    "オキシブチニン":"oxybutynin",
+    "プロピベリン":"propiverine",
+    "ソリフェナシン":"solifenacin",
+    "イミダフェナシン":"imidafenacin",
+    "トルテロジン":"tolterodine",
+    "フェソテロジン":"fesoterodine",
+    "ミラベグロン":"mirabegron",
+    "ビベグロン":"vibegron",
+}
+
+def _norm_jp(s: str):
+    for k, tok in jp_to_ascii.items():
+        if k in s:
+            return tok
+    return None
+
+ROLE_COLUMNS = ('医薬品の関与', '被疑薬等区分', 'drug_role')
+
+def _standardize_df(df: pd.DataFrame, std=None, keep_role=False) -> pd.DataFrame:
+    id_col = '識別番号' if '識別番号' in df.columns else 'j_id'
+    name_col = '医薬品（一般名）' if '医薬品（一般名）' in df.columns else 'drug_generic'
+    role_col = next((c for c in ROLE_COLUMNS if c in df.columns), None) if keep_role else None
+    if keep_role and role_col is None:
+        raise ValueError(f"Input must contain one of {ROLE_COLUMNS} with --keep-role")
+    role = [role_col] if role_col else []
+    df = df[df[id_col].notna() & df[name_col].notna()].copy()
+
+    if std is None and DrugStandardizer is not None:
+        std = DrugStandardizer(list(jp_to_ascii.items()))
+    if std is not None:
+        df['drug_of_interest'] = std.standardize(df[name_col].astype(str))
+    else:
+        codes, uniques = pd.factorize(df[name_col].astype(str))
+        df['drug_of_interest'] = pd.Series(uniques).map(_norm_jp).to_numpy()[codes]
+
+    out = (df.loc[df['drug_of_interest'].notna(), [id_col,'drug_of_interest'] + role]
              .drop_duplicates()
-             .rename(columns={'識別番号':'j_id'}))
+             .rename(columns={id_col:'j_id', **({role_col:'drug_role'} if role_col else {})})
+             .reset_index(drop=True))
+    return out
+
+def normalize_oab_jader(table) -> "msi.DataFrame":
+    from msi.common.dataframe import pandas_to_dataframe
+    return pandas_to_dataframe(_standardize_df(table.to_pandas()))
+
+def main():
+    g = globals()
+    if "table" in g:
+        g["result"] = normalize_oab_jader(g["table"])
+        return
+
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--in", dest="inp", default=None, help="JADER DRUG CSV (UTF-8)")
+    ap.add_argument("--cache", default=None, help="Columnar cache root (jader_ingest.py / table_cache.py)")
+    ap.add_argument("--out", dest="outp", required=True, help="Output CSV [j_id,drug_of_interest]")
+    ap.add_argument("--dictionary", default=None, help="Drug dictionary CSV/TSV [pattern, token] or JSON (default: OAB entries)")
+    ap.add_argument("--map-cache", default=None, help="JSON file persisting the raw -> token map between runs")
+    ap.add_argument("--fuzzy", action="store_true", help="Also resolve misspelled names (edit distance)")
+    ap.add_argument("--keep-role", action="store_true", help="Keep drug_role (one row per j_id x drug x role)")
+    args = ap.parse_args()
+
+    std = None
+    if DrugStandardizer is not None:
+        entries = load_dictionary(args.dictionary) if args.dictionary else list(jp_to_ascii.items())
+        std = DrugStandardizer(entries, map_path=args.map_cache, fuzzy=args.fuzzy)
+
+    if args.cache:
+        from table_cache import load_table
+        df = load_table(args.cache, "JADER", "DRUG",
+                        columns=["j_id", "drug_generic"] + (["drug_role"] if args.keep_role else []))
+    elif args.inp:
+        df = pd.read_csv(args.inp)
+    else:
+        ap.error("--in or --cache is required")
+    out = _standardize_df(df, std, args.keep_role)
+    if std is not None:
+        std.save()
+    out.to_csv(args.outp, index=False, encoding="utf-8")
+    print(f"[01_oab_standardize_JADER] wrote {len(out):,} rows -> {args.outp}")
 
-    return pandas_to_dataframe(out)
+if __name__ == "__main__":
+    main()
@@ -5,9 +5,13 @@
 JADER DRUG — attach per-case drug count
 - Group by 識別番号 (fallback: j_id, primaryid), count 医薬品連番 (fallback: drug_seq)
 - Output columns include both '服薬数' and 'drug_count' for downstream compatibility
-- MSIP mode and CLI mode supported
+- MSIP mode and CLI mode supported (CLI: --in CSV, or --cache ROOT: reads only j_id, drug_seq
+  from the columnar cache written by jader_ingest.py, raw_code/analysis/table_cache.py)
 """
 import argparse
+import sys
+from pathlib import Path
+
 import pandas as pd
 
 try:
@@ -51,11 +55,19 @@ def main():
         return
 
     ap = argparse.ArgumentParser()
-    ap.add_argument("--in", dest="in_csv", required=True)
+    ap.add_argument("--in", dest="in_csv", default=None)
+    ap.add_argument("--cache", default=None, help="Columnar cache root (raw_code/analysis/table_cache.py)")
     ap.add_argument("--out", dest="out_csv", required=True)
     args = ap.parse_args()
 
-    df = pd.read_csv(args.in_csv)
+    if args.cache:
+        sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "analysis"))
+        from table_cache import load_table
+        df = load_table(args.cache, "JADER", "DRUG", columns=["j_id", "drug_seq"])
+    elif args.in_csv:
+        df = pd.read_csv(args.in_csv)
+    else:
+        ap.error("--in or --cache is required")
     out_df = transform(df)
     out_df.to_csv(args.out_csv, index=False)
     print(f"[WRITE] {args.out_csv}")
@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+jader_ingest.py — chunked cp932 loader for the official JADER CSVs (demo/drug/reac/hist)
+
+- Decodes the Shift-JIS (cp932) files in chunks (plain CSV or inside the release zip);
+  all fields are read as strings, so IDs and coded values are never mangled into numbers.
+- Maps the Japanese headers to ASCII aliases once (識別番号 -> j_id, 医薬品連番 -> drug_seq,
+  医薬品（一般名） -> drug_generic, ...; headers are NFKC-matched, so full/half-width
+  variants map the same). Unknown headers are kept as they are.
+- NFKC-normalizes and trims the ID columns at ingest (full-width -> half-width), so later
+  stages can match IDs without re-normalizing on every run.
+- Writes the shared columnar cache (raw_code/analysis/table_cache.py) as
+  DB=JADER/table=<DEMO|DRUG|REAC|HIST>/quarter=ALL (JADER releases are cumulative).
+
+Usage:
+  python raw_code/jader/jader_ingest.py --src data/raw/jader --root data/cache
+  python raw_code/jader/jader_ingest.py --src data/raw/pmdacasereport202308.zip --root data/cache --tables DRUG
+  python raw_code/jader/jader_ingest.py --src data/raw/jader --table DRUG --out data/jader_DRUG.csv  (UTF-8 CSV)
+"""
+import argparse
+import glob
+import io
+import re
+import sys
+import unicodedata
+import zipfile
+from pathlib import Path
+
+import pandas as pd
+
+JADER_TABLES = ("DEMO", "DRUG", "REAC", "HIST")
+
+# NFKC(header) -> ASCII alias
+COLUMN_ALIASES = {
+    "識別番号": "j_id",
+    "報告回数": "report_count",
+    # DEMO
+    "性別": "sex",
+    "年齢": "age_text",
+    "体重": "weight_text",
+    "身長": "height_text",
+    "報告年度・四半期": "report_quarter",
+    "状況": "status",
+    "報告の種類": "report_type",
+    "報告者の資格": "reporter_qualification",
+    "E2B": "e2b",
+    # DRUG
+    "医薬品連番": "drug_seq",
+    "医薬品の関与": "drug_role",
+    "医薬品(一般名)": "drug_generic",
+    "医薬品(販売名)": "drug_brand",
+    "投与経路": "route",
+    "投与開始日": "start_dt",
+    "投与終了日": "end_dt",
+    "投与量": "dose",
+    "投与単位": "dose_unit",
+    "分割投与回数": "dose_divided",
+    "使用理由": "indication",
+    "医薬品の処置": "drug_action",
+    "再投与による再発の有無": "rechallenge",
+    "リスク区分等": "risk_category",
+    # REAC
+    "有害事象連番": "event_seq",
+    "有害事象": "pt",
+    "転帰": "outcome",
+    "有害事象の発現日": "onset_dt",
+    # HIST
+    "患者情報連番": "hist_seq",
+    "原疾患等": "disease",
+}
+
+ID_COLUMNS = ("j_id",)
+
+_FILE_RE = {t: re.compile(rf"(^|/){t.lower()}[^/]*\.csv$", re.IGNORECASE) for t in JADER_TABLES}
+
+
+def nfkc(s: pd.Series) -> pd.Series:
+    """NFKC + strip on a string column; missing stays missing (one call per distinct value)."""
+    codes, cats = pd.factorize(s, use_na_sentinel=True)
+    norm = pd.Index([unicodedata.normalize("NFKC", str(v)).strip() for v in cats])
+    out = pd.Series(norm.take(codes), index=s.index, dtype=object)
+    out[codes < 0] = None
+    return out
+
+
+def ascii_columns(columns):
+    """Header list -> ASCII aliases (NFKC-matched); unknown headers are kept."""
+    out = []
+    for c in columns:
+        key = unicodedata.normalize("NFKC", str(c)).strip()
+        out.append(COLUMN_ALIASES.get(key, key))
+    return out
+
+
+def _open_member(path, name):
+    """Open one zip member; the archive handle is released when the member stream is closed."""
+    with zipfile.ZipFile(path) as zf:
+        return zf.open(name)
+
+
+def _sources(src):
+    """Files/dirs/zips -> list of (label, opener) for every CSV found (zips are opened lazily)."""
+    items = []
+    for p in ([src] if isinstance(src, (str, Path)) else src):
+        for path in (sorted(glob.glob(str(p))) or [str(p)]):
+            path = Path(path)
+            if path.is_dir():
+                items.extend(_sources(sorted(path.iterdir())))
+            elif path.suffix.lower() == ".zip":
+                with zipfile.ZipFile(path) as zf:
+                    names = [n for n in zf.namelist() if n.lower().endswith(".csv")]
+                items.extend((f"{path}:{n}", (lambda p=path, n=n: _open_member(p, n))) for n in names)
+            elif path.suffix.lower() == ".csv":
+                items.append((str(path), (lambda p=path: open(p, "rb"))))
+    return items
+
+
+def find_source(src, table):
+    hits = [(label, opener) for label, opener in _sources(src)
+            if _FILE_RE[table.upper()].search(label.replace(":", "/"))]
+    if not hits:
+        raise FileNotFoundError(f"No {table.lower()}*.csv found under {src}")
+    return sorted(hits)[-1]     # latest release when several are present
+
+
+def iter_jader(src, table, chunksize=500_000, encoding="cp932", encoding_errors="replace"):
+    """Yield chunks of one JADER table with ASCII headers and NFKC-normalized IDs."""
+    label, opener = find_source(src, table)
+    with opener() as raw:
+        text = io.TextIOWrapper(raw, encoding=encoding, errors=encoding_errors, newline="")
+        reader = pd.read_csv(text, dtype=str, keep_default_na=False, na_values=[""],
+                             chunksize=chunksize)
+        for chunk in reader:
+            chunk.columns = ascii_columns(chunk.columns)
+            for c in ID_COLUMNS:
+                if c in chunk.columns:
+                    chunk[c] = nfkc(chunk[c])
+            yield chunk
+
+
+def read_jader(src, table, **kw) -> pd.DataFrame:
+    """Whole table; repeated string columns are dictionary-encoded per chunk to bound memory.
+    Which columns are categorical is decided on the first chunk and applied to every chunk."""
+    sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "analysis"))
+    from table_cache import concat_frames
+
+    frames, cat_cols = [], None
+    for chunk in iter_jader(src, table, **kw):
+        if cat_cols is None:
+            cat_cols = [c for c in chunk.columns
+                        if c not in ID_COLUMNS and chunk[c].nunique(dropna=True) < 0.5 * len(chunk)]
+        for c in cat_cols:
+            if c in chunk.columns:
+                chunk[c] = chunk[c].astype("category")
+        frames.append(chunk)
+    return concat_frames(frames)
+
+
+def ingest_jader(src, root, tables=JADER_TABLES, fmt="auto", **kw):
+    sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "analysis"))
+    from table_cache import write_partition
+
+    for table in tables:
+        df = read_jader(src, table, **kw)
+        write_partition(df, root, "JADER", table, "ALL", fmt=fmt)
+        print(f"[CACHE] JADER {table}: {len(df):,} rows, columns={list(df.columns)}")
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--src", nargs="+", required=True, help="JADER CSV files, directories or release zip")
+    ap.add_argument("--root", default=None, help="Columnar cache root (table_cache.py)")
+    ap.add_argument("--tables", nargs="+", default=list(JADER_TABLES), choices=JADER_TABLES)
+    ap.add_argument("--table", default=None, choices=JADER_TABLES, help="With --out: export one table as UTF-8 CSV")
+    ap.add_argument("--out", default=None)
+    ap.add_argument("--encoding", default="cp932")
+    ap.add_argument("--chunksize", type=int, default=500_000)
+    ap.add_argument("--format", default="auto", choices=["auto", "parquet", "npy"])
+    args = ap.parse_args()
+
+    if args.out:
+        if not args.table:
+            ap.error("--out requires --table")
+        first = True
+        for chunk in iter_jader(args.src, args.table, chunksize=args.chunksize, encoding=args.encoding):
+            chunk.to_csv(args.out, index=False, mode="w" if first else "a", header=first, encoding="utf-8")
+            first = False
+        print(f"[WRITE] {args.out}")
+        return
+    if not args.root:
+        ap.error("--root (cache) or --table/--out is required")
+    ingest_jader(args.src, args.root, tables=args.tables, fmt=args.format,
+                 chunksize=args.chunksize, encoding=args.encoding)
+
+
+if __name__ == "__main__":
+    main()
@@ -11,15 +11,22 @@
 import os, sys, tempfile
 import numpy as np
 import pandas as pd
-import matplotlib
-matplotlib.use("Agg")
-import matplotlib.pyplot as plt
-import matplotlib.ticker as ticker
-from scipy.optimize import minimize
-from scipy.stats import weibull_min
 
-plt.rcParams["font.family"] = "Arial"
-plt.rcParams["axes.axisbelow"] = True  # grid behind artists
+RC = {"font.family": "Arial",
+      "axes.axisbelow": True}  # grid behind artists
+plt = ticker = minimize = weibull_min = None
+
+
+def _setup():
+    """Import matplotlib (Agg) and scipy on first render and apply RC; argument parsing stays cheap."""
+    global plt, ticker, minimize, weibull_min
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    import matplotlib.ticker as ticker
+    from scipy.optimize import minimize
+    from scipy.stats import weibull_min
+    plt.rcParams.update(RC)
 
 # Optional MSIP PNGObject fallback
 PNGObject = None
@@ -68,6 +75,8 @@ def _pick_tto_series(df: pd.DataFrame, col: str | None):
 # -------------------- Stats helpers --------------------
 def weibull_mle_pos(data: np.ndarray):
     """MLE fit for Weibull (k, lambda) with positive data; returns (k, lambda)."""
+    if minimize is None:  # called outside plot_figure5_core
+        _setup()
     x = np.asarray(data, dtype=float)
     x = x[np.isfinite(x) & (x > 0)]
     if x.size == 0:
@@ -112,6 +121,7 @@ def plot_figure5_core(df: pd.DataFrame, out_png: str, out_tif: str | None,
                       column: str | None, ymax: float, bin_width: float,
                       hist_max: float | None, B: int, seed: int,
                       pdf_xmax: float | None):
+    _setup()
     # Colors (Okabe–Ito subset)
     green = "#009E73"
     blue  = "#0072B2"
@@ -11,15 +11,21 @@ The rendering (fonts/colors/line widths/legend/scale) replicates the original.
 import os, sys, tempfile
 import numpy as np
 import pandas as pd
-import matplotlib
-import matplotlib.pyplot as plt
-import matplotlib.font_manager as fm
-import matplotlib.colors as mcolors
 
 # Font setup (Arial main; DejaVu Sans for symbols such as ✓)
-matplotlib.use('Agg')
-plt.rcParams['font.family'] = 'Arial'
-CHECK_FONT = fm.FontProperties(family='DejaVu Sans')
+RC = {'font.family': 'Arial'}
+plt = mcolors = CHECK_FONT = None
+
+def _setup():
+    """Import matplotlib on first render (Agg) and apply RC; argument parsing stays cheap."""
+    global plt, mcolors, CHECK_FONT
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    import matplotlib.font_manager as fm
+    import matplotlib.colors as mcolors
+    plt.rcParams.update(RC)
+    CHECK_FONT = fm.FontProperties(family='DejaVu Sans')
 
 # Optional MSIP PNGObject
 PNGObject = None
@@ -86,6 +92,7 @@ def _format_p(p):
     return f"{p:.2f}"
 
 def forest_plot_core(df: pd.DataFrame, out_png: str, out_tif: str):
+    _setup()
     # Normalize
     df = _normalize_columns(df)
 
@@ -12,14 +12,20 @@ reference line at ROR=1 per section, signal tiles (ROR/PRR/IC), and IC opacity l
 import os, tempfile
 import numpy as np
 import pandas as pd
-import matplotlib
-import matplotlib.pyplot as plt
-import matplotlib.font_manager as fm
-import matplotlib.colors as mcolors
 
-matplotlib.use('Agg')
-plt.rcParams['font.family'] = 'Arial'                 # main font
-CHECK_FONT = fm.FontProperties(family='DejaVu Sans')  # for glyphs like ✓
+RC = {'font.family': 'Arial'}                         # main font
+plt = mcolors = CHECK_FONT = None
+
+def _setup():
+    """Import matplotlib on first render (Agg) and apply RC; argument parsing stays cheap."""
+    global plt, mcolors, CHECK_FONT
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    import matplotlib.font_manager as fm
+    import matplotlib.colors as mcolors
+    plt.rcParams.update(RC)
+    CHECK_FONT = fm.FontProperties(family='DejaVu Sans')  # for glyphs like ✓
 
 # Optional MSIP PNGObject
 PNGObject = None
@@ -93,6 +99,7 @@ def _format_p(p):
 # Plot core
 # ------------------------
 def forest_plot_multidrug_core(df: pd.DataFrame, out_png: str, out_tif: str):
+    _setup()
     df = _normalize_columns(df)
 
     # Signals
@@ -1,12 +1,19 @@
 
 #!/usr/bin/env python3
-import numpy as np, pandas as pd, matplotlib.pyplot as plt
-from matplotlib.ticker import MaxNLocator
+import numpy as np, pandas as pd
 from _common_utils import OKABE_ITO, load_table_like
 
-plt.rcParams["font.family"] = "sans-serif"
-plt.rcParams['font.sans-serif'] = ['DejaVu Sans','Arial','Segoe UI','Helvetica']
-plt.rcParams["font.size"]   = 12
+RC = {"font.family": "sans-serif",
+      "font.sans-serif": ['DejaVu Sans','Arial','Segoe UI','Helvetica'],
+      "font.size": 12}
+plt = MaxNLocator = None
+
+def _setup():
+    """Import matplotlib on first render and apply RC; argument parsing stays cheap."""
+    global plt, MaxNLocator
+    import matplotlib.pyplot as plt
+    from matplotlib.ticker import MaxNLocator
+    plt.rcParams.update(RC)
 
 MM_TO_INCH = 1.0 / 25.4
 FIG_W = 180 * MM_TO_INCH
@@ -14,6 +21,7 @@ FIG_H = 120 * MM_TO_INCH
 X_RIGHT = 730
 
 def km_raw(df: pd.DataFrame, out_png: str, drugs=("MIRABEGRON","SOLIFENACIN")):
+    _setup()
     def _col(cands, fallback_idx):
         cols = list(df.columns)
         for c in cols:
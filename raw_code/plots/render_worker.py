@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Render worker — batch rendering of the public figures in one long-lived process
+- The plotting stack (pandas, matplotlib/Agg, scipy) is imported once per process
+  (`warm_up`, timed and reported as [STARTUP]); every job after that only pays for drawing.
+- A job is a dict: {"kind": ..., "table": CSV, <keyword arguments of the core function>}
+    forest            -> forest_plot.forest_plot_core(out_png, out_tif)
+    forest_multidrug  -> forest_plot_multidrug.forest_plot_multidrug_core(out_png, out_tif)
+    volcano           -> volcano_plot.volcano_plot_core(out_png, out_tif=None, title_drug=None)
+    figure5           -> figure5_tto_distribution.plot_figure5_core(out_png, ymax=2750, B=10000, ...)
+    km_raw            -> kaplan_meier_raw.km_raw(out_png, drugs=[A, B])
+- Each job runs with the rc file defaults plus the script's own RC, so font settings of one
+  figure never leak into the next (same output as a fresh process per script).
+
+Usage (CLI):
+  python raw_code/plots/render_worker.py --jobs jobs.json [--workers 2]
+  python raw_code/plots/render_worker.py --serve < jobs.jsonl      (one JSON job per line -> one JSON result per line)
+  python raw_code/plots/render_worker.py --startup                 (cold start per script vs. warm worker)
+"""
+import argparse, contextlib, importlib, json, os, subprocess, sys, time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+HERE = Path(__file__).resolve().parent
+if str(HERE) not in sys.path:
+    sys.path.insert(0, str(HERE))
+
+# kind -> (module, core function, default keyword arguments, table loader)
+RENDERERS = {
+    "forest":           ("forest_plot", "forest_plot_core", {}, "csv"),
+    "forest_multidrug": ("forest_plot_multidrug", "forest_plot_multidrug_core", {}, "csv"),
+    "volcano":          ("volcano_plot", "volcano_plot_core", {"out_tif": None, "title_drug": None}, "csv"),
+    "figure5":          ("figure5_tto_distribution", "plot_figure5_core",
+                         {"out_tif": None, "column": None, "ymax": 2750.0, "bin_width": 5.0, "hist_max": None,
+                          "B": 10000, "seed": 12345, "pdf_xmax": 0.01}, "csv"),
+    "km_raw":           ("kaplan_meier_raw", "km_raw", {}, "table_like"),
+}
+STACK = ("pandas", "matplotlib.pyplot", "scipy.stats", "scipy.optimize")
+
+STARTUP = {}  # per-process import timings (seconds), filled by warm_up()
+
+
+@contextlib.contextmanager
+def _rc_scope():
+    """Fresh rcParams (rc file defaults) for one job; restored afterwards."""
+    import matplotlib
+    with matplotlib.rc_context():
+        matplotlib.rc_file_defaults()
+        yield
+
+
+def warm_up(report=True):
+    """Import the plotting stack and every plot module once; returns {name: seconds}."""
+    if STARTUP:
+        return STARTUP
+    t0 = time.perf_counter()
+    import matplotlib
+    matplotlib.use("Agg")
+    for name in STACK:
+        t = time.perf_counter()
+        importlib.import_module(name)
+        STARTUP[name] = time.perf_counter() - t
+    t = time.perf_counter()
+    for module, _, _, _ in RENDERERS.values():
+        with _rc_scope():
+            importlib.import_module(module)._setup()
+    STARTUP["plots"] = time.perf_counter() - t
+    STARTUP["total"] = time.perf_counter() - t0
+    if report:
+        parts = ", ".join(f"{k} {v:.2f}s" for k, v in STARTUP.items() if k != "total")
+        print(f"[STARTUP] pid {os.getpid()}: {STARTUP['total']:.2f}s ({parts})", file=sys.stderr)
+    return STARTUP
+
+
+def render(job):
+    """Render one job in this process; returns {"kind", "out", "seconds"}."""
+    if job.get("kind") not in RENDERERS:
+        raise KeyError(f"Unknown render kind: {job.get('kind')!r} (expected one of {sorted(RENDERERS)})")
+    module, func, defaults, loader = RENDERERS[job["kind"]]
+    warm_up()
+    mod = importlib.import_module(module)
+    kwargs = {**defaults, **{k: v for k, v in job.items() if k not in ("kind", "table")}}
+    if "drugs" in kwargs:
+        kwargs["drugs"] = tuple(str(d).upper() for d in kwargs["drugs"])
+    t0 = time.perf_counter()
+    if loader == "table_like":
+        df = mod.load_table_like(job["table"])
+    else:
+        import pandas as pd
+        df = pd.read_csv(job["table"])
+    try:
+        with _rc_scope():
+            getattr(mod, func)(df, **kwargs)
+    finally:
+        mod.plt.close("all")
+    return {"kind": job["kind"], "out": kwargs.get("out_png"), "seconds": round(time.perf_counter() - t0, 3)}
+
+
+def _render_safe(job):
+    try:
+        return {**render(job), "ok": True}
+    except Exception as e:
+        return {"kind": job.get("kind"), "out": job.get("out_png"), "ok": False, "error": f"{type(e).__name__}: {e}"}
+
+
+class RenderWorker:
+    """Pool of long-lived render processes (workers=0: render in this process)."""
+
+    def __init__(self, workers=1):
+        self.pool = ProcessPoolExecutor(max_workers=workers, initializer=warm_up) if workers > 0 else None
+
+    def submit(self, job):
+        if self.pool is None:
+            raise RuntimeError("submit() needs workers > 0; use render_many() in-process")
+        return self.pool.submit(_render_safe, job)
+
+    def render_many(self, jobs):
+        """Results in job order ({"kind", "out", "seconds", "ok"[, "error"]})."""
+        if self.pool is None:
+            return [_render_safe(j) for j in jobs]
+        return list(self.pool.map(_render_safe, jobs))
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def serve(stdin=sys.stdin, stdout=sys.stdout):
+    """One JSON job per input line -> one JSON result per output line; plot chatter goes to stderr."""
+    warm_up()
+    for line in stdin:
+        if not line.strip():
+            continue
+        with contextlib.redirect_stdout(sys.stderr):
+            result = _render_safe(json.loads(line))
+        stdout.write(json.dumps(result) + "\n")
+        stdout.flush()
+
+
+def startup_report(py=sys.executable):
+    """Cold start of each plot script (fresh interpreter: imports + _setup) vs. the warm worker."""
+    def timed(code):
+        t = time.perf_counter()
+        out = subprocess.run([py, "-c", code], cwd=HERE, capture_output=True, text=True, check=True).stdout
+        return time.perf_counter() - t, out.strip()
+
+    bare, _ = timed("pass")
+    print(f"[STARTUP] python (bare): {bare:.2f}s")
+    cold = 0.0
+    for kind, (module, _, _, _) in RENDERERS.items():
+        wall, inner = timed(f"import time; t = time.perf_counter(); import {module}; {module}._setup(); "
+                            f"print(time.perf_counter() - t)")
+        cold += wall
+        print(f"[STARTUP] {kind:<16} process {wall:.2f}s (imports + setup {float(inner):.2f}s)")
+    warm = warm_up(report=False)["total"]
+    print(f"[STARTUP] {len(RENDERERS)} scripts cold: {cold:.2f}s; one warm worker: {bare + warm:.2f}s once")
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--jobs", help="JSON list of render jobs")
+    ap.add_argument("--workers", type=int, default=1, help="Render processes (0: in this process)")
+    ap.add_argument("--serve", action="store_true", help="Read JSON jobs from stdin, one per line")
+    ap.add_argument("--startup", action="store_true", help="Report cold-start cost per plot script")
+    args = ap.parse_args()
+
+    if args.startup:
+        startup_report()
+    elif args.serve:
+        serve()
+    elif args.jobs:
+        jobs = json.loads(Path(args.jobs).read_text(encoding="utf-8"))
+        t0 = time.perf_counter()
+        with RenderWorker(args.workers) as worker:
+            results = worker.render_many(jobs)
+        for r in results:
+            if r["ok"]:
+                print(f"[WRITE] {r['out']} ({r['seconds']:.2f}s)")
+            else:
+                print(f"[FAIL] {r['kind']} {r['out']}: {r['error']}")
+        print(f"[DONE] {len(jobs)} jobs in {time.perf_counter() - t0:.2f}s")
+        sys.exit(1 if not all(r["ok"] for r in results) else 0)
+    else:
+        ap.error("one of --jobs, --serve, --startup is required")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,16 @@
 
 #!/usr/bin/env python3
-import matplotlib.pyplot as plt, matplotlib.lines as mlines
 from _common_utils import OKABE_ITO
 
-plt.rcParams["font.family"] = "sans-serif"
-plt.rcParams['font.sans-serif'] = ['DejaVu Sans','Arial','Segoe UI','Helvetica']
+RC = {"font.family": "sans-serif",
+      "font.sans-serif": ['DejaVu Sans','Arial','Segoe UI','Helvetica']}
+plt = mlines = None
+
+def _setup():
+    """Import matplotlib on first render and apply RC; argument parsing stays cheap."""
+    global plt, mlines
+    import matplotlib.pyplot as plt, matplotlib.lines as mlines
+    plt.rcParams.update(RC)
 
 def map_n11_to_size(n: float) -> float:
     if n < 10:   return 40
@@ -13,6 +19,7 @@ def map_n11_to_size(n: float) -> float:
     return 200
 
 def legend_only(out_png: str):
+    _setup()
     db_color_map = {"JADER": OKABE_ITO["Orange"], "FAERS": OKABE_ITO["SkyBlue"]}
     size_labels = ["n < 10","10 ≤ n < 100","100 ≤ n < 200","n ≥ 200"]
     size_vals = [40, 90, 140, 200]
@@ -10,13 +10,20 @@ Volcano plot (Fig.4) — original look, robust p-value parsing
 import os, sys, tempfile, re
 import numpy as np
 import pandas as pd
-import matplotlib
-matplotlib.use("Agg")
-import matplotlib.pyplot as plt
-import matplotlib.patheffects as path_effects
-import matplotlib.lines as mlines
 
-plt.rcParams["font.family"] = "Arial"  # match the manuscript
+RC = {"font.family": "Arial"}  # match the manuscript
+plt = path_effects = mlines = None
+
+
+def _setup():
+    """Import matplotlib on first render (Agg) and apply RC; argument parsing stays cheap."""
+    global plt, path_effects, mlines
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    import matplotlib.patheffects as path_effects
+    import matplotlib.lines as mlines
+    plt.rcParams.update(RC)
 
 # Optional MSIP PNGObject fallback
 PNGObject = None
@@ -86,6 +93,7 @@ def _map_n11_to_size(n):
 
 
 def volcano_plot_core(df: pd.DataFrame, out_png: str, out_tif: str | None, title_drug: str | None):
+    _setup()
     # Normalize & validate
     df = _normalize_columns(df)
     required = ["DB", "Subgroup", "n11", "ROR", "p-value"]
@@ -108,9 +116,12 @@ def volcano_plot_core(df: pd.DataFrame, out_png: str, out_tif: str | None, title
     df = df.dropna(subset=["ROR", "p-value", "n11"])
     df = df[df["n11"] >= 3]
 
-    # Transforms
+    # Transforms (prefer log10_p from the batched Fisher engine: no underflow to the floor)
     df["lnROR"] = np.log(df["ROR"])
     df["-log10(p-value)"] = -np.log10(df["p-value"])
+    if "log10_p" in df.columns:
+        lp = pd.to_numeric(df["log10_p"], errors="coerce")
+        df["-log10(p-value)"] = (-lp).where(np.isfinite(lp), df["-log10(p-value)"])
 
     # Colors (Okabe–Ito palette subset)
     okabe_ito = {"Orange": "#E69F00", "Sky Blue": "#56B4E9"}